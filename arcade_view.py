@@ -0,0 +1,318 @@
+import time
+from pathlib import Path
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QPersistentModelIndex, QPoint, QRect, QSize, QEvent
+from PySide6.QtCore import QTimer, Signal
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import QListView, QStyledItemDelegate, QStyle, QAbstractItemView
+from image_loader import ImageLoader
+
+# #######################################
+# Virtualized arcade grid.
+#
+# Instead of one QWidget per game, the arcade is a QListView in icon mode over GameListModel.
+# GameTileDelegate paints each tile (wheel image, title, favorite star) only when it is on
+# screen, so opening the arcade costs the same with 50 tables or 5,000. Wheel images come from
+# ImageLoader: straight out of the mapped thumbnail atlas when the scanner has packed them there,
+# otherwise decoded in the background, with the default image shown until theirs is ready.
+
+TILE_IMAGE_SIZE = 200
+TILE_PADDING = 8
+TITLE_HEIGHT = 48
+STAR_HEIGHT = 32
+TILE_WIDTH = TILE_IMAGE_SIZE + 2 * TILE_PADDING + 24
+TILE_HEIGHT = TILE_IMAGE_SIZE + TITLE_HEIGHT + STAR_HEIGHT + 4 * TILE_PADDING
+
+# More changed rows than this and GameListModel.updateGames() resets the model instead
+MAX_ROW_CHANGES = 200
+
+# Wheel images are prefetched for the tiles the grid will reach in this many seconds at its
+# current scroll speed, at least one row and at most PREFETCH_MAX_SCREENS screens ahead
+PREFETCH_LOOKAHEAD_SECONDS = 0.75
+PREFETCH_MAX_SCREENS = 3
+PREFETCH_MAX_TILES = 60
+# How often upcoming tiles are worked out while scrolling
+PREFETCH_INTERVAL_MS = 50
+# Weight of the newest scroll step in the smoothed scroll speed
+SCROLL_SMOOTHING = 0.3
+
+# Role that returns the game's row dictionary from GameListModel.data()
+GameRole = Qt.UserRole + 1
+
+
+def display_title(game_data):
+    """
+    Title shown under a tile. Falls back to the file name without extension when display_name
+    is empty or vpxtool's "[not set]".
+    """
+    display_name = game_data.get('display_name')
+    if not display_name or display_name == "[not set]":
+        display_name = Path(game_data.get('vpx_file_name', '')).stem
+    return display_name
+
+
+def wheel_image_path(game_data, config_settings):
+    """
+    Where a game's wheel image lives. Games without one use defaultimg.png from the wheel image folder.
+    """
+    image_file_name = game_data.get('image_file') or 'defaultimg.png'
+    return Path(config_settings.get('wheelimage_file_path', '')).expanduser() / image_file_name
+
+
+class GameListModel(QAbstractListModel):
+    def __init__(self, games_data, parent=None):
+        super().__init__(parent)
+        self.games_data = games_data
+
+    def rowCount(self, parent=QModelIndex()):
+        # flat list: only the invisible root has children
+        return 0 if parent.isValid() else len(self.games_data)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.games_data):
+            return None
+        game_data = self.games_data[index.row()]
+        if role == Qt.DisplayRole:
+            return display_title(game_data)
+        if role == GameRole:
+            return game_data
+        return None
+
+    def game(self, row):
+        return self.games_data[row]
+
+    def setGames(self, games_data):
+        self.beginResetModel()
+        self.games_data = games_data
+        self.endResetModel()
+
+    def refreshRow(self, row):
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def updateGames(self, games_data, changed_keys):
+        """
+        Moves the model to games_data by removing and re-inserting only the rows whose vpx_file_name
+        is in changed_keys, so the rest of the grid keeps its scroll position and selection.
+        Falls back to a reset for large changes or when the other rows aren't in the same order.
+        """
+        unchanged_keys = [game['vpx_file_name'] for game in games_data if game['vpx_file_name'] not in changed_keys]
+        if (len(changed_keys) > MAX_ROW_CHANGES
+                or unchanged_keys != [game['vpx_file_name'] for game in self.games_data
+                                      if game['vpx_file_name'] not in changed_keys]):
+            self.setGames(list(games_data))
+            return
+        # remove from the bottom up so the row numbers still to come stay valid
+        for row in reversed(range(len(self.games_data))):
+            if self.games_data[row]['vpx_file_name'] in changed_keys:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.games_data[row]
+                self.endRemoveRows()
+        # what's left is games_data without the changed rows, so inserting those in order rebuilds it
+        for row, game in enumerate(games_data):
+            if game['vpx_file_name'] in changed_keys:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self.games_data.insert(row, game)
+                self.endInsertRows()
+
+
+class GameTileDelegate(QStyledItemDelegate):
+    """
+    Paints a game tile and turns clicks into signals: a click on the star toggles the favorite,
+    a click anywhere else launches the table.
+    """
+
+    favoriteClicked = Signal(QModelIndex)
+    launchClicked = Signal(QModelIndex)
+
+    def __init__(self, config_settings, parent=None):
+        super().__init__(parent)
+        self.config_settings = config_settings
+        self.title_font = QFont("Arial", 14)
+        self.star_font = QFont("Arial", 20)
+        self.image_loader = ImageLoader(config_settings, parent=self)
+
+    def sizeHint(self, option, index):
+        return QSize(TILE_WIDTH, TILE_HEIGHT)
+
+    def clearCache(self):
+        self.image_loader.clear()
+
+    def pixmapFor(self, game_data):
+        # never blocks: returns the placeholder and queues a decode if the image isn't in memory yet
+        return self.image_loader.pixmap(str(wheel_image_path(game_data, self.config_settings)))
+
+    @staticmethod
+    def imageRect(tile_rect):
+        return QRect(tile_rect.x() + (tile_rect.width() - TILE_IMAGE_SIZE) // 2, tile_rect.y() + TILE_PADDING,
+                     TILE_IMAGE_SIZE, TILE_IMAGE_SIZE)
+
+    @staticmethod
+    def titleRect(tile_rect):
+        return QRect(tile_rect.x() + TILE_PADDING, tile_rect.y() + TILE_IMAGE_SIZE + 2 * TILE_PADDING,
+                     tile_rect.width() - 2 * TILE_PADDING, TITLE_HEIGHT)
+
+    @staticmethod
+    def starRect(tile_rect):
+        return QRect(tile_rect.x() + (tile_rect.width() - STAR_HEIGHT) // 2,
+                     tile_rect.y() + TILE_IMAGE_SIZE + TITLE_HEIGHT + 3 * TILE_PADDING,
+                     STAR_HEIGHT, STAR_HEIGHT)
+
+    def paint(self, painter, option, index):
+        game_data = index.data(GameRole)
+        if game_data is None:
+            return
+        painter.save()
+        tile_rect = option.rect
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(tile_rect, option.palette.highlight())
+
+        painter.drawPixmap(self.imageRect(tile_rect), self.pixmapFor(game_data))
+
+        painter.setPen(option.palette.text().color())
+        painter.setFont(self.title_font)
+        painter.drawText(self.titleRect(tile_rect), Qt.AlignHCenter | Qt.AlignTop | Qt.TextWordWrap,
+                         display_title(game_data))
+
+        painter.setFont(self.star_font)
+        painter.drawText(self.starRect(tile_rect), Qt.AlignCenter,
+                         '★' if game_data.get('favorite') == '1' else '☆')
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if self.starRect(option.rect).contains(event.position().toPoint()):
+                self.favoriteClicked.emit(index)
+            else:
+                self.launchClicked.emit(index)
+            return True
+        return super().editorEvent(event, model, option, index)
+
+
+class ArcadeGridView(QListView):
+    """
+    Grid of game tiles. Emits launchRequested with the game's row dictionary and favoriteToggled
+    with its row number in the model. tableFocused is emitted with the row dictionary of the tile
+    under the mouse, or the selected one when the mouse isn't over a tile, whenever that changes,
+    and with None when there is neither.
+
+    While scrolling, the wheel images of the tiles coming up in the direction of the scroll are
+    prefetched, further ahead the faster the grid moves.
+    """
+
+    launchRequested = Signal(object)
+    favoriteToggled = Signal(int)
+    tableFocused = Signal(object)
+
+    def __init__(self, model, config_settings, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setWrapping(True)
+        # every tile is the same size, so the view can lay out rows without asking about each item
+        self.setUniformItemSizes(True)
+        self.setGridSize(QSize(TILE_WIDTH, TILE_HEIGHT))
+        self.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.verticalScrollBar().setSingleStep(TILE_HEIGHT // 4)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        # scroll speed in pixels per second, positive when scrolling down
+        self.scroll_velocity = 0.0
+        self._last_scroll = (self.verticalScrollBar().value(), time.monotonic())
+        self.verticalScrollBar().valueChanged.connect(self.trackScroll)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_INTERVAL_MS)
+        self.prefetch_timer.timeout.connect(self.prefetchUpcoming)
+
+        # the hovered tile, for tableFocused. Persistent so it follows its row, or turns invalid,
+        # when the model is reset or filtered
+        self.setMouseTracking(True)
+        self.hovered_index = QPersistentModelIndex()
+        self.focused_game = None
+
+        self.tile_delegate = GameTileDelegate(config_settings, self)
+        self.setItemDelegate(self.tile_delegate)
+        # last, setModel() already calls currentChanged(), which reads the attributes above
+        self.setModel(model)
+
+        self.tile_delegate.launchClicked.connect(lambda index: self.launchRequested.emit(index.data(GameRole)))
+        self.tile_delegate.favoriteClicked.connect(lambda index: self.favoriteToggled.emit(index.row()))
+        # repaint when a wheel image finishes decoding; Qt merges the updates into one repaint
+        self.tile_delegate.image_loader.imageReady.connect(lambda image_path: self.viewport().update())
+        # decodes queued for tiles that scrolled out of view are dropped, visible tiles ask again as they repaint
+        self.verticalScrollBar().valueChanged.connect(lambda value: self.tile_delegate.image_loader.cancelPending())
+
+    def trackScroll(self, value):
+        last_value, last_time = self._last_scroll
+        now = time.monotonic()
+        if now > last_time:
+            velocity = (value - last_value) / (now - last_time)
+            # a scroll after a pause starts from the new speed rather than the old one
+            if now - last_time > 0.5:
+                self.scroll_velocity = velocity
+            else:
+                self.scroll_velocity += SCROLL_SMOOTHING * (velocity - self.scroll_velocity)
+        self._last_scroll = (value, now)
+        # at most one lookahead per interval however many scroll steps come in
+        if not self.prefetch_timer.isActive():
+            self.prefetch_timer.start()
+
+    def upcomingIndexes(self):
+        """
+        :return: Indexes of the tiles just past the viewport in the direction of the scroll, nearest first.
+        """
+        viewport = self.viewport().rect()
+        lookahead = min(max(abs(self.scroll_velocity) * PREFETCH_LOOKAHEAD_SECONDS, TILE_HEIGHT),
+                        PREFETCH_MAX_SCREENS * viewport.height())
+        indexes = []
+        seen = set()
+        # tile centers one row at a time, starting with the row just off screen
+        offset = TILE_HEIGHT // 2
+        while offset < lookahead + TILE_HEIGHT // 2 and len(indexes) < PREFETCH_MAX_TILES:
+            y = viewport.bottom() + offset if self.scroll_velocity >= 0 else viewport.top() - offset
+            for x in range(TILE_WIDTH // 2, viewport.width(), TILE_WIDTH):
+                index = self.indexAt(QPoint(x, y))
+                if index.isValid() and index.row() not in seen:
+                    seen.add(index.row())
+                    indexes.append(index)
+            offset += TILE_HEIGHT
+        return indexes[:PREFETCH_MAX_TILES]
+
+    def prefetchUpcoming(self):
+        image_loader = self.tile_delegate.image_loader
+        for rank, index in enumerate(self.upcomingIndexes()):
+            game_data = index.data(GameRole)
+            if game_data is not None:
+                image_loader.prefetch(str(wheel_image_path(game_data, self.tile_delegate.config_settings)), rank)
+
+    def updateFocusedTable(self):
+        index = self.hovered_index if self.hovered_index.isValid() else self.currentIndex()
+        game_data = index.data(GameRole) if index.isValid() else None
+        if game_data is not self.focused_game:
+            self.focused_game = game_data
+            self.tableFocused.emit(game_data)
+
+    def mouseMoveEvent(self, event):
+        index = self.indexAt(event.position().toPoint())
+        if self.hovered_index != index:
+            self.hovered_index = QPersistentModelIndex(index)
+            self.updateFocusedTable()
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.hovered_index = QPersistentModelIndex()
+        self.updateFocusedTable()
+        super().leaveEvent(event)
+
+    def currentChanged(self, current, previous):
+        super().currentChanged(current, previous)
+        self.updateFocusedTable()
+
+    def keyPressEvent(self, event):
+        # Enter launches the selected table, for cabinets driven by a keyboard encoder
+        if event.key() in (Qt.Key_Return, Qt.Key_Enter) and self.currentIndex().isValid():
+            self.launchRequested.emit(self.currentIndex().data(GameRole))
+            return
+        super().keyPressEvent(event)
@@ -0,0 +1,295 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from pathlib import Path
+
+# the benchmarks import the Flipper Fiend modules from the folder above this one
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import scantables  # noqa: E402
+from library import LibraryStore  # noqa: E402
+from wheel_index import WheelIndex  # noqa: E402
+
+# #######################################
+# Benchmarks for scanning, wheel matching, library loading and the arcade window.
+#
+# For each library size a synthetic VPXTables folder is generated in a temp directory: empty .vpx
+# files named like the GameFileName column of puplookup.csv, wheel images named like GameName,
+# and fake_vpxtool.py standing in for vpxtool. Everything is timed against that folder, so the
+# numbers don't depend on which tables are on the machine.
+#
+# Results can be saved as a baseline and later runs compared against it:
+#     python benchmarks/run_benchmarks.py --save-baseline
+#     python benchmarks/run_benchmarks.py
+# exits with status 1 when a benchmark got slower than the baseline by more than --threshold.
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+FAKE_VPXTOOL = Path(__file__).resolve().parent / 'fake_vpxtool.py'
+
+# Smallest PNG there is (1x1, transparent). Wheel matching only looks at the file names.
+TINY_PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                         '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+
+# Differences smaller than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.005
+
+
+def load_puplookup_names(puplookup_path):
+    """
+    :return: Tuple of (table file names, game names) from puplookup.csv, without duplicates.
+    """
+    file_names = []
+    game_names = []
+    with open(puplookup_path, mode='r', newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            if row.get('GameFileName'):
+                file_names.append(row['GameFileName'].strip())
+            if row.get('GameName'):
+                game_names.append(row['GameName'].strip())
+    return list(dict.fromkeys(file_names)), list(dict.fromkeys(game_names))
+
+
+def synthetic_names(names, count, rng):
+    """
+    Picks count distinct names, reusing puplookup.csv names with a release suffix once they run out.
+    """
+    picked = rng.sample(names, min(count, len(names)))
+    copy = 2
+    while len(picked) < count:
+        picked += [f"{name} r{copy}" for name in names[:count - len(picked)]]
+        copy += 1
+    return picked
+
+
+def generate_library(root, table_count, wheel_count, puplookup_path, seed=0):
+    """
+    Creates a synthetic cabinet under root.
+
+    :return: Tuple of (table folder, wheel image folder, fake vpxtool command).
+    """
+    rng = random.Random(seed)
+    file_names, game_names = load_puplookup_names(puplookup_path)
+    table_dir = Path(root) / 'VPXTables'
+    wheel_dir = Path(root) / 'wheels'
+    table_dir.mkdir(parents=True)
+    wheel_dir.mkdir(parents=True)
+
+    for name in synthetic_names(file_names, table_count, rng):
+        # / would make a sub folder; keep the generated tables in one folder
+        # distinct contents, so the metadata cache tells the tables apart like it would real ones
+        (table_dir / (name.replace('/', '-') + '.vpx')).write_bytes(name.encode('utf-8'))
+    for name in synthetic_names(game_names, wheel_count, rng):
+        (wheel_dir / (name.replace('/', '-') + '.png')).write_bytes(TINY_PNG)
+
+    # scantables runs vpxtool directly, so it needs an executable rather than a .py file
+    vpxtool = Path(root) / 'vpxtool'
+    vpxtool.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_VPXTOOL}" "$@"\n')
+    vpxtool.chmod(vpxtool.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return table_dir, wheel_dir, vpxtool
+
+
+def timed(function, repeat=1, setup=None):
+    """
+    Runs function repeat times and returns the fastest run in seconds. setup runs before each
+    run, outside the timing, and its result is passed to function.
+    """
+    best = None
+    for _ in range(repeat):
+        argument = setup() if setup else None
+        # the scanner prints a line or two per table, which would drown the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            began = time.perf_counter()
+            function(argument) if setup else function()
+            elapsed = time.perf_counter() - began
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def scan_args(table_dir, wheel_dir, vpxtool, workers, full):
+    # the same arguments scantables.parse_arguments() would produce for a full-folder scan
+    return Namespace(vpx_table_path=str(table_dir), wheelimage_file_path=str(wheel_dir), vpxtool_app=str(vpxtool),
+                     vpx_command='', vpx_table=None, workers=workers, checkpoint=50, reader='vpxtool',
+                     backend='csv', puplookup=str(REPO_DIR / 'puplookup.csv'), thumbnail_cache='thumbnails',
+                     no_thumbnails=True, full=full)
+
+
+def arcade_window_benchmark():
+    """
+    :return: A function that times building the arcade window for a library, or None without PySide6.
+    """
+    try:
+        # no display needed to build the window
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PySide6.QtWidgets import QApplication
+        import main as launcher_main
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication([])
+
+    def build_window(table_dir, wheel_dir):
+        library = LibraryStore('ffiend.csv').load()
+        # no library watcher or prefetcher threads, they would outlive the temp folder they look at
+        config_settings = {'vpx_table_path': str(table_dir), 'wheelimage_file_path': str(wheel_dir), 'vpx_app': '',
+                           'watch_library': 'off', 'prefetch_budget_mb': '0'}
+        window = launcher_main.ArcadeWindow(config_settings, library.arcade_rows(), {}, library)
+        try:
+            app.processEvents()
+        finally:
+            window.stopLibraryWatcher()
+            window.stopPrefetcher()
+            window.deleteLater()
+
+    return build_window
+
+
+def run_size(table_count, args, build_window):
+    """
+    Runs every benchmark against a synthetic library of table_count tables.
+
+    :return: Dictionary of benchmark name to seconds.
+    """
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix=f'ffbench-{table_count}-')
+    previous_dir = os.getcwd()
+    try:
+        wheel_count = args.wheels if args.wheels is not None else table_count
+        table_dir, wheel_dir, vpxtool = generate_library(work_dir, table_count, wheel_count,
+                                                         REPO_DIR / 'puplookup.csv', args.seed)
+        # scantables keeps ffiend.csv and the scan manifest in the current folder
+        os.chdir(work_dir)
+        vpx_files = sorted(os.listdir(table_dir))
+
+        results['parse_filename'] = timed(lambda: [scantables.parse_filename(name) for name in vpx_files],
+                                          args.repeat)
+        results['WheelIndex.from_directory'] = timed(lambda: WheelIndex.from_directory(str(wheel_dir)), args.repeat)
+        # a fresh index each run, so matches remembered by the previous run don't count
+        results['find_closest_match'] = timed(
+            lambda index: [scantables.find_closest_match(name, index) for name in vpx_files], args.repeat,
+            setup=lambda: WheelIndex.from_directory(str(wheel_dir)))
+
+        if not args.skip_scan:
+            results['scan_all_tables (full)'] = timed(
+                lambda: scantables.scan_all_tables(scan_args(table_dir, wheel_dir, vpxtool, args.workers, True)))
+            results['scan_all_tables (unchanged)'] = timed(
+                lambda: scantables.scan_all_tables(scan_args(table_dir, wheel_dir, vpxtool, args.workers, False)),
+                args.repeat)
+        else:
+            # the other benchmarks still need a library to load
+            with contextlib.redirect_stdout(io.StringIO()):
+                store = LibraryStore('ffiend.csv').load()
+                for name in vpx_files:
+                    store.apply_scan_result({'path': name, 'tablename': name[:-4], 'releasedate': '',
+                                             'year': '', 'manufacturer': ''}, None)
+                store.flush()
+
+        results['library load'] = timed(lambda: LibraryStore('ffiend.csv').load().arcade_rows(), args.repeat)
+        # the first load writes the snapshot, the timed ones read it
+        LibraryStore('ffiend.csv', snapshot=True).load()
+        results['library load (snapshot)'] = timed(
+            lambda: LibraryStore('ffiend.csv', snapshot=True).load().arcade_rows(), args.repeat)
+
+        if build_window is not None:
+            results['arcade window'] = timed(lambda: build_window(table_dir, wheel_dir), args.repeat)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: One line per benchmark that got slower than the baseline by more than threshold.
+    """
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, seconds in benchmarks.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{size} tables, {name}: {before * 1000:.1f} ms -> {seconds * 1000:.1f} ms "
+                                   f"(+{(seconds / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_results(results, baseline):
+    for size, benchmarks in results.items():
+        print(f"\n{size} tables")
+        for name, seconds in benchmarks.items():
+            before = baseline.get(size, {}).get(name)
+            change = f"  ({(seconds / before - 1) * 100:+.0f}% vs baseline)" if before else ''
+            print(f"  {name:<32} {seconds * 1000:>10.1f} ms{change}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark Flipper Fiend against synthetic libraries.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma separated library sizes to benchmark (default: 100,1000,10000)')
+    parser.add_argument('--wheels', type=int, default=None,
+                        help='Number of wheel images to generate (default: one per table)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Scanner workers (default: number of cores)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per benchmark, the fastest is reported (default: 3). Full scans run once.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for picking names (default: 0)')
+    parser.add_argument('--skip-scan', action='store_true', help="Don't time scan_all_tables, it's the slow one")
+    parser.add_argument('--skip-window', action='store_true', help="Don't time building the arcade window")
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE),
+                        help='Baseline results to compare against (default: benchmarks/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown over the baseline that counts as a regression (default: 0.25 = 25%%)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    build_window = None if args.skip_window else arcade_window_benchmark()
+    if build_window is None and not args.skip_window:
+        print("PySide6 not found, skipping the arcade window benchmark.")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, mode='r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    for size in sizes:
+        print(f"Benchmarking {size} tables...")
+        # JSON keys are strings, so use strings here too
+        results[str(size)] = run_size(size, args, build_window)
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, mode='w', encoding='utf-8') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    if baseline:
+        print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import os
 import csv
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QLineEdit, QHBoxLayout
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, Signal
 import subprocess
 
 def read_config():
@@ -20,6 +20,9 @@ def write_config(config_items):
             writer.writerow([key, "", value, ""])  # Adjust as needed
 
 class Configurator(QWidget):
+    # emitted when the window closes, whether the settings were saved or not
+    closed = Signal()
+
     def __init__(self, config):
         super().__init__()
         self.config = config
@@ -65,15 +68,21 @@ class Configurator(QWidget):
             input_widget.setText(selection)
 
     def saveConfig(self):
-        config_items = {
+        # start from the existing settings so items without a field here, like library_backend, are kept
+        config_items = dict(self.config)
+        config_items.update({
             "vpx_table_path": self.layout.itemAt(0).layout().itemAt(1).widget().text(),
             "wheelimage_file_path": self.layout.itemAt(1).layout().itemAt(1).widget().text(),
             "vpx_app": self.layout.itemAt(2).layout().itemAt(1).widget().text(),
             "macos_command": self.layout.itemAt(2).layout().itemAt(1).widget().text() + "/Contents/MacOS/VPinballX_GL"
-        }
+        })
         write_config(config_items)
         self.close()
 
+    def closeEvent(self, event):
+        self.closed.emit()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication([])
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from metadata_cache import fingerprint
+from perf import span
+from table_discovery import discover_tables
+
+# #######################################
+# Finding copies of the same table under different names.
+#
+# Tables are 100-500 MB, so reading every one of them to compare would take minutes. Files can only
+# be identical if they are the same size, so tables are grouped by size first, and only tables that
+# share their size with another one are read at all. Those get the quick head and tail fingerprint
+# the metadata cache uses, and the ones that still match are hashed in full through mmap, several at
+# a time. hashlib lets go of the GIL while hashing, so the worker threads really do run in parallel.
+#
+# The duplicate sets are written to duplicates.csv; nothing is removed.
+
+DUPLICATES_FILE = 'duplicates.csv'
+DUPLICATES_FIELDS = ['group', 'vpx_file_name', 'size', 'content_hash']
+# How much of the mapped file is handed to the hash at a time
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(file_path):
+    """
+    :return: blake2b hex digest of the whole file, read through mmap.
+    """
+    digest = blake2b(digest_size=20)
+    with open(file_path, mode='rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # read ahead aggressively and drop pages behind, where the platform allows it
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(mapped), HASH_CHUNK_SIZE):
+                    digest.update(view[offset:offset + HASH_CHUNK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def _split_by(groups, key_function, executor):
+    """
+    Splits every group of paths by key_function, run across executor, and keeps the parts that
+    still have more than one path. Paths key_function can't read are reported and dropped.
+
+    :param groups: List of lists of (vpx_file_name, file_path) tuples.
+    :return: List of (key, list of (vpx_file_name, file_path)) tuples.
+    """
+    candidates = [table for group in groups for table in group]
+
+    def keyed(table):
+        try:
+            return key_function(table[1])
+        except (OSError, ValueError) as e:
+            print(f"Could not read {table[0]}: {e}")
+            return None
+
+    split = {}
+    for table, key in zip(candidates, executor.map(keyed, candidates)):
+        if key is not None:
+            split.setdefault(key, []).append(table)
+    return [(key, tables) for key, tables in split.items() if len(tables) > 1]
+
+
+def find_duplicates(tables, workers=None):
+    """
+    :param tables: Iterable of (vpx_file_name, file_path, size) tuples.
+    :param workers: Number of files hashed at a time (default: number of cores).
+    :return: List of (content_hash, size, list of vpx_file_names) tuples, one per set of identical
+             tables, biggest waste of space first.
+    """
+    by_size = {}
+    for vpx_file_name, file_path, size in tables:
+        # empty files are all "identical" and not worth reporting
+        if size > 0:
+            by_size.setdefault(size, []).append((vpx_file_name, file_path))
+    groups = [group for group in by_size.values() if len(group) > 1]
+    if not groups:
+        return []
+    sizes = {vpx_file_name: size for size, group in by_size.items() for vpx_file_name, _ in group}
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        # the head and tail tell most same-sized tables apart after reading 128 KB of each
+        with span('duplicates.quick_hash'):
+            groups = [tables for _, tables in _split_by(groups, fingerprint, executor)]
+        with span('duplicates.full_hash'):
+            duplicate_sets = _split_by(groups, hash_file, executor)
+
+    results = []
+    for content_hash, tables in duplicate_sets:
+        names = sorted(vpx_file_name for vpx_file_name, _ in tables)
+        results.append((content_hash, sizes[names[0]], names))
+    results.sort(key=lambda result: (-result[1] * (len(result[2]) - 1), result[2][0]))
+    return results
+
+
+def write_duplicates_report(duplicate_sets, report_path=DUPLICATES_FILE):
+    """
+    Writes one row per table in a duplicate set; tables in the same set share a group number.
+    """
+    try:
+        with open(report_path, mode='w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=DUPLICATES_FIELDS)
+            writer.writeheader()
+            for group, (content_hash, size, names) in enumerate(duplicate_sets, start=1):
+                for vpx_file_name in names:
+                    writer.writerow({'group': group, 'vpx_file_name': vpx_file_name, 'size': size,
+                                     'content_hash': content_hash})
+    except OSError as e:
+        print(f"Could not write {report_path}: {e}")
+
+
+def report_duplicates(duplicate_sets, report_path=DUPLICATES_FILE):
+    """
+    Writes the report and prints a summary of it.
+    """
+    write_duplicates_report(duplicate_sets, report_path)
+    if not duplicate_sets:
+        print("No duplicate tables found.")
+        return
+    wasted = sum(size * (len(names) - 1) for _, size, names in duplicate_sets)
+    print(f"Found {len(duplicate_sets)} sets of duplicate tables, {wasted / (1024 * 1024):.0f} MB in extra copies. "
+          f"See {report_path}.")
+    for _, _, names in duplicate_sets:
+        print(f"  {' = '.join(names)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find identical copies of tables under different names.')
+    parser.add_argument('vpx_table_path', help='Path to VPXTables directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of tables hashed in parallel (default: number of cores)')
+    parser.add_argument('--report', default=DUPLICATES_FILE, help=f'Where to write the report (default: {DUPLICATES_FILE})')
+    args = parser.parse_args()
+    tables = ((table.vpx_file_name, table.path, table.stat_result.st_size)
+              for table in discover_tables(args.vpx_table_path))
+    report_duplicates(find_duplicates(tables, args.workers), args.report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import csv
+import re
+import unicodedata
+from fuzzywuzzy import fuzz
+
+# Columns of puplookup.csv copied into the library, keyed by the table_info key they're stored under
+PUPLOOKUP_FIELDS = {
+    'vps_id': 'VPS-ID',
+    'theme': 'GameTheme',
+    'type': 'GameType',
+    'authors': 'Author',
+}
+
+# Name similarity (0-100) needed to accept a match that isn't exact
+MIN_NAME_SCORE = 88
+
+
+def normalize(text):
+    """
+    Folds a game name or manufacturer to a comparison key: accents stripped, lowercase,
+    punctuation removed, a leading "the" dropped and whitespace collapsed.
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    text = text.replace('&', ' and ')
+    text = re.sub(r'[^a-z0-9]+', ' ', text).strip()
+    if text.startswith('the '):
+        text = text[4:]
+    return text
+
+
+class PupLookup:
+    """
+    puplookup.csv loaded once and indexed for matching scanned tables.
+
+    Rows are grouped into blocks by (year, manufacturer), year and first name word. A table is only
+    compared against the rows of its own block, so matching stays cheap even with thousands of rows:
+    an exact name hit is a dict lookup, and fuzzy scoring only ever sees a handful of candidates.
+    """
+
+    def __init__(self):
+        self.by_name_year = {}
+        self.by_year_manufacturer = {}
+        self.by_year = {}
+        self.by_first_word = {}
+        self.row_count = 0
+
+    @classmethod
+    def load(cls, puplookup_path='puplookup.csv'):
+        """
+        :return: A PupLookup. If puplookup.csv can't be read it is empty and matches nothing.
+        """
+        lookup = cls()
+        try:
+            with open(puplookup_path, mode='r', newline='', encoding='utf-8') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    lookup.add(row)
+        except OSError as e:
+            print(f"Could not read {puplookup_path}, skipping VPS-ID lookup: {e}")
+        return lookup
+
+    def add(self, row):
+        # GameName looks like "Airborne (Capcom 1996)"; the name is the part before the parentheses
+        game_name = (row.get('GameName') or '').strip()
+        name_match = re.search(r'^(.*?)\s\(', game_name)
+        name_key = normalize(name_match.group(1) if name_match else game_name)
+        if not name_key:
+            return
+        year = (row.get('GameYear') or '').strip()
+        manufacturer_key = normalize(row.get('Manufact'))
+        candidate = (name_key, manufacturer_key, year, normalize(row.get('GameFileName')), row)
+
+        self.by_name_year.setdefault((name_key, year), []).append(candidate)
+        self.by_year_manufacturer.setdefault((year, manufacturer_key), []).append(candidate)
+        self.by_year.setdefault(year, []).append(candidate)
+        self.by_first_word.setdefault(name_key.split()[0], []).append(candidate)
+        self.row_count += 1
+
+    def match(self, vpx_file, name, manufacturer, year):
+        """
+        Finds the puplookup.csv row for a table.
+
+        :param vpx_file: The table's file name, used to choose between versions of the same game.
+        :param name: Name as extracted by scantables.parse_filename.
+        :param manufacturer: Manufacturer as extracted by scantables.parse_filename.
+        :param year: Year as extracted by scantables.parse_filename.
+        :return: The matching row as a dictionary, or None.
+        """
+        name_key = normalize(name)
+        if not name_key:
+            return None
+        year = str(year) if year else ''
+        manufacturer_key = normalize(manufacturer)
+        file_key = normalize(vpx_file.rsplit('.', 1)[0])
+
+        # exact name and year: only the version tie-break is left to do
+        candidates = self.by_name_year.get((name_key, year))
+        if candidates:
+            return self._best_version(candidates, manufacturer_key, file_key)
+
+        # otherwise score names within the table's block: same year and manufacturer first, then
+        # the whole year in case the manufacturer is spelled differently. Without a year, tables
+        # are blocked on the first word of their name.
+        if year:
+            blocks = [self.by_year_manufacturer.get((year, manufacturer_key), []), self.by_year.get(year, [])]
+        else:
+            blocks = [self.by_first_word.get(name_key.split()[0], [])]
+        for block in blocks:
+            best_score = 0
+            best = []
+            for candidate in block:
+                score = fuzz.ratio(name_key, candidate[0])
+                if score > best_score:
+                    best_score, best = score, [candidate]
+                elif score == best_score:
+                    best.append(candidate)
+            if best_score >= MIN_NAME_SCORE:
+                return self._best_version(best, manufacturer_key, file_key)
+        return None
+
+    @staticmethod
+    def _best_version(candidates, manufacturer_key, file_key):
+        # Prefer the manufacturer from the file name, then the GameFileName closest to the table's
+        # file name, which usually carries the author and version of that particular release
+        if len(candidates) == 1:
+            return candidates[0][4]
+        return max(candidates, key=lambda c: (c[1] == manufacturer_key, fuzz.ratio(file_key, c[3])))[4]
+
+    def enrich(self, table_info, vpx_file):
+        """
+        Adds vps_id, theme, type and authors to table_info when the table is found in puplookup.csv.
+
+        :return: True if a match was found.
+        """
+        row = self.match(vpx_file, table_info.get('name'), table_info.get('manufacturer'), table_info.get('year'))
+        if row is None:
+            return False
+        for key, column in PUPLOOKUP_FIELDS.items():
+            table_info[key] = (row.get(column) or '').strip()
+        return True
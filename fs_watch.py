@@ -0,0 +1,289 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# #######################################
+# Watching the tables and wheel image folders for changes.
+#
+# On Linux the kernel's inotify tells us about every file created, written, renamed or deleted,
+# through libc called with ctypes so there is nothing extra to install. Everywhere else, or when
+# inotify can't be set up, PollingWatcher lists the folders every couple of seconds and compares
+# sizes and mtimes.
+#
+# Either way the changes come in as a burst: copying one 300 MB table is hundreds of writes.
+# Debouncer collects changed paths until the folders have been quiet for a while, so a table is
+# only scanned once it has been copied completely.
+
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+DEFAULT_POLL_SECONDS = 2.0
+
+# inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+# IN_MODIFY keeps the debounce going for as long as a big file is being copied
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _watched_dirs(root):
+    """
+    Yields root and every folder under it, skipping hidden folders and symlinks like table_discovery does.
+    """
+    yield root
+    for dir_path, dir_names, _ in os.walk(root):
+        dir_names[:] = sorted(name for name in dir_names
+                              if not name.startswith('.') and not os.path.islink(os.path.join(dir_path, name)))
+        for name in dir_names:
+            yield os.path.join(dir_path, name)
+
+
+class InotifyWatcher:
+    """
+    Watches folders and everything under them with inotify. Folders created or moved in later are
+    watched as they appear.
+    """
+
+    def __init__(self, roots):
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed: {os.strerror(errno)}")
+        self.roots = [os.path.expanduser(root) for root in roots]
+        # watch descriptor -> folder it watches
+        self.dirs = {}
+        # IN_MOVED_FROM cookie -> folder moved away, until its IN_MOVED_TO says where it went
+        self._moved_from = {}
+        # set when the kernel dropped events and the caller should rescan everything
+        self.overflowed = False
+        try:
+            for root in self.roots:
+                self._watch_tree(root)
+        except BaseException:
+            self.close()
+            raise
+
+    def _watch(self, dir_path):
+        wd = self._add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"Could not watch {dir_path}: {os.strerror(errno)}")
+        self.dirs[wd] = dir_path
+
+    def _watch_tree(self, root):
+        """
+        :return: Every file under root, so a folder moved in with tables in it is reported in full.
+        """
+        files = []
+        for dir_path in _watched_dirs(root):
+            try:
+                self._watch(dir_path)
+            except OSError as e:
+                # the watch limit (fs.inotify.max_user_watches) or a folder removed in the meantime
+                if dir_path == root:
+                    raise
+                print(e)
+                continue
+            try:
+                with os.scandir(dir_path) as entries:
+                    files.extend(entry.path for entry in entries if entry.is_file(follow_symlinks=False))
+            except OSError:
+                pass
+        return files
+
+    def read_changes(self, timeout):
+        """
+        Waits up to timeout seconds for events.
+
+        :return: Set of paths that were created, written, moved or deleted. A deleted or moved away
+                 folder is reported as the folder's path.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, name_length = _EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_length].rstrip(b'\0')
+                offset += _EVENT_HEADER.size + name_length
+                self._handle_event(wd, mask, cookie, os.fsdecode(name), changed)
+        # a folder moved out of the watched folders never gets its IN_MOVED_TO
+        self._moved_from.clear()
+        return changed
+
+    def _in_tree(self, dir_path):
+        return any(dir_path == root or dir_path.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots)
+
+    def _under(self, dir_path):
+        # :return: Watch descriptors of dir_path and every watched folder under it
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        return [wd for wd, path in self.dirs.items() if path == dir_path or path.startswith(prefix)]
+
+    def _move_watched(self, old_path, new_path):
+        # a folder renamed inside the tree keeps its watches, they just have a new path
+        for wd in self._under(old_path):
+            self.dirs[wd] = new_path + self.dirs[wd][len(old_path):]
+
+    def _unwatch_tree(self, dir_path):
+        for wd in self._under(dir_path):
+            self._rm_watch(self.fd, wd)
+            del self.dirs[wd]
+
+    def _handle_event(self, wd, mask, cookie, name, changed):
+        if mask & IN_Q_OVERFLOW:
+            self.overflowed = True
+            return
+        dir_path = self.dirs.get(wd)
+        if dir_path is None:
+            return
+        if mask & IN_IGNORED:
+            # the folder was deleted or unmounted, its watch is gone
+            del self.dirs[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            changed.add(dir_path)
+            # a folder renamed inside the tree was given its new path by the IN_MOVED_TO before this;
+            # one moved out of the tree is no longer ours to watch, nor is anything under it
+            if mask & IN_MOVE_SELF and not (os.path.isdir(dir_path) and self._in_tree(dir_path)):
+                self._unwatch_tree(dir_path)
+            return
+        if not name or name.startswith('.'):
+            return
+        path = os.path.join(dir_path, name)
+        changed.add(path)
+        if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+            self._moved_from[cookie] = path
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            old_path = self._moved_from.pop(cookie, None) if mask & IN_MOVED_TO else None
+            if old_path is not None:
+                self._move_watched(old_path, path)
+            try:
+                changed.update(self._watch_tree(path))
+            except OSError as e:
+                print(e)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """
+    Lists the folders every interval seconds and reports files whose size or mtime changed, or that
+    appeared or disappeared since the last listing.
+    """
+
+    def __init__(self, roots, interval=DEFAULT_POLL_SECONDS):
+        self.roots = [os.path.expanduser(root) for root in roots]
+        self.interval = interval
+        self.overflowed = False
+        self.files = self._list()
+        self._next_poll = time.monotonic() + interval
+
+    def _list(self):
+        files = {}
+        for root in self.roots:
+            for dir_path in _watched_dirs(root):
+                try:
+                    with os.scandir(dir_path) as entries:
+                        for entry in entries:
+                            if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                                continue
+                            stat_result = entry.stat(follow_symlinks=False)
+                            files[entry.path] = (stat_result.st_size, stat_result.st_mtime_ns)
+                except OSError:
+                    continue
+        return files
+
+    def read_changes(self, timeout):
+        """
+        Waits up to timeout seconds for the next listing, like InotifyWatcher.read_changes().
+
+        :return: Set of paths that were added, changed or removed.
+        """
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        if wait > 0:
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+        files = self._list()
+        changed = {file_path for file_path, signature in files.items() if self.files.get(file_path) != signature}
+        changed.update(file_path for file_path in self.files if file_path not in files)
+        self.files = files
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(roots, mode='auto', poll_interval=DEFAULT_POLL_SECONDS):
+    """
+    :param roots: Folders to watch, with everything under them.
+    :param mode: 'inotify', 'poll' or 'auto' for inotify where it works and polling otherwise.
+    :return: An InotifyWatcher or a PollingWatcher.
+    """
+    if mode in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(roots)
+        except (OSError, AttributeError) as e:
+            # AttributeError: a libc without the inotify functions
+            if mode == 'inotify':
+                raise
+            print(f"inotify not available ({e}), checking for changes every {poll_interval:g} s instead")
+    return PollingWatcher(roots, poll_interval)
+
+
+class Debouncer:
+    """
+    Collects changed paths and hands them over once no new change has come in for quiet_seconds.
+    """
+
+    def __init__(self, quiet_seconds=DEFAULT_DEBOUNCE_SECONDS):
+        self.quiet_seconds = quiet_seconds
+        self.pending = set()
+        self._last_change = 0.0
+
+    def add(self, paths, now=None):
+        if paths:
+            self.pending.update(paths)
+            self._last_change = time.monotonic() if now is None else now
+
+    def take(self, now=None):
+        """
+        :return: The collected paths if the quiet period has passed, otherwise an empty set.
+        """
+        now = time.monotonic() if now is None else now
+        if not self.pending or now - self._last_change < self.quiet_seconds:
+            return set()
+        paths, self.pending = self.pending, set()
+        return paths
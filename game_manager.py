@@ -1,24 +1,89 @@
 import os
-import csv
-from PySide6.QtWidgets import QApplication, QMainWindow, QTableView, QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QFileDialog, QMessageBox, QLineEdit, QLabel, QFormLayout
+import json
+import sys
+from PySide6.QtWidgets import QApplication, QMainWindow, QTableView, QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QFileDialog, QMessageBox, QLineEdit, QLabel, QFormLayout, QCheckBox
 from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from bisect import bisect_left, insort
+from library import column_getter, open_library
+from search_index import SearchIndex
 
-class CsvTableModel(QAbstractTableModel):
-    def __init__(self, csv_data):
-        super().__init__()
-        self.csv_data = csv_data  # Renamed from 'data' to 'csv_data' to avoid conflict
-        self.headers = ["Column1", "Column2", "Column3", "..."]  # Adjust based on your CSV
+# Rows handed to the view per fetchMore() call
+FETCH_BATCH_SIZE = 500
+
+# Columns sorted as numbers rather than text
+NUMERIC_COLUMNS = {'id', 'year'}
+
+
+def _sort_key(column, value):
+    # numbers sort by value with blanks last; text sorts case-insensitively
+    if column in NUMERIC_COLUMNS:
+        return (0, int(value)) if value and value.isdigit() else (1, 0)
+    return (0, value.casefold()) if value else (1, '')
+
+
+class LibraryTableModel(QAbstractTableModel):
+    """
+    The library as a table, one column per library field.
+
+    Sorting and filtering only ever rearrange a list of positions into the rows, the rows
+    themselves are never copied. Each column's sort keys and sorted order are worked out the first
+    time the column is sorted and kept, so sorting by it again just walks that order, and an edit
+    moves the one row with a binary search instead of sorting again. Filters on a column's value
+    go through a value -> positions index built the first time that column is filtered, and text
+    search goes through a SearchIndex. The view is handed rows in batches through
+    canFetchMore()/fetchMore(), so opening the manager doesn't wait for the whole library.
+    """
+
+    def __init__(self, rows, fieldnames, parent=None):
+        super().__init__(parent)
+        self.rows = rows
+        self.headers = list(fieldnames)
+        self.position_by_key = {row['vpx_file_name']: position for position, row in enumerate(rows)}
+        # positions of the rows that pass the filters, in sort order
+        self.visible = list(range(len(rows)))
+        # how many of self.visible the view has been given so far
+        self.loaded = 0
+        self.sort_column = None
+        self.sort_order = Qt.AscendingOrder
+        # column -> sorted list of (sort key, position) for every row
+        self._sorted_entries = {}
+        # column -> {value: set of positions}
+        self._value_indexes = {}
+        self._search_index = None
+        self.column_filters = {}
+        self.search_text = ''
 
     def rowCount(self, parent=QModelIndex()):
-        return len(self.csv_data)
+        return 0 if parent.isValid() else self.loaded
 
     def columnCount(self, parent=QModelIndex()):
-        return len(self.headers) if self.csv_data else 0
+        return 0 if parent.isValid() else len(self.headers)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.visible)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        count = min(FETCH_BATCH_SIZE, len(self.visible) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def rowData(self, row):
+        """
+        :return: The library row dictionary shown at row in the view.
+        """
+        return self.rows[self.visible[row]]
 
     def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.loaded:
+            return None
         if role == Qt.DisplayRole:
             # Return the value for the given index
-            return self.csv_data[index.row()][index.column()]
+            return self.rows[self.visible[index.row()]].get(self.headers[index.column()], '')
         return None
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
@@ -28,22 +93,147 @@ class CsvTableModel(QAbstractTableModel):
                 return self.headers[section]
         return None
 
+    def sortedPositions(self, column):
+        entries = self._sorted_entries.get(column)
+        if entries is None:
+            # the position breaks ties, so rows with equal keys stay in library order
+            value_of = column_getter(column)
+            # year, manufacturer and the like only have a few distinct values, so work out each one's key once
+            keys = {}
+            entries = []
+            for position, row in enumerate(self.rows):
+                value = value_of(row)
+                key = keys.get(value)
+                if key is None:
+                    key = keys[value] = _sort_key(column, value)
+                entries.append((key, position))
+            entries.sort()
+            self._sorted_entries[column] = entries
+        return [position for _, position in entries]
+
+    def valueIndex(self, column):
+        index = self._value_indexes.get(column)
+        if index is None:
+            value_of = column_getter(column)
+            index = {}
+            for position, row in enumerate(self.rows):
+                index.setdefault(value_of(row), set()).add(position)
+            self._value_indexes[column] = index
+        return index
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = self.headers[column] if 0 <= column < len(self.headers) else None
+        self.sort_order = order
+        self.refilter()
+
+    def setColumnFilter(self, column, value):
+        """
+        Shows only rows whose column equals value. A value of None removes the filter on that column.
+        """
+        if value is None:
+            self.column_filters.pop(column, None)
+        else:
+            self.column_filters[column] = value
+        self.refilter()
+
+    def setSearchText(self, text):
+        self.search_text = text
+        self.refilter()
+
+    def refilter(self):
+        # Works out which rows to show and in what order, then hands the view the first batch again
+        allowed = None
+        for column, value in self.column_filters.items():
+            positions = self.valueIndex(column).get(value, set())
+            allowed = set(positions) if allowed is None else allowed & positions
+        if self.search_text:
+            if self._search_index is None:
+                self._search_index = SearchIndex().build(self.rows)
+            keys = self._search_index.search(self.search_text)
+            if keys is not None:
+                positions = {self.position_by_key[key] for key in keys}
+                allowed = positions if allowed is None else allowed & positions
+
+        if self.sort_column is None:
+            ordered = range(len(self.rows))
+        else:
+            ordered = self.sortedPositions(self.sort_column)
+            if self.sort_order == Qt.DescendingOrder:
+                ordered = reversed(ordered)
+
+        self.beginResetModel()
+        self.visible = list(ordered) if allowed is None else [position for position in ordered if position in allowed]
+        self.loaded = min(FETCH_BATCH_SIZE, len(self.visible))
+        self.endResetModel()
+
+    def setRowValue(self, row_dict, column, value):
+        """
+        Changes one field of a row and keeps the cached sort orders, indexes and the view up to date.
+        The row keeps its place in the view until the next sort or filter.
+        """
+        position = self.position_by_key[row_dict['vpx_file_name']]
+        old_value = row_dict.get(column, '')
+        if old_value == value:
+            return
+
+        entries = self._sorted_entries.get(column)
+        if entries is not None:
+            # take the row out of the column's sorted order and put it back where its new key belongs
+            del entries[bisect_left(entries, (_sort_key(column, old_value), position))]
+            insort(entries, (_sort_key(column, value), position))
+
+        value_index = self._value_indexes.get(column)
+        if value_index is not None:
+            value_index[old_value].discard(position)
+            value_index.setdefault(value, set()).add(position)
+
+        row_dict[column] = value
+        if self._search_index is not None:
+            self._search_index.update(row_dict)
+
+        try:
+            row = self.visible.index(position)
+        except ValueError:
+            return
+        if row < self.loaded:
+            column_number = self.headers.index(column) if column in self.headers else 0
+            self.dataChanged.emit(self.index(row, column_number), self.index(row, column_number))
+
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, config_settings=None):
         super().__init__()
         self.setWindowTitle("Game Configuration")
         self.resize(1024, 768)
+        self.config_settings = config_settings or {}
         
-        # Load CSV data
-        self.ffiend_data = self.load_csv("ffiend.csv")
-        self.model = CsvTableModel(self.ffiend_data)
+        # Load the library, from ffiend.csv or the SQLite database depending on library_backend. It stays
+        # open so edits are saved through it; with the journal on, favorite, show_in_arcade and
+        # display_name edits don't rewrite ffiend.csv every time
+        self.library = open_library(self.config_settings.get('library_backend') or 'csv', journal=True)
+        self.ffiend_data = self.library.rows
+        self.model = LibraryTableModel(self.ffiend_data, self.library.fieldnames, self)
         
         # Main layout
         layout = QVBoxLayout()
+
+        # Filter bar: text search plus a favorites-only switch
+        filter_layout = QHBoxLayout()
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText('Search by name, manufacturer, year or theme')
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.model.setSearchText)
+        self.favorites_only = QCheckBox('Favorites only')
+        self.favorites_only.toggled.connect(
+            lambda checked: self.model.setColumnFilter('favorite', '1' if checked else None))
+        filter_layout.addWidget(self.search_box)
+        filter_layout.addWidget(self.favorites_only)
+        layout.addLayout(filter_layout)
         
-        # Table view
+        # Table view. Clicking a header sorts by that column
         self.table_view = QTableView()
         self.table_view.setModel(self.model)
+        self.table_view.setSortingEnabled(True)
         layout.addWidget(self.table_view)
         
         # Set column widths here
@@ -71,14 +261,10 @@ class MainWindow(QMainWindow):
         main_widget.setLayout(layout)
         self.setCentralWidget(main_widget)
 
-    
-    def load_csv(self, filepath):
-        data = []
-        with open(filepath, mode="r", newline="") as file:
-            reader = csv.reader(file)
-            for row in reader:
-                data.append(row)
-        return data
+    def closeEvent(self, event):
+        # writes journaled edits to ffiend.csv
+        self.library.close()
+        super().closeEvent(event)
 
     def scan_vpx_files(self):
         # Implement scanning logic here
@@ -88,43 +274,97 @@ class MainWindow(QMainWindow):
         # Implement edit game logic here
         if self.table_view.selectionModel().hasSelection():
             selected_row = self.table_view.selectionModel().currentIndex().row()
-            # Assuming the first column is the unique identifier for editing
-            game_id = self.model.data[selected_row][0]
-            self.open_edit_window(game_id)
+            self.open_edit_window(self.model.rowData(selected_row))
         else:
             QMessageBox.information(self, "Selection Required", "Please select a game to edit.")
 
-    def open_edit_window(self, game_id):
-        #  Redraw the window with the selected game's data from ffiend.csv in an edit window
-        # there should be an edit field for each column in ffiend.csv
-        self.edit_window = EditGameWindow(game_id)
+    def open_edit_window(self, row_dict):
+        # an edit field for each column of the library except id and vpx_file_name, which identify the table
+        self.edit_window = EditGameWindow(row_dict, self.model, self.library)
         self.edit_window.show()
-        
 
-        
-        
+
+# Columns shown as check boxes in the edit window rather than text fields
+CHECKBOX_FIELDS = {'favorite', 'show_in_arcade'}
+# Columns that identify a table and can't be edited
+FIXED_FIELDS = {'id', 'vpx_file_name'}
+
+
 class EditGameWindow(QWidget):
-    def __init__(self, game_id):
+    """
+    Edits one table's library row. Saving writes each changed field through the library's
+    set_field() and updates the table model, which moves the row in its cached sort orders and
+    search index instead of sorting and indexing everything again.
+    """
+
+    def __init__(self, row_dict, model, library):
         super().__init__()
-        self.setWindowTitle(f"Edit Game {game_id}")
+        self.row_dict = row_dict
+        self.model = model
+        self.library = library
+        self.setWindowTitle(f"Edit Game {row_dict['id']}")
         self.layout = QFormLayout()
-        
-        # Example fields for editing, adjust based on your CSV structure
-        self.name_field = QLineEdit()
-        self.layout.addRow(QLabel("Name:"), self.name_field)
-        
+        self.layout.addRow(QLabel("Table:"), QLabel(row_dict['vpx_file_name']))
+
+        # column -> its edit field
+        self.fields = {}
+        for column in model.headers:
+            if column in FIXED_FIELDS:
+                continue
+            value = row_dict.get(column, '')
+            if column in CHECKBOX_FIELDS:
+                field = QCheckBox()
+                # a blank show_in_arcade shows the table, a blank favorite doesn't make it one
+                field.setChecked(value != '0' if column == 'show_in_arcade' else value == '1')
+            else:
+                field = QLineEdit(value)
+            self.fields[column] = field
+            self.layout.addRow(QLabel(f"{column}:"), field)
+
         self.save_button = QPushButton("Save")
         self.save_button.clicked.connect(self.save_changes)
         self.layout.addRow(self.save_button)
-        
+
         self.setLayout(self.layout)
-    
+
+    def fieldValue(self, column):
+        field = self.fields[column]
+        if column not in CHECKBOX_FIELDS:
+            return field.text()
+        old_value = self.row_dict.get(column, '')
+        # leave a blank favorite blank unless the box was actually changed
+        was_checked = old_value != '0' if column == 'show_in_arcade' else old_value == '1'
+        if field.isChecked() == was_checked:
+            return old_value
+        return '1' if field.isChecked() else '0'
+
     def save_changes(self):
-        # Implement save logic
-        pass
+        vpx_file_name = self.row_dict['vpx_file_name']
+        failed = []
+        for column in self.fields:
+            value = self.fieldValue(column)
+            old_value = self.row_dict.get(column, '')
+            if value == old_value:
+                continue
+            # the model first: it needs the old value to find the row in its sort orders and indexes
+            self.model.setRowValue(self.row_dict, column, value)
+            try:
+                if not self.library.set_field(vpx_file_name, column, value):
+                    raise ValueError(f"{vpx_file_name} is no longer in the library")
+            except (OSError, ValueError) as e:
+                # put the view and the row back to what the library still has
+                self.model.setRowValue(self.row_dict, column, old_value)
+                failed.append(f"{column}: {e}")
+        if failed:
+            # the window stays open with the values that weren't saved, so they can be tried again
+            QMessageBox.warning(self, "Save Failed", "Could not save\n" + "\n".join(failed))
+            return
+        self.close()
 
 if __name__ == "__main__":
     app = QApplication([])
-    window = MainWindow()
+    # main.py passes its config settings as JSON on the command line
+    config_settings = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    window = MainWindow(config_settings)
     window.show()
     app.exec()
@@ -0,0 +1,224 @@
+import os
+from collections import OrderedDict
+from pathlib import Path
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage, QPixmap
+from perf import span
+from thumbnail_atlas import ThumbnailAtlas
+from thumbnails import DEFAULT_CACHE_DIR, THUMBNAIL_SIZE, ensure_thumbnail
+
+# #######################################
+# Wheel images for the arcade grid, decoded off the GUI thread.
+#
+# The tile delegate asks ImageLoader for a tile's image while painting. If it's already decoded it
+# comes straight from a byte-budgeted LRU cache; otherwise the delegate paints the placeholder
+# (defaultimg.png) and a decode is queued on a worker pool. Only tiles being painted ask for images,
+# so only visible tiles are ever queued, and newer requests run before older ones. When the view
+# scrolls it calls cancelPending() to drop decodes for tiles that have scrolled away, and
+# prefetch() for the tiles it is about to scroll to, which are decoded once the visible ones are.
+#
+# Wheel images the scanner has packed into the thumbnail atlas (see thumbnail_atlas.py) skip all
+# of that: their pixels are already decoded in the mapped atlas file, so the pixmap is made on the
+# spot, without opening a file or queueing a decode.
+
+DEFAULT_IMAGE = str(Path(__file__).parent / 'images' / 'defaultimg.png')
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class PixmapCache:
+    """
+    LRU cache of pixmaps keyed by image path, bounded by the memory the pixmaps use rather than by count.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._pixmaps = OrderedDict()
+
+    @staticmethod
+    def cost(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        old = self._pixmaps.pop(key, None)
+        if old is not None:
+            self.total_bytes -= self.cost(old)
+        self._pixmaps[key] = pixmap
+        self.total_bytes += self.cost(pixmap)
+        # evict least recently used, but always keep the pixmap just added
+        while self.total_bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, evicted = self._pixmaps.popitem(last=False)
+            self.total_bytes -= self.cost(evicted)
+
+    def __contains__(self, key):
+        # unlike get(), doesn't count as a use
+        return key in self._pixmaps
+
+    def remove(self, key):
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is not None:
+            self.total_bytes -= self.cost(pixmap)
+
+    def clear(self):
+        self._pixmaps.clear()
+        self.total_bytes = 0
+
+
+class _DecodeTask(QRunnable):
+    def __init__(self, loader, image_path, cache_dir):
+        super().__init__()
+        # the loader holds on to queued tasks so they can be cancelled, so Qt mustn't delete them
+        self.setAutoDelete(False)
+        self.loader = loader
+        self.image_path = image_path
+        self.cache_dir = cache_dir
+
+    def run(self):
+        image = QImage()
+        with span('launcher.image_decode'):
+            cached_path = ensure_thumbnail(self.image_path, self.cache_dir, THUMBNAIL_SIZE)
+            if cached_path:
+                image = QImage(cached_path)
+        # emitted from the worker thread, delivered to the loader on the GUI thread
+        self.loader._decoded.emit(self.image_path, image)
+
+
+class ImageLoader(QObject):
+    """
+    Decodes wheel thumbnails on a thread pool and keeps the results in a PixmapCache.
+    Emits imageReady(image_path) on the GUI thread when a requested image is available.
+    """
+
+    imageReady = Signal(str)
+    _decoded = Signal(str, QImage)
+
+    def __init__(self, config_settings, max_bytes=DEFAULT_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.config_settings = config_settings
+        self.cache = PixmapCache(max_bytes)
+        self.pool = QThreadPool(self)
+        # leave a core for the GUI thread
+        self.pool.setMaxThreadCount(max(1, (os.cpu_count() or 2) - 1))
+        self.pending = {}
+        self._priority = 0
+        self.placeholder = QPixmap(DEFAULT_IMAGE).scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.atlas = ThumbnailAtlas(self.cacheDir()).open()
+        self._decoded.connect(self._onDecoded)
+
+    def cacheDir(self):
+        return self.config_settings.get('thumbnail_cache_path') or DEFAULT_CACHE_DIR
+
+    def pixmap(self, image_path):
+        """
+        :return: The decoded pixmap for image_path, or the placeholder while it is still being decoded.
+        """
+        pixmap = self.cache.get(image_path)
+        if pixmap is not None:
+            return pixmap
+        pixmap = self.atlasPixmap(image_path)
+        if pixmap is not None:
+            self.cache.put(image_path, pixmap)
+            return pixmap
+        self.request(image_path)
+        return self.placeholder
+
+    def inAtlas(self, image_path):
+        """
+        :return: True if the atlas has a tile of image_path as it is on disk now. A wheel image
+                 replaced since the atlas was built is decoded again, like a stale thumbnail would be.
+        """
+        try:
+            stat_result = os.stat(image_path)
+        except OSError:
+            return False
+        return self.atlas.is_current(os.path.basename(image_path), image_path, stat_result)
+
+    def atlasPixmap(self, image_path):
+        """
+        :return: A pixmap of image_path's tile in the thumbnail atlas, or None if the atlas doesn't have it.
+        """
+        if not self.inAtlas(image_path):
+            return None
+        pixels = self.atlas.tile(os.path.basename(image_path), image_path)
+        if pixels is None:
+            return None
+        size = self.atlas.tile_size
+        # the QImage only borrows pixels, and fromImage() copies them before pixels goes away
+        image = QImage(pixels, size, size, size * 4, QImage.Format_RGBA8888_Premultiplied)
+        return QPixmap.fromImage(image)
+
+    def request(self, image_path):
+        """
+        Queues a decode of image_path unless it is cached or already queued.
+        The most recent request is decoded first.
+        """
+        if image_path in self.pending or self.cache.get(image_path) is not None:
+            return
+        self._priority += 1
+        task = _DecodeTask(self, image_path, self.cacheDir())
+        self.pending[image_path] = task
+        self.pool.start(task, self._priority)
+
+    def prefetch(self, image_path, rank=0):
+        """
+        Gets image_path ready for a tile about to scroll into view. A tile in the thumbnail atlas only
+        has its pages read in by the OS; anything else is queued for decoding behind every tile
+        that is on screen.
+
+        :param rank: 0 for the nearest upcoming tile, higher for ones further away, which are decoded later.
+        """
+        if image_path in self.pending or image_path in self.cache:
+            return
+        if self.inAtlas(image_path) and self.atlas.will_need(os.path.basename(image_path), image_path):
+            return
+        task = _DecodeTask(self, image_path, self.cacheDir())
+        self.pending[image_path] = task
+        # visible tiles are queued with positive priorities, so they always go first
+        self.pool.start(task, -1 - rank)
+
+    def cancelPending(self):
+        """
+        Drops every decode that hasn't started yet. Tiles still on screen ask again when they repaint.
+        """
+        for image_path, task in list(self.pending.items()):
+            if self.pool.tryTake(task):
+                del self.pending[image_path]
+
+    def clear(self):
+        self.cancelPending()
+        self.cache.clear()
+        # the thumbnail cache folder may have changed in the preferences
+        if self.atlas.cache_dir != self.cacheDir():
+            self.atlas.close()
+            self.atlas = ThumbnailAtlas(self.cacheDir()).open()
+        else:
+            self.refreshAtlas()
+
+    def refreshAtlas(self):
+        """
+        Picks up tiles the scanner or the library watcher added to the atlas since it was opened.
+        """
+        self.atlas.refresh()
+
+    def invalidate(self, image_path):
+        """
+        Forgets image_path, so a wheel image replaced on disk is decoded again the next time it's painted.
+        """
+        task = self.pending.pop(image_path, None)
+        if task is not None:
+            self.pool.tryTake(task)
+        # the atlas tile is only used if it was rendered from the image now on disk, see inAtlas()
+        self.cache.remove(image_path)
+
+    def _onDecoded(self, image_path, image):
+        self.pending.pop(image_path, None)
+        # an unreadable wheel image is cached as the placeholder so it isn't decoded again on every paint
+        pixmap = QPixmap.fromImage(image) if not image.isNull() else self.placeholder
+        self.cache.put(image_path, pixmap)
+        self.imageReady.emit(image_path)
@@ -0,0 +1,176 @@
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from PySide6.QtCore import QObject, QProcess, Signal
+import perf
+
+# #######################################
+# Launching tables from the arcade.
+#
+# VPinballX_GL runs as a QProcess watched from the Qt event loop, so the arcade keeps repainting
+# while a table is played and notices when VPX exits. Every launch is appended to launch_log.csv:
+# how long the process took to start, how long the session lasted and how it ended.
+
+LAUNCH_LOG_FILE = 'launch_log.csv'
+LAUNCH_LOG_FIELDS = ['vpx_file_name', 'started_at', 'spawn_ms', 'session_seconds', 'exit_status', 'exit_code']
+
+
+def build_launch_command(config_settings, game_data):
+    """
+    :return: The VPinballX_GL command line that plays game_data's table, as a list.
+    """
+    vpx_file_path = Path(config_settings.get('vpx_table_path')).expanduser() / game_data['vpx_file_name']
+    # vpx_app is the VPinballX_GL app bundle, the executable is inside it
+    vpx_app_path = Path(config_settings.get('vpx_app')).expanduser() / 'Contents/MacOS/VPinballX_GL'
+    # the table's script has the same name as the table with a .vbs extension
+    vpx_script_name = game_data['vpx_file_name'].split('.')[0] + '.vbs'
+    return [str(vpx_app_path), '-Play', str(vpx_file_path), '-TableIni', str(vpx_script_name)]
+
+
+def append_launch_log(record, log_path=LAUNCH_LOG_FILE):
+    """
+    Appends one launch to the log, writing the header first if the log is new.
+    """
+    try:
+        new_file = not os.path.exists(log_path)
+        with open(log_path, mode='a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=LAUNCH_LOG_FIELDS, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerow(record)
+    except OSError as e:
+        print(f"Could not write {log_path}: {e}")
+
+
+class TableLauncher(QObject):
+    """
+    Runs one table at a time. launch() returns straight away; launchFinished is emitted with the
+    game's row dictionary and its launch record once VPX exits or fails to start.
+    """
+
+    launchStarted = Signal(object)
+    launchFinished = Signal(object, dict)
+
+    def __init__(self, config_settings, log_path=LAUNCH_LOG_FILE, parent=None):
+        super().__init__(parent)
+        self.config_settings = config_settings
+        self.log_path = log_path
+        self.process = None
+        self.game_data = None
+        self.record = None
+        self._requested_at = 0.0
+        self._started_at = 0.0
+
+    def isRunning(self):
+        return self.process is not None
+
+    def launch(self, game_data):
+        """
+        Starts game_data's table unless one is already running.
+
+        :return: True if the table is being started, False if another table is still running.
+        """
+        if self.isRunning():
+            print(f"{self.game_data['vpx_file_name']} is still running, not launching {game_data['vpx_file_name']}")
+            return False
+
+        command = build_launch_command(self.config_settings, game_data)
+        print(f"Running table: {command[2]}")
+        print(f'{command}')
+
+        self.game_data = game_data
+        self.record = {
+            'vpx_file_name': game_data['vpx_file_name'],
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'spawn_ms': '',
+            'session_seconds': '',
+            'exit_status': '',
+            'exit_code': '',
+        }
+        self.process = QProcess(self)
+        # VPX logs to stdout/stderr; keep that going to the terminal like before
+        self.process.setProcessChannelMode(QProcess.ForwardedChannels)
+        self.process.started.connect(self._onStarted)
+        self.process.finished.connect(self._onFinished)
+        self.process.errorOccurred.connect(self._onError)
+
+        self._requested_at = time.perf_counter()
+        self.process.start(command[0], command[1:])
+        self.launchStarted.emit(game_data)
+        return True
+
+    def _onStarted(self):
+        self._started_at = time.perf_counter()
+        self.record['spawn_ms'] = f"{(self._started_at - self._requested_at) * 1000:.1f}"
+        perf.record('launcher.launch', self._started_at - self._requested_at, table=self.game_data['vpx_file_name'])
+
+    def _onFinished(self, exit_code, exit_status):
+        session_seconds = time.perf_counter() - self._started_at
+        self.record['session_seconds'] = f"{session_seconds:.1f}"
+        perf.record('launcher.session', session_seconds, table=self.game_data['vpx_file_name'])
+        self.record['exit_code'] = exit_code
+        if exit_status == QProcess.CrashExit:
+            self.record['exit_status'] = 'crashed'
+        else:
+            self.record['exit_status'] = 'ok' if exit_code == 0 else 'error'
+        self._finish()
+
+    def _onError(self, error):
+        # a process that never started won't emit finished; crashes are handled by _onFinished
+        if error == QProcess.FailedToStart:
+            print(f"An error occurred while trying to run the game: {self.process.errorString()}")
+            self.record['exit_status'] = 'failed_to_start'
+            self._finish()
+
+    def _finish(self):
+        record, game_data = self.record, self.game_data
+        append_launch_log(record, self.log_path)
+        self.process.deleteLater()
+        self.process = None
+        self.game_data = None
+        self.record = None
+        self.launchFinished.emit(game_data, record)
+
+
+def summarize_launch_log(log_path=LAUNCH_LOG_FILE):
+    """
+    Prints launches, failures, median spawn time and total play time per table, slowest to start first.
+    """
+    tables = {}
+    try:
+        with open(log_path, mode='r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                stats = tables.setdefault(row['vpx_file_name'], {'spawn_ms': [], 'seconds': 0.0, 'launches': 0, 'failures': 0})
+                stats['launches'] += 1
+                if row['exit_status'] not in ('ok', ''):
+                    stats['failures'] += 1
+                if row['spawn_ms']:
+                    stats['spawn_ms'].append(float(row['spawn_ms']))
+                if row['session_seconds']:
+                    stats['seconds'] += float(row['session_seconds'])
+    except OSError as e:
+        print(f"Could not read {log_path}: {e}")
+        return
+
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2] if values else 0.0
+
+    print(f"{'table':<60} {'launches':>8} {'failed':>6} {'spawn ms':>9} {'played min':>10}")
+    for name, stats in sorted(tables.items(), key=lambda item: median(item[1]['spawn_ms']), reverse=True):
+        print(f"{name[:60]:<60} {stats['launches']:>8} {stats['failures']:>6} "
+              f"{median(stats['spawn_ms']):>9.1f} {stats['seconds'] / 60:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize the table launch log written by the arcade.')
+    parser.add_argument('--log', default=LAUNCH_LOG_FILE, help='Path to launch_log.csv')
+    args = parser.parse_args()
+    summarize_launch_log(args.log)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,752 @@
+import argparse
+import csv
+import json
+import operator
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+from collections.abc import MutableMapping
+
+# Column order for ffiend.csv
+FIELDNAMES = ['id', 'vpx_file_name', 'VPS-ID', 'image_file', 'display_name', 'show_in_arcade', 'favorite', 'notes', 'year', 'manufacturer',
+              'theme', 'type', 'authors']
+
+# Columns filled from puplookup.csv by enrichment.PupLookup, keyed by their table_info key
+ENRICHED_FIELDS = {'vps_id': 'VPS-ID', 'theme': 'theme', 'type': 'type', 'authors': 'authors'}
+
+# Columns with only a handful of distinct values. GameRecord keeps one copy of each value
+INTERNED_FIELDS = frozenset(['show_in_arcade', 'favorite', 'year', 'manufacturer', 'theme', 'type'])
+
+# ffiend.csv column -> GameRecord attribute, e.g. 'VPS-ID' -> 'vps_id'
+FIELD_ATTRIBUTES = {name: name.lower().replace('-', '_') for name in FIELDNAMES}
+_ATTRIBUTES = tuple(FIELD_ATTRIBUTES.values())
+
+
+class GameRecord(MutableMapping):
+    """
+    One game in the library.
+
+    A row used to be a dict, which costs a hash table and a pointer to every key string for each of
+    the 20,000 rows of a big library. A GameRecord keeps the FIELDNAMES columns in __slots__ and
+    stores each distinct year, manufacturer, theme and so on once, so a library takes about a
+    third of the memory. Code that knows the columns reads them as attributes (record.display_name,
+    record.vps_id), which is as fast as a dict lookup. Everything else can keep using it as a
+    dict: record['VPS-ID'], record.get('year'), dict(record) and csv.DictWriter all work.
+
+    Columns that aren't in FIELDNAMES, like ones added to ffiend.csv by hand, are kept in a small
+    dict of their own.
+    """
+
+    __slots__ = _ATTRIBUTES + ('extra',)
+
+    def __init__(self, fields=(), **kwargs):
+        for attribute in _ATTRIBUTES:
+            setattr(self, attribute, '')
+        self.extra = None
+        self.update(fields, **kwargs)
+
+    @classmethod
+    def from_values(cls, values, extra=None):
+        """
+        Builds a record without going through the dict interface, for loading many rows at once.
+
+        :param values: The FIELDNAMES columns as strings, in FIELDNAMES order.
+        :param extra: Dictionary of any other columns, or None.
+        """
+        record = cls.__new__(cls)
+        # spelled out rather than a setattr() loop, which made loading a big library a third slower;
+        # keep it in step with FIELDNAMES
+        (record.id, record.vpx_file_name, record.vps_id, record.image_file, record.display_name, show_in_arcade,
+         favorite, record.notes, year, manufacturer, theme, type_, record.authors) = values
+        intern = sys.intern
+        record.show_in_arcade = intern(show_in_arcade)
+        record.favorite = intern(favorite)
+        record.year = intern(year)
+        record.manufacturer = intern(manufacturer)
+        record.theme = intern(theme)
+        record.type = intern(type_)
+        record.extra = extra or None
+        return record
+
+    def values_tuple(self):
+        """
+        :return: The FIELDNAMES columns in order, the counterpart of from_values().
+        """
+        return tuple(getattr(self, attribute) for attribute in _ATTRIBUTES)
+
+    def __getitem__(self, key):
+        attribute = FIELD_ATTRIBUTES.get(key)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # Mapping.get goes through __getitem__ and KeyError, which is slow enough to matter in a sort
+        attribute = FIELD_ATTRIBUTES.get(key)
+        if attribute is not None:
+            return getattr(self, attribute)
+        if self.extra is not None:
+            return self.extra.get(key, default)
+        return default
+
+    def __setitem__(self, key, value):
+        attribute = FIELD_ATTRIBUTES.get(key)
+        if attribute is not None:
+            if key in INTERNED_FIELDS and value.__class__ is str:
+                value = sys.intern(value)
+            setattr(self, attribute, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        # the FIELDNAMES columns always exist; deleting one empties it, like a blank cell
+        if key in FIELD_ATTRIBUTES:
+            setattr(self, FIELD_ATTRIBUTES[key], '')
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield from FIELDNAMES
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return len(FIELDNAMES) + (len(self.extra) if self.extra else 0)
+
+    def __contains__(self, key):
+        return key in FIELD_ATTRIBUTES or (self.extra is not None and key in self.extra)
+
+    def copy(self):
+        return GameRecord.from_values(self.values_tuple(), dict(self.extra) if self.extra else None)
+
+    def __reduce__(self):
+        return GameRecord.from_values, (self.values_tuple(), self.extra)
+
+    def __repr__(self):
+        return f"GameRecord({dict(self)!r})"
+
+
+def column_getter(column):
+    """
+    :return: Function reading column from a GameRecord: a plain attribute read for the FIELDNAMES
+             columns, which is what sorting and filtering 20,000 rows by a column wants.
+    """
+    attribute = FIELD_ATTRIBUTES.get(column)
+    if attribute is not None:
+        return operator.attrgetter(attribute)
+    return lambda row: row.get(column, '')
+
+
+def records_from_csv(csvfile):
+    """
+    Reads ffiend.csv rows straight into GameRecords, without a dict per row in between.
+
+    :param csvfile: Open ffiend.csv.
+    :return: Tuple of (list of GameRecords, the file's column names).
+    """
+    reader = csv.reader(csvfile)
+    header = next(reader, None)
+    if not header:
+        return [], []
+    positions = {name: position for position, name in enumerate(header)}
+    # where each FIELDNAMES column is in the file; columns the file doesn't have stay blank
+    columns = [positions.get(name) for name in FIELDNAMES]
+    extra_columns = [(name, position) for position, name in enumerate(header) if name not in FIELD_ATTRIBUTES]
+    width = len(header)
+    records = []
+    for values in reader:
+        if not values:
+            continue
+        if len(values) < width:
+            # a short row, like DictReader, leaves the missing columns blank
+            values = values + [''] * (width - len(values))
+        extra = {name: values[position] for name, position in extra_columns} if extra_columns else None
+        records.append(GameRecord.from_values([values[position] if position is not None else ''
+                                               for position in columns], extra))
+    return records, header
+
+
+def write_csv_atomic(csv_path, rows, fieldnames=FIELDNAMES):
+    """
+    Writes rows to csv_path through a temp file in the same directory and renames it into place,
+    so a crash mid-write never leaves a truncated ffiend.csv behind.
+
+    :param csv_path: Path to the CSV file to write.
+    :param rows: List of dictionaries to write.
+    :param fieldnames: Column order for the CSV file.
+    """
+    directory = os.path.dirname(os.path.abspath(csv_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.ffiend-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode='w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        os.replace(tmp_path, csv_path)
+    except BaseException:
+        # don't leave temp files lying around next to ffiend.csv
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Bump when the snapshot layout changes so old snapshots are ignored
+SNAPSHOT_VERSION = 2
+
+
+def snapshot_path_for(csv_path):
+    """
+    :return: Path of the parsed-library snapshot kept next to csv_path, e.g. ffiend.csv.snapshot.
+    """
+    return csv_path + '.snapshot'
+
+
+# Fields set_field() journals instead of rewriting ffiend.csv straight away
+JOURNAL_FIELDS = {'favorite', 'show_in_arcade', 'display_name'}
+
+
+def journal_path_for(csv_path):
+    """
+    :return: Path of the change journal kept next to csv_path, e.g. ffiend.csv.journal.
+    """
+    return csv_path + '.journal'
+
+
+def arcade_sort_key(row):
+    """
+    Order of the arcade view: favorites first, then by display name.
+    """
+    return (-int(row.favorite or '0'), row.display_name.lower())
+
+
+def _text(value):
+    # ffiend.csv only holds strings; None ends up as an empty cell
+    return '' if value is None else str(value)
+
+
+def merge_scan_result(row, table_info, wheel_image, new_id):
+    """
+    Works out the library row for a scanned table.
+
+    :param row: The table's current row, or None if it isn't in the library yet.
+    :param table_info: Dictionary built by scantables.collect_table_info.
+    :param wheel_image: Path of the matched wheel image, or None.
+    :param new_id: id to give the row if it is new.
+    :return: A new dictionary with the row's fields. row itself is not modified.
+    """
+    # only the file name of the wheel image is stored, not the leading path
+    img_file = wheel_image.split('/')[-1] if wheel_image else wheel_image
+
+    if row is not None:
+        merged = dict(row)
+        merged['image_file'] = _text(img_file)
+        merged['display_name'] = f"{table_info['tablename']}"
+        merged['show_in_arcade'] = '1'
+        # only keep favorite if it is 1, otherwise reset it to 0
+        merged['favorite'] = row['favorite'] if row['favorite'] == '1' else '0'
+        merged['notes'] = _text(table_info.get('releasedate', ''))  # Default to empty string if not found
+        merged['year'] = _text(table_info.get('year', ''))
+        merged['manufacturer'] = _text(table_info.get('manufacturer', ''))
+        # only overwrite puplookup fields when this scan found a match, so hand-entered values survive
+        for key, field in ENRICHED_FIELDS.items():
+            if table_info.get(key):
+                merged[field] = _text(table_info[key])
+        return merged
+
+    return {
+        'id': str(new_id),
+        'vpx_file_name': table_info['path'],
+        'image_file': _text(img_file),
+        # if table_info['tablename'] is not set, use the table_info['path'] instead
+        'display_name': table_info['tablename'] if table_info['tablename'] else table_info['path'],
+        'show_in_arcade': '1',
+        'favorite': '',
+        'notes': _text(table_info.get('releasedate', '')),
+        'year': _text(table_info.get('year', '')),
+        'manufacturer': _text(table_info.get('manufacturer', '')),
+        'VPS-ID': _text(table_info.get('vps_id', '')),
+        'theme': _text(table_info.get('theme', '')),
+        'type': _text(table_info.get('type', '')),
+        'authors': _text(table_info.get('authors', ''))
+    }
+
+
+class LibraryStore:
+    """
+    In-memory copy of ffiend.csv with a dict index keyed by vpx_file_name.
+
+    The file is read once by load(), scan results are applied in memory with apply_scan_result(),
+    and the whole library is written back once by flush(). If checkpoint_every is set, the store
+    flushes itself after that many applied results so a crash part way through a long scan only
+    loses the tables since the last checkpoint.
+
+    With snapshot set, the parsed rows and their arcade order are also pickled to ffiend.csv.snapshot.
+    The next load() uses the snapshot instead of parsing and sorting the CSV again, as long as
+    ffiend.csv still has the size and mtime recorded in it.
+
+    With journal set, set_field() on a JOURNAL_FIELDS field doesn't rewrite ffiend.csv. The change is
+    made in memory and appended as one JSON line to ffiend.csv.journal, and the next flush() (or
+    close()) compacts the journal into ffiend.csv. If the program dies before that, load() replays
+    the journal, so no change is lost.
+    """
+
+    def __init__(self, csv_path='ffiend.csv', checkpoint_every=0, snapshot=False, journal=False):
+        self.csv_path = csv_path
+        self.checkpoint_every = checkpoint_every
+        self.snapshot_path = snapshot_path_for(csv_path) if snapshot else None
+        self.journal_path = journal_path_for(csv_path) if journal else None
+        self._journal_file = None
+        self.fieldnames = list(FIELDNAMES)
+        self.rows = []
+        self.index = {}
+        self.next_id = 1
+        self.dirty = False
+        self.loaded_from_snapshot = False
+        self._since_checkpoint = 0
+        # positions in rows in arcade order, or None when it has to be worked out again
+        self._arcade_order = None
+        # called after every successful write, e.g. to save the scan manifest alongside ffiend.csv
+        self.flush_listeners = []
+
+    def load(self):
+        """
+        Reads ffiend.csv into memory. A missing file is treated as an empty library.
+        """
+        self.rows = []
+        self.index = {}
+        self._arcade_order = None
+        self.loaded_from_snapshot = self._load_snapshot()
+        if not self.loaded_from_snapshot:
+            try:
+                with open(self.csv_path, mode='r', newline='', encoding='utf-8') as csvfile:
+                    self.rows, header = records_from_csv(csvfile)
+                # keep any extra columns someone added to ffiend.csv by hand
+                self.fieldnames += [name for name in header if name not in self.fieldnames]
+            except FileNotFoundError:
+                print(f"File not found: {self.csv_path}, starting a new library")
+            self._save_snapshot()
+
+        for row in self.rows:
+            self.index[row['vpx_file_name']] = row
+        ids = [int(row['id']) for row in self.rows if row.get('id', '').isdigit()]
+        self.next_id = max(ids) + 1 if ids else 1
+        self.dirty = False
+        self._since_checkpoint = 0
+        self._replay_journal()
+        return self
+
+    def _replay_journal(self):
+        # Applies changes journaled by a run that ended before compacting them into ffiend.csv
+        if self.journal_path is None:
+            return
+        try:
+            with open(self.journal_path, mode='r', encoding='utf-8') as journal_file:
+                lines = journal_file.readlines()
+        except FileNotFoundError:
+            return
+        replayed = 0
+        for line in lines:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # a line cut short by a crash mid-write
+                continue
+            row = self.index.get(change.get('vpx_file_name'))
+            if row is not None and change.get('field') in JOURNAL_FIELDS:
+                row[change['field']] = change.get('value', '')
+                replayed += 1
+        print(f"Replayed {replayed} changes from {self.journal_path}")
+        # compact on the next flush, even if nothing applied, so the journal goes away
+        self.dirty = True
+        self._arcade_order = None
+
+    def _csv_signature(self):
+        try:
+            stat_result = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return stat_result.st_size, stat_result.st_mtime_ns
+
+    def _load_snapshot(self):
+        # :return: True if the rows came from a snapshot that still matches ffiend.csv
+        if self.snapshot_path is None:
+            return False
+        signature = self._csv_signature()
+        if signature is None:
+            return False
+        try:
+            with open(self.snapshot_path, 'rb') as snapshot_file:
+                snapshot = pickle.load(snapshot_file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+            return False
+        if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('signature') != signature:
+            return False
+        self.rows = snapshot['rows']
+        self.fieldnames = snapshot['fieldnames']
+        self._arcade_order = snapshot['arcade_order']
+        return True
+
+    def _save_snapshot(self):
+        signature = self._csv_signature()
+        if self.snapshot_path is None or signature is None:
+            return
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'signature': signature,
+            'fieldnames': self.fieldnames,
+            'rows': self.rows,
+            'arcade_order': self._sorted_order(),
+        }
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.ffiend-', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as snapshot_file:
+                pickle.dump(snapshot, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            # the snapshot only speeds up the next start, the library itself is safe in ffiend.csv
+            print(f"Could not write {self.snapshot_path}: {e}")
+
+    def _sorted_order(self):
+        if self._arcade_order is None:
+            keys = [arcade_sort_key(row) for row in self.rows]
+            self._arcade_order = sorted(range(len(keys)), key=keys.__getitem__)
+        return self._arcade_order
+
+    def close(self):
+        # compact any journaled changes; ffiend.csv itself is only open while loading or flushing
+        if self.journal_path is not None:
+            self.flush()
+
+    def get(self, vpx_file_name):
+        return self.index.get(vpx_file_name)
+
+    def arcade_rows(self):
+        """
+        :return: Rows shown in the arcade view, sorted for display. These are the store's own row
+                 dictionaries, so they stay in step with set_field().
+        """
+        rows = self.rows
+        return [rows[i] for i in self._sorted_order() if rows[i].show_in_arcade != '0']
+
+    def apply_scan_result(self, table_info, wheel_image):
+        """
+        Updates the row for table_info['path'], or appends a new one if the table isn't in the library yet.
+
+        :param table_info: Dictionary built by scantables.collect_table_info.
+        :param wheel_image: Path of the matched wheel image, or None.
+        :return: The updated or added row.
+        """
+        row = self.index.get(table_info['path'])
+        merged = merge_scan_result(row, table_info, wheel_image, self.next_id)
+        if row is not None:
+            row.update(merged)
+        else:
+            row = GameRecord(merged)
+            self.next_id += 1
+            self.rows.append(row)
+            self.index[row['vpx_file_name']] = row
+
+        self.dirty = True
+        self._arcade_order = None
+        self._since_checkpoint += 1
+        if self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+            self.flush()
+        return row
+
+    def set_field(self, vpx_file_name, field, value):
+        """
+        Changes a single field of one table and writes the library, or with the journal on and a
+        JOURNAL_FIELDS field, appends the change to the journal and leaves the rewrite to flush().
+
+        :return: True if the table was found.
+        """
+        row = self.index.get(vpx_file_name)
+        if row is None:
+            return False
+        row[field] = value
+        self.dirty = True
+        if field in ('favorite', 'display_name'):
+            self._arcade_order = None
+        if self.journal_path is not None and field in JOURNAL_FIELDS:
+            self._append_journal({'vpx_file_name': vpx_file_name, 'field': field, 'value': value})
+        else:
+            self.flush()
+        return True
+
+    def _append_journal(self, change):
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, mode='a', encoding='utf-8')
+        self._journal_file.write(json.dumps(change) + '\n')
+        # hand the line to the OS so it survives the program crashing; no fsync, that would cost more than the rewrite it replaces
+        self._journal_file.flush()
+
+    def _clear_journal(self):
+        # ffiend.csv now holds every journaled change
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+        if self.journal_path is not None and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def flag_missing(self, vpx_file_name):
+        """
+        Hides a table whose file is no longer on disk from the arcade view. The row itself is kept
+        so favorites and edits survive if the file comes back.
+
+        :return: True if a row was flagged.
+        """
+        row = self.index.get(vpx_file_name)
+        if row is None or row.get('show_in_arcade') == '0':
+            return False
+        row['show_in_arcade'] = '0'
+        self.dirty = True
+        return True
+
+    def flush(self):
+        """
+        Writes the library back to ffiend.csv if anything changed since the last flush.
+        """
+        if not self.dirty:
+            return
+        write_csv_atomic(self.csv_path, self.rows, self.fieldnames)
+        self._clear_journal()
+        self.dirty = False
+        self._since_checkpoint = 0
+        # ffiend.csv changed, so refresh the snapshot or the next start would parse the CSV again
+        self._save_snapshot()
+        for listener in self.flush_listeners:
+            listener()
+
+
+class SQLiteLibraryStore:
+    """
+    The library kept in an SQLite database instead of ffiend.csv, with the same interface as LibraryStore.
+
+    Every change (a scan result, a favorite, an edit) is its own single-row transaction, so nothing
+    ever rewrites the whole library. vpx_file_name, VPS-ID, favorite, manufacturer and year are
+    indexed, and arcade_rows() comes back from the database already sorted.
+
+    ffiend.csv stays the interchange format: use import_csv() and export_csv() to move between them.
+    """
+
+    def __init__(self, db_path='ffiend.db', checkpoint_every=0):
+        self.db_path = db_path
+        # every change is committed as it happens, so checkpoints only notify the flush listeners
+        self.checkpoint_every = checkpoint_every
+        self.fieldnames = list(FIELDNAMES)
+        self.flush_listeners = []
+        self.connection = None
+        self._since_checkpoint = 0
+
+    def load(self):
+        """
+        Opens the database, creating the table and indexes if needed.
+        """
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.row_factory = sqlite3.Row
+        # WAL keeps each single-row commit cheap and lets the launcher read while a scan writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS games (
+                    id INTEGER PRIMARY KEY,
+                    vpx_file_name TEXT NOT NULL UNIQUE,
+                    "VPS-ID" TEXT NOT NULL DEFAULT '',
+                    image_file TEXT NOT NULL DEFAULT '',
+                    display_name TEXT NOT NULL DEFAULT '',
+                    show_in_arcade TEXT NOT NULL DEFAULT '1',
+                    favorite TEXT NOT NULL DEFAULT '',
+                    notes TEXT NOT NULL DEFAULT '',
+                    year TEXT NOT NULL DEFAULT '',
+                    manufacturer TEXT NOT NULL DEFAULT '',
+                    theme TEXT NOT NULL DEFAULT '',
+                    type TEXT NOT NULL DEFAULT '',
+                    authors TEXT NOT NULL DEFAULT ''
+                )''')
+            # databases created before a column was added to FIELDNAMES get it added here
+            existing = {row['name'] for row in self.connection.execute('PRAGMA table_info(games)')}
+            for name in FIELDNAMES:
+                if name not in existing:
+                    self.connection.execute(f'ALTER TABLE games ADD COLUMN "{name}" TEXT NOT NULL DEFAULT \'\'')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_games_vps_id ON games ("VPS-ID")')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_games_favorite ON games (favorite)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_games_manufacturer ON games (manufacturer)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_games_year ON games (year)')
+            # matches the ORDER BY in arcade_rows so the launcher never sorts
+            self.connection.execute('CREATE INDEX IF NOT EXISTS idx_games_arcade_order '
+                                    'ON games (favorite = \'1\' DESC, display_name COLLATE NOCASE)')
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    @staticmethod
+    def _row_dict(row):
+        if row is None:
+            return None
+        record = GameRecord(row)
+        record['id'] = str(record['id'])
+        return record
+
+    def get(self, vpx_file_name):
+        cursor = self.connection.execute('SELECT * FROM games WHERE vpx_file_name = ?', (vpx_file_name,))
+        return self._row_dict(cursor.fetchone())
+
+    @property
+    def rows(self):
+        cursor = self.connection.execute('SELECT * FROM games ORDER BY id')
+        return [self._row_dict(row) for row in cursor]
+
+    def arcade_rows(self):
+        """
+        :return: Rows shown in the arcade view, sorted for display by the database.
+        """
+        cursor = self.connection.execute(
+            "SELECT * FROM games WHERE show_in_arcade != '0' "
+            "ORDER BY favorite = '1' DESC, display_name COLLATE NOCASE")
+        return [self._row_dict(row) for row in cursor]
+
+    def _upsert(self, row):
+        columns = ', '.join(f'"{name}"' for name in FIELDNAMES)
+        placeholders = ', '.join('?' for _ in FIELDNAMES)
+        updates = ', '.join(f'"{name}" = excluded."{name}"' for name in FIELDNAMES if name not in ('id', 'vpx_file_name'))
+        values = [int(row['id']) if name == 'id' else _text(row.get(name, '')) for name in FIELDNAMES]
+        self.connection.execute(f'INSERT INTO games ({columns}) VALUES ({placeholders}) '
+                                f'ON CONFLICT (vpx_file_name) DO UPDATE SET {updates}', values)
+
+    def apply_scan_result(self, table_info, wheel_image):
+        """
+        Updates the row for table_info['path'], or adds a new one, in a single transaction.
+
+        :return: The updated or added row.
+        """
+        with self.connection:
+            row = self.get(table_info['path'])
+            if row is None:
+                next_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM games').fetchone()[0]
+            else:
+                next_id = row['id']
+            merged = merge_scan_result(row, table_info, wheel_image, next_id)
+            self._upsert(merged)
+        self._since_checkpoint += 1
+        if self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+            self.flush()
+        return merged
+
+    def set_field(self, vpx_file_name, field, value):
+        """
+        Changes a single field of one table in a single transaction.
+
+        :return: True if the table was found.
+        """
+        if field not in FIELDNAMES or field in ('id', 'vpx_file_name'):
+            raise ValueError(f"Can't set field {field}")
+        with self.connection:
+            cursor = self.connection.execute(f'UPDATE games SET "{field}" = ? WHERE vpx_file_name = ?',
+                                             (_text(value), vpx_file_name))
+        return cursor.rowcount > 0
+
+    def flag_missing(self, vpx_file_name):
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE games SET show_in_arcade = '0' WHERE vpx_file_name = ? AND show_in_arcade != '0'",
+                (vpx_file_name,))
+        return cursor.rowcount > 0
+
+    def flush(self):
+        """
+        Changes are already committed; this only tells the listeners, to match LibraryStore.
+        """
+        self._since_checkpoint = 0
+        for listener in self.flush_listeners:
+            listener()
+
+    def import_csv(self, csv_path):
+        """
+        Adds or updates every row of csv_path, keeping its ids.
+
+        :return: Number of rows imported.
+        """
+        with open(csv_path, mode='r', newline='', encoding='utf-8') as csvfile:
+            rows = [row for row in csv.DictReader(csvfile) if row.get('vpx_file_name')]
+        next_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM games').fetchone()[0]
+        with self.connection:
+            for row in rows:
+                if not (row.get('id') or '').isdigit():
+                    row['id'] = str(next_id)
+                    next_id += 1
+                self._upsert(row)
+        return len(rows)
+
+    def export_csv(self, csv_path):
+        """
+        Writes the whole library to csv_path in ffiend.csv format.
+
+        :return: Number of rows exported.
+        """
+        rows = self.rows
+        write_csv_atomic(csv_path, rows)
+        return len(rows)
+
+
+def open_library(backend='csv', csv_path='ffiend.csv', db_path='ffiend.db', checkpoint_every=0, snapshot=False,
+                 journal=False):
+    """
+    Opens the library with the chosen backend.
+
+    :param backend: 'csv' for ffiend.csv or 'sqlite' for the SQLite database. A new SQLite database is
+                    seeded from ffiend.csv when there is one.
+    :param snapshot: Load ffiend.csv through its startup snapshot. The SQLite backend doesn't need one.
+    :param journal: Journal small edits to ffiend.csv instead of rewriting it on each one. SQLite
+                    already writes each edit as a single-row transaction.
+    :return: A loaded LibraryStore or SQLiteLibraryStore.
+    """
+    if backend == 'sqlite':
+        is_new = not os.path.exists(db_path)
+        store = SQLiteLibraryStore(db_path, checkpoint_every=checkpoint_every).load()
+        if is_new and os.path.exists(csv_path):
+            count = store.import_csv(csv_path)
+            print(f"Imported {count} tables from {csv_path} into {db_path}")
+        return store
+    if backend != 'csv':
+        raise ValueError(f"Unknown library backend: {backend}")
+    return LibraryStore(csv_path, checkpoint_every=checkpoint_every, snapshot=snapshot, journal=journal).load()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Move the game library between ffiend.csv and the SQLite database.')
+    parser.add_argument('action', choices=['import', 'export'],
+                        help='import copies the CSV file into the database, export writes the database out as CSV')
+    parser.add_argument('--csv', default='ffiend.csv', help='Path to the CSV file (default: ffiend.csv)')
+    parser.add_argument('--db', default='ffiend.db', help='Path to the SQLite database (default: ffiend.db)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    store = SQLiteLibraryStore(args.db).load()
+    try:
+        if args.action == 'import':
+            print(f"Imported {store.import_csv(args.csv)} tables from {args.csv} into {args.db}")
+        else:
+            print(f"Exported {store.export_csv(args.csv)} tables from {args.db} to {args.csv}")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
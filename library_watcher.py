@@ -0,0 +1,320 @@
+import copy
+import os
+import threading
+from argparse import Namespace
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from PySide6.QtCore import QObject, Signal
+from enrichment import PupLookup
+from fs_watch import DEFAULT_DEBOUNCE_SECONDS, Debouncer, create_watcher
+from perf import span
+from scan_manifest import ScanManifest, manifest_path_for
+from scantables import collect_with_retries, find_closest_match, open_metadata_cache, parse_filename
+from table_discovery import discover_tables, sidecars_for
+from thumbnail_atlas import ThumbnailAtlas, update_atlas
+from thumbnails import DEFAULT_CACHE_DIR, ensure_thumbnail, thumbnails_available
+from wheel_index import WheelIndex
+
+# #######################################
+# Keeping the running arcade in step with the tables and wheel image folders.
+#
+# LibraryWatcher runs a background thread that watches vpx_table_path and wheelimage_file_path
+# (see fs_watch.py). Once a burst of changes has settled, only the tables and wheel images that
+# changed are looked at by IncrementalScanner, with the same per-table code scantables.py uses,
+# and the result is handed to the GUI thread as a ScanBatch. The arcade applies it to the library
+# and updates just the affected tiles, so a table dropped into the folder is playable a few
+# seconds later without running scantables.py or restarting.
+#
+# The thread keeps its own copy of the scan manifest, so a later scantables.py run knows these
+# tables are up to date. As in a full scan, the manifest is only saved once the library has been:
+# every batch carries an id and a copy of the manifest as it was when the batch was made, and
+# batchApplied(batch_id) saves that copy, never changes from batches the arcade hasn't applied yet.
+
+# What one settled burst of changes did to the library.
+# results: (table_info, wheel_image) for every table that is new or changed, or got a new wheel image.
+# removed: vpx_file_names of tables no longer on disk.
+# wheel_images: paths of wheel images that were added, replaced or deleted.
+# batch_id: passed back to LibraryWatcher.batchApplied() once the batch is in the library.
+ScanBatch = namedtuple('ScanBatch', ['results', 'removed', 'wheel_images', 'batch_id'])
+
+CSV_PATH = 'ffiend.csv'
+# How long closing the arcade waits for the watcher thread. It is a daemon thread and a scan it is
+# part way through only records what the arcade has applied, so it can be left to finish.
+STOP_TIMEOUT_SECONDS = 2.0
+
+
+def _file_name(wheel_image):
+    return os.path.basename(wheel_image) if wheel_image else None
+
+
+def _inside(file_path, folder):
+    return file_path == folder or file_path.startswith(folder.rstrip(os.sep) + os.sep)
+
+
+class IncrementalScanner:
+    """
+    Scans just the paths it is given. Not thread safe: it belongs to the watcher thread.
+
+    Once stopped is set, a scan reads no further tables.
+    """
+
+    def __init__(self, config_settings, csv_path=CSV_PATH, stopped=None):
+        self.table_root = str(Path(config_settings.get('vpx_table_path', '')).expanduser())
+        self.wheel_root = str(Path(config_settings.get('wheelimage_file_path', '')).expanduser())
+        # the arguments scantables.parse_arguments() would produce; metadata is read from the .vpx
+        # file itself, with vpxtool as the fallback
+        self.args = Namespace(vpx_table_path=self.table_root, wheelimage_file_path=self.wheel_root,
+                              vpxtool_app=config_settings.get('vpxtool_app') or os.path.join(self.table_root, 'vpxtool'),
+                              vpx_command='', vpx_table=None, reader='auto', puplookup='puplookup.csv',
+                              thumbnail_cache=config_settings.get('thumbnail_cache_path') or DEFAULT_CACHE_DIR,
+                              no_thumbnails=not thumbnails_available())
+        self.workers = os.cpu_count() or 1
+        self.stopped = stopped if stopped is not None else threading.Event()
+        self.manifest = ScanManifest(manifest_path_for(csv_path)).load()
+        self.metadata_cache = open_metadata_cache(self.args, csv_path)
+        self.pup_lookup = PupLookup.load(self.args.puplookup)
+        self.wheel_index = WheelIndex.from_directory(self.wheel_root)
+        self.atlas = None if self.args.no_thumbnails else ThumbnailAtlas(self.args.thumbnail_cache).load()
+        self.last_batch_id = 0
+        # batch_id -> manifest entries as they were when that batch was made, until it is applied
+        self.manifest_copies = {}
+
+    def scan(self, paths):
+        """
+        :param paths: Changed files and folders, as reported by the file system watcher.
+        :return: A ScanBatch.
+        """
+        table_paths = set()
+        wheel_images = set()
+        for file_path in paths:
+            # check the wheel folder first, it may well be inside the tables folder
+            if _inside(file_path, self.wheel_root):
+                wheel_images.add(file_path)
+            elif _inside(file_path, self.table_root):
+                table_paths.add(file_path)
+
+        results, removed = self._scan_tables(self._affected_tables(table_paths))
+        if wheel_images:
+            with span('watch.wheels'):
+                results.extend(self._rematch_wheels())
+            # the folder itself is reported when it was moved or deleted
+            wheel_images = {file_path for file_path in wheel_images if file_path.lower().endswith('.png')}
+        if self.atlas is not None:
+            # in the atlas before the arcade gets the batch, so it can paint the new tiles from there
+            try:
+                with span('watch.atlas'):
+                    update_atlas(self.atlas, {wheel_image for _, wheel_image in results if wheel_image} | wheel_images,
+                                 self.workers)
+            except OSError as e:
+                # the arcade decodes the images itself instead
+                print(f"Could not update the thumbnail atlas: {e}")
+        batch = ScanBatch(results, removed, sorted(wheel_images), self.last_batch_id + 1)
+        if results or removed or wheel_images:
+            self.last_batch_id = batch.batch_id
+            # copies of the entries, since later batches change entries in place
+            self.manifest_copies[batch.batch_id] = {name: dict(entry) for name, entry in self.manifest.entries.items()}
+        return batch
+
+    def _affected_tables(self, table_paths):
+        """
+        :return: vpx_file_names of every table that may have been added, changed or removed.
+        """
+        names = set()
+        for file_path in table_paths:
+            relative = os.path.relpath(file_path, self.table_root).replace(os.sep, '/')
+            if file_path.lower().endswith('.vpx'):
+                names.add(relative)
+                continue
+            if os.path.isfile(file_path):
+                # sidecars and anything else that isn't a table
+                continue
+            # a folder that was added, moved or deleted: the tables that were in it and the ones in it now
+            if relative == '.':
+                names.update(self.manifest.entries)
+                prefix = ''
+            else:
+                names.update(name for name in self.manifest.entries if name.startswith(relative + '/'))
+                prefix = relative + '/'
+            if os.path.isdir(file_path):
+                try:
+                    names.update(prefix + table.vpx_file_name for table in discover_tables(file_path))
+                except OSError as e:
+                    print(e)
+        return names
+
+    def _scan_tables(self, names):
+        to_scan = []
+        removed = []
+        for vpx_table in sorted(names):
+            try:
+                stat_result = os.stat(os.path.join(self.table_root, vpx_table))
+            except FileNotFoundError:
+                removed.append(vpx_table)
+                self.manifest.remove(vpx_table)
+                continue
+            except OSError as e:
+                print(f"Could not read {vpx_table}: {e}")
+                continue
+            if self.manifest.is_unchanged(vpx_table, stat_result):
+                continue
+            to_scan.append((vpx_table, stat_result))
+
+        table_args = []
+        for vpx_table, _ in to_scan:
+            my_args = copy.copy(self.args)
+            my_args.vpx_table = vpx_table
+            my_args.sidecars = sidecars_for(self.table_root, vpx_table)
+            # only a table the manifest has never seen can be one that was renamed or moved
+            my_args.metadata_lookup = self.manifest.get(vpx_table) is None
+            table_args.append(my_args)
+
+        results = []
+        # with scantables.py's timeout and retries, so a broken table can't stall the watcher
+        collect = partial(collect_with_retries, wheel_index=self.wheel_index, pup_lookup=self.pup_lookup,
+                          metadata_cache=self.metadata_cache)
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            with span('watch.scan'):
+                futures = [executor.submit(collect, my_args) for my_args in table_args]
+                for (vpx_table, stat_result), future in zip(to_scan, futures):
+                    # the arcade is closing, the tables left are picked up by the next scan
+                    if self.stopped.is_set():
+                        break
+                    outcome = future.result()
+                    if outcome.result is not None:
+                        table_info, wheel_image = outcome.result
+                        self.manifest.record(vpx_table, stat_result, table_info, wheel_image)
+                        results.append(outcome.result)
+        finally:
+            # tables that haven't started yet are dropped once stopped
+            executor.shutdown(wait=not self.stopped.is_set(), cancel_futures=True)
+        return results, removed
+
+    def _rematch_wheels(self):
+        """
+        Re-lists the wheel images and matches again the tables that now have a wheel image named like
+        them, and the ones that have no wheel image or whose image is gone.
+
+        :return: (table_info, wheel_image) for every table that got a different wheel image.
+        """
+        self.wheel_index = WheelIndex.from_directory(self.wheel_root)
+        results = []
+        for vpx_table, entry in self.manifest.entries.items():
+            table_file_name = os.path.basename(vpx_table)
+            year, name, _ = parse_filename(table_file_name)
+            if year is None or name is None:
+                # find_closest_match would skip it too, with a message every time
+                continue
+            # a newly added wheel named after the table beats whatever fuzzy match it had
+            wheel_image = self.wheel_index.exact_match(name)
+            if wheel_image is None:
+                if entry['wheel_image'] and os.path.exists(os.path.expanduser(entry['wheel_image'])):
+                    continue
+                wheel_image = find_closest_match(table_file_name, self.wheel_index)
+            # scantables.py may have written the same image as ~/..., and the library only keeps the file name
+            if _file_name(wheel_image) == _file_name(entry['wheel_image']):
+                continue
+            if wheel_image and not self.args.no_thumbnails:
+                ensure_thumbnail(wheel_image, self.args.thumbnail_cache)
+            entry['wheel_image'] = wheel_image
+            self.manifest.dirty = True
+            results.append((dict(entry['table_info']), wheel_image))
+        return results
+
+    def save(self, batch_id):
+        """
+        Saves the manifest as it was when batch batch_id was made. Batches are applied in order, so
+        copies for that batch and the ones before it are done with.
+        """
+        entries = self.manifest_copies.get(batch_id)
+        for applied in [applied for applied in self.manifest_copies if applied <= batch_id]:
+            del self.manifest_copies[applied]
+        try:
+            if entries is not None:
+                manifest = ScanManifest(self.manifest.manifest_path)
+                manifest.entries = entries
+                manifest.dirty = True
+                manifest.save()
+            if self.metadata_cache is not None:
+                self.metadata_cache.save()
+        except OSError as e:
+            print(f"Could not save the scan manifest: {e}")
+
+
+class LibraryWatcher(QObject):
+    """
+    Watches the tables and wheel image folders from a background thread and emits batchReady(ScanBatch)
+    on the GUI thread for every settled burst of changes. Call batchApplied(batch.batch_id) once the batch is in
+    the library and the library has been written.
+    """
+
+    batchReady = Signal(object)
+
+    def __init__(self, config_settings, mode='auto', debounce_seconds=DEFAULT_DEBOUNCE_SECONDS, parent=None):
+        super().__init__(parent)
+        self.config_settings = dict(config_settings)
+        self.mode = mode
+        self.debounce_seconds = debounce_seconds
+        self._stop = threading.Event()
+        self._save_requested = threading.Event()
+        # id of the last batch the arcade applied
+        self._applied_batch_id = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='library-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the thread. A scan in progress stops after the tables being read; the GUI thread
+        waits at most STOP_TIMEOUT_SECONDS for that.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(STOP_TIMEOUT_SECONDS)
+            self._thread = None
+
+    def batchApplied(self, batch_id):
+        self._applied_batch_id = batch_id
+        self._save_requested.set()
+
+    def _run(self):
+        # the manifest, puplookup.csv and the folder walk for the watches are loaded here rather than
+        # on the GUI thread, so they don't hold up the arcade opening
+        try:
+            scanner = IncrementalScanner(self.config_settings, stopped=self._stop)
+            watcher = create_watcher([scanner.table_root, scanner.wheel_root], self.mode)
+        except OSError as e:
+            print(f"Not watching the tables folder for changes: {e}")
+            return
+        debouncer = Debouncer(self.debounce_seconds)
+        try:
+            while not self._stop.is_set():
+                debouncer.add(watcher.read_changes(0.5))
+                if watcher.overflowed:
+                    # too many changes at once for inotify to list, look at everything
+                    watcher.overflowed = False
+                    debouncer.add({scanner.table_root, scanner.wheel_root})
+                paths = debouncer.take()
+                if paths:
+                    try:
+                        batch = scanner.scan(paths)
+                    except Exception as e:
+                        # keep watching; the next change or scantables.py will pick the tables up
+                        print(f"Could not scan changed tables: {e}")
+                        batch = None
+                    if self._stop.is_set():
+                        # scanned only in part, and nothing is left to apply it
+                        break
+                    if batch is not None and (batch.results or batch.removed or batch.wheel_images):
+                        self.batchReady.emit(batch)
+                if self._save_requested.is_set():
+                    self._save_requested.clear()
+                    scanner.save(self._applied_batch_id)
+        finally:
+            watcher.close()
+            if self._save_requested.is_set():
+                scanner.save(self._applied_batch_id)
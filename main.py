@@ -1,164 +1,88 @@
-from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                               QPushButton, QLabel, QLineEdit, QScrollArea, QGridLayout,
-                               QFileDialog, QTabWidget, QTableWidget, QTableWidgetItem, QTextEdit,
-                               QCheckBox)
-from PySide6.QtGui import QPixmap, QFont
-from PySide6.QtCore import QSize
-from pathlib import Path
+import time
+# startup timing starts before the Qt imports, which are a good part of it
+_startup_began = time.perf_counter()
+
+from PySide6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLineEdit
+from PySide6.QtCore import QEventLoop, QTimer
+import argparse
 import csv
 import sys
 import os
-import subprocess
 from subprocess import Popen
 import json
-
-
-# Read the configuration file config.csv and store the settings in a dictionary
-# if config.csv does not exist, call configure.py to create it and wait for it to finish before proceeding to read the config.csv
-if not os.path.exists('config.csv'):
-    # Start configure.py blocking
-    subprocess.run(['python', 'configure.py'])
-    # Wait for configure.py to finish. Continue running in the background
-    # once it completes, read the config.csv
-
-# use this logic to read the config.csv file once it exists
-config_settings = {}
-display_name_dict = {}  # Renamed to avoid confusion with the variable inside the loop
-with open('config.csv', mode='r', newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        config_item = row['config_item']
-        label = row['label']
-        value = row['value']
-        description = row['description']  # Assuming you might want to use this later
-        config_settings[config_item] = value
-        display_name_dict[config_item] = label
-
-with open('ffiend.csv', newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    games_data = sorted(reader, key=lambda row: (-int(row.get('favorite', '0')), row['display_name'].lower()))
-
-
-# Read the games data file and sort by the 5th column (column 4 if zero-indexed)
-with open('ffiend.csv', newline='') as csvfile:
-    reader = csv.DictReader(csvfile)
-    games_data = sorted(reader, key=lambda row: (-int(row.get('favorite') or '0'), row['display_name'].lower()))
-
-
-# Now, games_data is sorted based on the values in the 5th column
-
-class ArcadeTile(QWidget):
-    def __init__(self, game_data, config_settings, display_name_dict):
-        super().__init__()
-        self.game_data = game_data
-        self.config_settings = config_settings
-        # if the img file is not found, use "defaultimg.png"
-        if not self.game_data.get('image_file'):
-            self.game_data['image_file'] = 'defaultimg.png'
-        self.initUI()
-    
-
-    def initUI(self):
-        # Vertical layout for each tile
-        layout = QVBoxLayout()
-
-        # Determine the image path
-        image_file_name = self.game_data.get('image_file', 'defaultimg.png')
-        image_path = Path(self.config_settings['wheelimage_file_path']) / image_file_name
-
-        # Game Image
-        pixmap = QPixmap(str(image_path))
-        lbl_img = QLabel(self)
-        lbl_img.setPixmap(pixmap.scaled(200, 200))
-        layout.addWidget(lbl_img)
-
-        # Game Title
-        display_name = self.game_data.get('display_name')
-        # if display_name is empty or not set, use the file name without extension as fallback
-        
-        if not display_name:
-            # Extract file name without extension from 'vpx_file_name'
-            display_name = Path(self.game_data.get('vpx_file_name', '')).stem
-        # else if display_name is == "[not set]", use the file name without extension as fallback
-        elif display_name == "[not set]":
-            # Extract file name without extension from 'vpx_file_name'
-            display_name = Path(self.game_data.get('vpx_file_name', '')).stem
-        lbl_title = QLabel(display_name)
-        lbl_title.setFont(QFont("Arial", 14))
-        layout.addWidget(lbl_title)
-
-        # Favorite Button
-        # update the next line to show the star in yellow if the game is a favorite, grey if not
-        self.btn_favorite = QPushButton('★' if self.game_data['favorite'] == '1' else '☆')
-        self.btn_favorite.clicked.connect(self.toggleFavorite)
-        layout.addWidget(self.btn_favorite)
-        self.setLayout(layout)
-
-    def executeShellCommand(self):
-        # Use .get() to avoid KeyError and provide a default value if the key is missing
-        vpx_file_path = Path(self.config_settings.get('vpx_table_path')) / self.game_data['vpx_file_name']
-        # print the path to the console
-        print(f"Running table: {vpx_file_path}")
-        # vpx_app path should be self.config_settings.get('vpx_app') with /Contents/MacOS/VPinballX_GL appended
-        vpx_app_path = Path(self.config_settings.get('vpx_app')) / 'Contents/MacOS/VPinballX_GL'
-
-        #vpx_app_path = Path(self.config_settings.get('vpx_app'
-        
-        table_name = self.game_data['vpx_file_name']
-        vpx_script_name = table_name.split('.')[0] + '.vbs'
-        
-        # if a matching vbs file exists, use it to run the table
-        command = [str(vpx_app_path), '-Play', str(vpx_file_path), '-TableIni', str(vpx_script_name)]
-        # print the command to the console
-        print(f'{command}')
-        try:
-            subprocess.run(command, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"An error occurred while trying to run the game: {e}")
-
-    def updateData(self, game_data):
-        self.game_data = game_data
-        # Update the wheel image
-        image_file_name = self.game_data['image_file']
-        image_path = (Path(self.config_settings['image_file_path']) / image_file_name) if image_file_name else Path('defaultimg.png')
-        pixmap = QPixmap(str(image_path))
-        self.lbl_img.setPixmap(pixmap.scaled(200, 200))  # Assuming self.lbl_img is the QLabel for the image
-    
-    def mousePressEvent(self, event):
-        # You can check the type of mouse click here, if necessary (e.g., right-click, left-click)
-        self.executeShellCommand()
-
-    
-    def toggleFavorite(self):
-        # Toggle the in-memory favorite status
-        new_favorite_status = '1' if self.game_data['favorite'] == '0' else '0'
-        self.game_data['favorite'] = new_favorite_status
-
-        # Update the CSV file
-        games_data = []
-        with open('ffiend.csv', mode='r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row['vpx_file_name'] == self.game_data['vpx_file_name']:
-                    row['favorite'] = new_favorite_status
-                games_data.append(row)
-
-        with open('ffiend.csv', mode='w', newline='') as file:
-            fieldnames = reader.fieldnames
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(games_data)
-
-        # Update the UI to reflect the change
-        self.btn_favorite.setText('★' if self.game_data['favorite'] == '1' else '☆')
+from arcade_view import ArcadeGridView, GameListModel, display_title
+import perf
+from launcher import TableLauncher
+from library import open_library
+from library_watcher import LibraryWatcher
+from prefetch import DEFAULT_BUDGET_MB_PER_SECOND, TablePrefetcher
+from search_index import SearchIndex
+
+
+# How long after the last favorite toggle the journal is compacted into ffiend.csv
+LIBRARY_COMPACT_DELAY_MS = 2000
+
+
+def load_config(config_path='config.csv'):
+    """
+    Reads config.csv.
+
+    :return: Tuple of (settings, labels), both dictionaries keyed by config_item.
+    """
+    config_settings = {}
+    display_name_dict = {}  # Renamed to avoid confusion with the variable inside the loop
+    with open(config_path, mode='r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            config_item = row['config_item']
+            config_settings[config_item] = row['value']
+            display_name_dict[config_item] = row['label']
+    return config_settings, display_name_dict
+
+
+def open_configurator(config_settings):
+    """
+    Opens the preferences window in this process. configure.py is only imported when it's needed.
+
+    :return: The Configurator window, already shown. Its closed signal fires when the user is done.
+    """
+    from configure import Configurator
+    configurator = Configurator(dict(config_settings))
+    configurator.show()
+    return configurator
+
+
+class StartupTimer:
+    """
+    Collects how long each step of startup took and prints them once the first frame is on screen.
+    Each step is also recorded as a launcher.<step> timing span.
+    """
+
+    def __init__(self, began):
+        self.began = began
+        self.last = began
+        self.steps = []
+
+    def mark(self, step, **fields):
+        now = time.perf_counter()
+        self.steps.append((step, now - self.last))
+        perf.record('launcher.' + step.replace(' ', '_'), now - self.last, **fields)
+        self.last = now
+
+    def report(self):
+        total = time.perf_counter() - self.began
+        breakdown = ', '.join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in self.steps)
+        print(f"Startup took {total * 1000:.0f} ms: {breakdown}")
 
 
 class ArcadeWindow(QMainWindow):
-    def __init__(self, config_settings, games_data, display_name):
+    def __init__(self, config_settings, games_data, display_name, library):
         super().__init__()
         self.config_settings = config_settings
         self.games_data = games_data
         self.display_name = display_name  # Assuming you want to use display_name for something
+        self.library = library
+        self.configurator = None
         self.initUI()
 
     def initUI(self):
@@ -175,8 +99,12 @@ class ArcadeWindow(QMainWindow):
         btn_game_manager = QPushButton('Game Manager')
         # when the button is pressed, open game_manager.py
         def open_game_manager_and_exit():
+            # write pending favorites to ffiend.csv first so the game manager sees them
+            self.stopLibraryWatcher()
+            self.stopPrefetcher()
+            self.library.close()
             # Start game_manager.py non-blocking
-            Popen(['python', 'game_manager.py', json.dumps(config_settings)])
+            Popen(['python', 'game_manager.py', json.dumps(self.config_settings)])
             # Exit main.py
             sys.exit()
         btn_game_manager.clicked.connect(open_game_manager_and_exit)
@@ -187,57 +115,265 @@ class ArcadeWindow(QMainWindow):
 
         # Preferences Button
         btn_preferences = QPushButton('Preferences')
-        def open_configure_and_wait():
-            # Start configure.py blocking
-            subprocess.run(['python', 'configure.py'])
-            # Wait for configure.py to finish. Continue running in the background
-            # once it completes, re-read the config.csv
-            with open('config.csv', mode='r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    config_item = row['config_item']
-                    label = row['label']
-                    value = row['value']
-                    description = row['description']
-                    config_settings[config_item] = value
-                    display_name_dict[config_item] = label
-
-            # refresh the main window if anything changed
-            self.refreshData(games_data)
-
-
-    
-        btn_preferences.clicked.connect(open_configure_and_wait)
+        def open_configure():
+            # The preferences window runs in this process and doesn't block the arcade.
+            # Once it closes, re-read config.csv and refresh the main window
+            if self.configurator is not None:
+                self.configurator.raise_()
+                return
+            self.configurator = open_configurator(self.config_settings)
+            self.configurator.closed.connect(self.preferencesClosed)
+
+        btn_preferences.clicked.connect(open_configure)
         layout.addWidget(btn_preferences)
 
-        # Scroll Area for Game Tiles
-        scroll_area = QScrollArea()
-        scroll_widget = QWidget()
-        scroll_layout = QGridLayout(scroll_widget)
-        scroll_widget.setLayout(scroll_layout)
-
-        # Create a tile for each game
-        for i, game_data in enumerate(self.games_data):
-            # tile should have a reference to the game data, config settings, and display name
-            tile = ArcadeTile(game_data, self.config_settings, self.display_name)
-            scroll_layout.addWidget(tile, i // 4, i % 4)  # 4 columns per row
-
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(scroll_widget)
-        layout.addWidget(scroll_area)
-
+        # Search box. Filters the grid on every keystroke through a trigram index of the library
+        self.search_index = SearchIndex().build(self.games_data)
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText('Search by name, manufacturer, year or theme')
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.applySearch)
+        self.search_box.returnPressed.connect(self.focusFirstResult)
+        layout.addWidget(self.search_box)
+
+        # Grid of game tiles. Only the tiles on screen are painted, so this is quick to build
+        # no matter how big the library is
+        self.games_model = GameListModel(self.games_data, self)
+        self.grid_view = ArcadeGridView(self.games_model, self.config_settings)
+        self.grid_view.launchRequested.connect(self.launchGame)
+        self.grid_view.favoriteToggled.connect(self.toggleFavorite)
+        layout.addWidget(self.grid_view)
+
+        # Favorites are journaled and written to ffiend.csv once clicking stops for a couple of seconds
+        self.compact_timer = QTimer(self)
+        self.compact_timer.setSingleShot(True)
+        self.compact_timer.setInterval(LIBRARY_COMPACT_DELAY_MS)
+        self.compact_timer.timeout.connect(self.library.flush)
+
+        # VPX runs as a child process watched from the event loop, launches are logged to launch_log.csv
+        self.launcher = TableLauncher(self.config_settings, parent=self)
+        self.launcher.launchFinished.connect(self.launchFinished)
+
+        # Tables and wheel images added, replaced or removed while the arcade is open show up on their own
+        self.library_watcher = None
+        self.startLibraryWatcher()
+
+        # The table under the mouse or selected is read into memory ahead of being launched. Nothing
+        # is prefetched while a table is being played, VPX has the disk to itself
+        self.prefetcher = None
+        self.startPrefetcher()
+        self.grid_view.tableFocused.connect(self.focusTable)
+        self.launcher.launchStarted.connect(lambda game_data: self.pausePrefetcher(True))
+        self.launcher.launchFinished.connect(lambda game_data, record: self.pausePrefetcher(False))
+
+    def startLibraryWatcher(self):
+        # watch_library in config.csv: auto (inotify on Linux, polling elsewhere), inotify, poll or off
+        if self.library_watcher is not None:
+            self.library_watcher.stop()
+            self.library_watcher = None
+        mode = self.config_settings.get('watch_library') or 'auto'
+        if mode == 'off':
+            return
+        self.library_watcher = LibraryWatcher(self.config_settings, mode, parent=self)
+        self.library_watcher.batchReady.connect(self.applyScanBatch)
+        self.library_watcher.start()
+
+    def stopLibraryWatcher(self):
+        if self.library_watcher is not None:
+            self.library_watcher.stop()
+            self.library_watcher = None
+
+    def startPrefetcher(self):
+        # prefetch_budget_mb in config.csv: MB per second read ahead of launching, 0 turns it off
+        self.stopPrefetcher()
+        try:
+            budget_mb = float(self.config_settings.get('prefetch_budget_mb') or DEFAULT_BUDGET_MB_PER_SECOND)
+        except ValueError:
+            budget_mb = DEFAULT_BUDGET_MB_PER_SECOND
+        if budget_mb <= 0:
+            return
+        self.prefetcher = TablePrefetcher(self.config_settings.get('vpx_table_path', ''), int(budget_mb * 1024 * 1024))
+        self.prefetcher.pause(self.launcher.isRunning())
+        self.prefetcher.start()
+        self.focusTable(self.grid_view.focused_game)
+
+    def stopPrefetcher(self):
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def pausePrefetcher(self, paused):
+        if self.prefetcher is not None:
+            self.prefetcher.pause(paused)
+
+    def focusTable(self, game_data):
+        if self.prefetcher is not None:
+            self.prefetcher.focus(game_data['vpx_file_name'] if game_data is not None else None)
+
+    def applySearch(self, text):
+        # show the tables matching the search, in arcade order
+        keys = self.search_index.search(text)
+        self.games_model.setGames(self.visibleGames(keys))
+
+    def visibleGames(self, keys):
+        # the model gets its own list, so the row-level updates in applyLibraryChanges don't touch games_data
+        if keys is None:
+            return list(self.games_data)
+        return [game for game in self.games_data if game['vpx_file_name'] in keys]
+
+    def focusFirstResult(self):
+        # Enter in the search box moves to the first matching tile, Enter again launches it
+        if self.games_model.rowCount() > 0:
+            self.grid_view.setCurrentIndex(self.games_model.index(0))
+            self.grid_view.setFocus()
+
+    def preferencesClosed(self):
+        self.configurator = None
+        config_settings, display_name_dict = load_config()
+        # update in place, the grid view and launcher hold on to the same dictionary
+        self.config_settings.update(config_settings)
+        self.display_name.update(display_name_dict)
+        # refresh the main window if anything changed
+        self.refreshData(self.games_data)
+        # the tables or wheel image folder may have moved
+        self.startLibraryWatcher()
+        self.startPrefetcher()
+
+    def launchGame(self, game_data):
+        # Starts the table and returns right away, the arcade stays responsive while it is played.
+        # A second launch while a table is still running is ignored
+        if self.launcher.launch(game_data):
+            self.statusBar().showMessage(f"Playing {display_title(game_data)}")
+
+    def launchFinished(self, game_data, record):
+        self.statusBar().showMessage(
+            f"{display_title(game_data)} exited ({record['exit_status']}) after {record['session_seconds'] or 0} s", 5000)
+
+    def toggleFavorite(self, row):
+        game_data = self.games_model.game(row)
+        # Toggle the in-memory favorite status. New tables start with an empty favorite, which counts as not a favorite
+        new_favorite_status = '0' if game_data.get('favorite') == '1' else '1'
+        game_data['favorite'] = new_favorite_status
+
+        # Save just this table's favorite flag in the library. This only appends to the journal;
+        # ffiend.csv is rewritten when the compact timer runs out
+        self.library.set_field(game_data['vpx_file_name'], 'favorite', new_favorite_status)
+        self.compact_timer.start()
+
+        # Repaint the tile to show the new star
+        self.games_model.refreshRow(row)
+
+    def applyScanBatch(self, batch):
+        # a settled burst of changes to the tables or wheel image folders, scanned by the library watcher
+        changed_keys = set()
+        for table_info, wheel_image in batch.results:
+            self.library.apply_scan_result(table_info, wheel_image)
+            changed_keys.add(table_info['path'])
+        removed = 0
+        for vpx_file_name in batch.removed:
+            if self.library.flag_missing(vpx_file_name):
+                changed_keys.add(vpx_file_name)
+                removed += 1
+        self.library.flush()
+        # only now may the watcher save its scan manifest, like a scantables.py run
+        if self.library_watcher is not None:
+            self.library_watcher.batchApplied(batch.batch_id)
+
+        # the watcher has put the new wheel images in the thumbnail atlas by now
+        self.grid_view.tile_delegate.image_loader.refreshAtlas()
+        for image_path in batch.wheel_images:
+            self.grid_view.tile_delegate.image_loader.invalidate(image_path)
+        if changed_keys:
+            self.applyLibraryChanges(changed_keys)
+        self.grid_view.viewport().update()
+        if batch.results or removed:
+            self.statusBar().showMessage(f"Library updated: {len(batch.results)} tables added or changed, "
+                                         f"{removed} removed", 5000)
+
+    def applyLibraryChanges(self, changed_keys):
+        # re-sort the arcade and re-index only the changed tables, then move just their tiles
+        self.games_data = self.library.arcade_rows()
+        for key in changed_keys:
+            row = self.library.get(key)
+            if row is None or row.get('show_in_arcade') == '0':
+                self.search_index.remove(key)
+            else:
+                self.search_index.update(row)
+        keys = self.search_index.search(self.search_box.text())
+        self.games_model.updateGames(self.visibleGames(keys), changed_keys)
 
     # update arcade view when manage games signals a change
     def refreshData(self, games_data):
         self.games_data = games_data  # Update the games_data
-        for i, game_data in enumerate(self.games_data):
-            if i < len(self.tiles):  # Check if the tile already exists
-                self.tiles[i].updateData(game_data)  # Update the tile data
+        # settings such as the wheel image folder may have changed, so drop the cached images too
+        self.grid_view.tile_delegate.clearCache()
+        # only rows whose searched fields changed are re-indexed
+        current_keys = {game['vpx_file_name'] for game in self.games_data}
+        for key in set(self.search_index.texts) - current_keys:
+            self.search_index.remove(key)
+        for game in self.games_data:
+            self.search_index.update(game)
+        self.applySearch(self.search_box.text())
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Flipper Fiend arcade launcher.')
+    perf.add_arguments(parser)
+    # anything else is left for Qt, e.g. -platform
+    return parser.parse_known_args()
+
+
+def main():
+    timer = StartupTimer(_startup_began)
+    args, qt_args = parse_arguments()
+    profiler = perf.start(args)
+    try:
+        timer.mark('imports')
+        app = QApplication(sys.argv[:1] + qt_args)
+        timer.mark('qt')
+
+        # if config.csv does not exist, show the preferences window to create it and wait for it to close
+        if not os.path.exists('config.csv'):
+            # closing the preferences window mustn't quit the application before the arcade opens
+            app.setQuitOnLastWindowClosed(False)
+            loop = QEventLoop()
+            configurator = open_configurator({})
+            configurator.closed.connect(loop.quit)
+            loop.exec()
+            app.setQuitOnLastWindowClosed(True)
+            if not os.path.exists('config.csv'):
+                print("No configuration saved, exiting")
+                return 1
+        config_settings, display_name_dict = load_config()
+        timer.mark('config')
+
+        # Open the game library. ffiend.csv by default, read through its snapshot when it hasn't changed
+        # since the last start and with any journaled changes from a crashed run replayed, or the SQLite
+        # database when config.csv sets library_backend to sqlite.
+        library = open_library(config_settings.get('library_backend') or 'csv', snapshot=True, journal=True)
+        # journaled changes still waiting for the compact timer are written on the way out
+        app.aboutToQuit.connect(library.close)
+        # Tables shown in the arcade, favorites first and then by display name.
+        # Tables hidden with show_in_arcade = 0 (for example ones scantables.py no longer finds on disk)
+        # are left out
+        games_data = library.arcade_rows()
+        timer.mark('library', snapshot=getattr(library, 'loaded_from_snapshot', False))
+
+        # Initialize the application with the read configuration and display name
+        mainWin = ArcadeWindow(config_settings, games_data, display_name_dict, library)
+        mainWin.show()
+        # after library.close, so the watcher's last manifest save comes after the last library write
+        app.aboutToQuit.connect(mainWin.stopLibraryWatcher)
+        app.aboutToQuit.connect(mainWin.stopPrefetcher)
+        timer.mark('window')
+        # runs once the event loop has painted the first frame
+        QTimer.singleShot(0, lambda: (timer.mark('first frame'), timer.report()))
+        return app.exec()
+    finally:
+        # span summary (config, library, window, image decodes, launches) and --profile output,
+        # also when no configuration was saved and the arcade never opened
+        perf.finish(args, profiler, 'launcher.')
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    # Initialize the application with the read configuration and display name
-    mainWin = ArcadeWindow(config_settings, games_data, display_name_dict)
-    mainWin.show()
-    sys.exit(app.exec())
+    sys.exit(main())
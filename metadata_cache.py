@@ -0,0 +1,158 @@
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+
+# #######################################
+# Parsed table metadata, keyed by what's in the .vpx file rather than by its name.
+#
+# The scan manifest is keyed by vpx_file_name, so renaming a table or moving it into a subfolder
+# makes it look new and vpxtool reads it again. This cache is keyed by a fingerprint of the file's
+# contents instead, so a table that was only renamed or moved gets its metadata back without being
+# read. The fingerprint is the file size plus a hash of its first and last block: two small reads,
+# however big the table is. --full-hash hashes the whole file instead, for the paranoid.
+#
+# The cache is kept under a size limit by dropping the least recently used entries.
+
+METADATA_CACHE_FILE_NAME = 'metadata_cache.json'
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+# How much of the start and the end of the file the quick fingerprint reads
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+# Read size for --full-hash
+FULL_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def metadata_cache_path_for(csv_path):
+    """
+    The metadata cache lives next to ffiend.csv, like the scan manifest.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), METADATA_CACHE_FILE_NAME)
+
+
+def fingerprint(file_path, full=False, block_size=FINGERPRINT_BLOCK_SIZE):
+    """
+    :param file_path: Path to the table file.
+    :param full: Hash the whole file instead of its first and last block.
+    :return: Fingerprint string, or None for an empty file, which has nothing to tell it apart.
+             Quick and full fingerprints of the same file differ, so the two never mix in the cache.
+    """
+    digest = blake2b(digest_size=16)
+    with open(file_path, mode='rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return None
+        digest.update(size.to_bytes(8, 'little'))
+        if full:
+            for chunk in iter(lambda: file.read(FULL_HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+            return f"full:{digest.hexdigest()}"
+        digest.update(file.read(block_size))
+        # small files are covered by the first block already
+        if size > block_size:
+            file.seek(max(block_size, size - block_size))
+            digest.update(file.read(block_size))
+    return f"quick:{size}:{digest.hexdigest()}"
+
+
+class MetadataCache:
+    """
+    table_info dictionaries keyed by fingerprint, least recently used first. get() and put() are
+    called from the scanner's worker threads, so they take a lock.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_path, max_bytes=DEFAULT_MAX_BYTES, full_hash=False):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.full_hash = full_hash
+        # fingerprint -> (table_info, size of its JSON in bytes)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the cache from disk. A missing or unreadable cache just means every table is read again.
+        """
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        try:
+            with open(self.cache_path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == self.VERSION:
+                # saved least recently used first, so the order carries over
+                for key, table_info in data.get('tables', []):
+                    self._insert(key, table_info)
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError, TypeError) as e:
+            print(f"Ignoring unreadable metadata cache {self.cache_path}: {e}")
+        self._evict()
+        self.dirty = False
+        return self
+
+    def fingerprint(self, file_path):
+        return fingerprint(file_path, full=self.full_hash)
+
+    def get(self, key):
+        """
+        :return: A copy of the table_info cached for key, or None.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            # the order changed, which is worth saving so eviction keeps the tables still in use
+            self.dirty = True
+            return dict(entry[0])
+
+    def put(self, key, table_info):
+        # 'path' is the table's name at the time it was read, which is exactly what may change
+        table_info = {field: value for field, value in table_info.items() if field != 'path'}
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._insert(key, table_info)
+            self._evict()
+            self.dirty = True
+
+    def _insert(self, key, table_info):
+        size = len(json.dumps(table_info))
+        self.entries[key] = (table_info, size)
+        self.total_bytes += size
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+
+    def save(self):
+        """
+        Writes the cache through a temp file and rename, like ScanManifest.save().
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            tables = [[key, table_info] for key, (table_info, _) in self.entries.items()]
+            self.dirty = False
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.metadata_cache-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as file:
+                json.dump({'version': self.VERSION, 'tables': tables}, file)
+            os.replace(tmp_path, self.cache_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.dirty = True
+            raise
@@ -0,0 +1,205 @@
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# #######################################
+# Timing spans and profiling for the scanner and the launcher.
+#
+# Code marks the steps worth timing with `with span('scan.vpxtool', table=vpx_table):`. Every
+# span is added to a per-name count/total/max, and with JSON lines turned on it is also written
+# out as one line per span. Spans are cheap enough to leave in for every run: two
+# perf_counter() calls and a lock.
+#
+# --profile runs the whole command under cProfile. Before Python 3.12 a profiler only sees the
+# thread that enabled it, so worker threads get their own profiler and everything is merged at the
+# end. From 3.12 on cProfile hooks into sys.monitoring, which profiles every thread and allows only
+# one active profiler, so the main thread's profiler is the only one.
+
+DEFAULT_SPANS_FILE = 'perf_spans.jsonl'
+# Whether one cProfile.Profile covers every thread; a second one enabled alongside it raises ValueError
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+class SpanRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # span name -> [count, total seconds, max seconds]
+        self.totals = {}
+        self._jsonl_file = None
+
+    def enableJsonLines(self, jsonl_path):
+        self._jsonl_file = open(jsonl_path, mode='a', encoding='utf-8')
+
+    def close(self):
+        if self._jsonl_file is not None:
+            self._jsonl_file.close()
+            self._jsonl_file = None
+
+    def record(self, name, seconds, **fields):
+        with self._lock:
+            stats = self.totals.get(name)
+            if stats is None:
+                self.totals[name] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+            if self._jsonl_file is not None:
+                line = {'span': name, 'ms': round(seconds * 1000, 3), 'at': round(time.time(), 3),
+                        'thread': threading.current_thread().name}
+                line.update(fields)
+                self._jsonl_file.write(json.dumps(line) + '\n')
+
+    @contextmanager
+    def span(self, name, **fields):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - began, **fields)
+
+    def summary(self, prefix=''):
+        """
+        :return: The spans whose names start with prefix as a table, longest total first.
+        """
+        with self._lock:
+            rows = sorted(((name, stats) for name, stats in self.totals.items() if name.startswith(prefix)),
+                          key=lambda item: item[1][1], reverse=True)
+        lines = [f"{'span':<28} {'count':>8} {'total ms':>11} {'avg ms':>9} {'max ms':>9}"]
+        for name, (count, total, longest) in rows:
+            lines.append(f"{name:<28} {count:>8} {total * 1000:>11.1f} {total / count * 1000:>9.2f} {longest * 1000:>9.2f}")
+        return '\n'.join(lines)
+
+
+def percentile(sorted_values, percent):
+    """
+    :param sorted_values: Values sorted from low to high.
+    :param percent: 0 to 100.
+    :return: The nearest-rank percentile of sorted_values, or 0.0 if there are none.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# One recorder for the whole process, so any module can add spans without passing it around
+RECORDER = SpanRecorder()
+span = RECORDER.span
+record = RECORDER.record
+
+# The Profiler started by start(), if --profile was given
+_active_profiler = None
+
+
+class Profiler:
+    """
+    cProfile for the main thread plus every thread that runs work through wrap(), or for every
+    thread at once from Python 3.12 on.
+    """
+
+    def __init__(self):
+        self.main_profile = cProfile.Profile()
+        self._thread_profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.main_profile.enable()
+
+    def wrap(self, function):
+        """
+        :return: function, profiled on whatever thread calls it.
+        """
+        if PROFILER_SEES_ALL_THREADS:
+            # main_profile already records it
+            return function
+
+        def profiled(*args, **kwargs):
+            if threading.current_thread() is threading.main_thread():
+                # already covered by main_profile, and a thread can only run one profiler at a time
+                return function(*args, **kwargs)
+            profile = getattr(self._local, 'profile', None)
+            if profile is None:
+                profile = self._local.profile = cProfile.Profile()
+                with self._lock:
+                    self._thread_profiles.append(profile)
+            profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+        return profiled
+
+    def stop(self, output_path, top=30):
+        """
+        Writes the merged stats to output_path (open it with pstats or snakeviz) and prints the
+        top functions by cumulative time.
+        """
+        self.main_profile.disable()
+        stats = pstats.Stats(self.main_profile)
+        for profile in self._thread_profiles:
+            stats.add(profile)
+        stats.dump_stats(output_path)
+        report = io.StringIO()
+        pstats.Stats(output_path, stream=report).sort_stats('cumulative').print_stats(top)
+        print(report.getvalue())
+        print(f"Profile written to {output_path}")
+
+
+def add_arguments(parser):
+    """
+    Adds the --spans, --spans-file and --profile options to an argparse parser.
+    """
+    parser.add_argument('--spans', choices=['off', 'summary', 'jsonl'], default='summary',
+                        help='Print a summary of the timing spans at the end, or also write every span to '
+                             '--spans-file as JSON lines (default: summary)')
+    parser.add_argument('--spans-file', default=DEFAULT_SPANS_FILE,
+                        help=f'Where --spans jsonl writes spans (default: {DEFAULT_SPANS_FILE})')
+    parser.add_argument('--profile', metavar='PSTATS_FILE', default=None,
+                        help='Run under cProfile and write the stats to this file')
+
+
+def start(args):
+    """
+    Sets up spans and profiling from the parsed arguments.
+
+    :return: A Profiler if --profile was given, otherwise None.
+    """
+    global _active_profiler
+    if getattr(args, 'spans', 'off') == 'jsonl':
+        RECORDER.enableJsonLines(args.spans_file)
+    profiler = None
+    if getattr(args, 'profile', None):
+        profiler = Profiler()
+        profiler.start()
+    _active_profiler = profiler
+    return profiler
+
+
+def profile_worker(function):
+    """
+    :return: function wrapped to be profiled on worker threads while --profile is on, otherwise function itself.
+    """
+    return _active_profiler.wrap(function) if _active_profiler is not None else function
+
+
+def finish(args, profiler, prefix=''):
+    """
+    Prints the span summary and writes the profile, as chosen by the parsed arguments.
+    """
+    global _active_profiler
+    if profiler is not None:
+        profiler.stop(args.profile)
+        _active_profiler = None
+    if getattr(args, 'spans', 'off') != 'off' and RECORDER.totals:
+        print(RECORDER.summary(prefix))
+    if getattr(args, 'spans', 'off') == 'jsonl':
+        print(f"Spans written to {args.spans_file}")
+    RECORDER.close()
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import perf
+from table_discovery import sidecars_for
+
+# #######################################
+# Getting the focused table off the disk before it is launched.
+#
+# Most of the wait after launching a table is VPinballX_GL reading a 100-500 MB .vpx file. The
+# arcade tells TablePrefetcher which table is under the mouse or selected. Once the focus has
+# stayed on a tile for a moment, a background thread asks the OS to start reading the .vpx and its
+# .vbs, .ini and .directb2s sidecars into the page cache. On Linux and other platforms that have
+# posix_fadvise this is a POSIX_FADV_WILLNEED hint; elsewhere the files are read and the data
+# thrown away. Either way VPX finds the table already in memory when it opens it.
+#
+# An IoBudget keeps this from flooding the disk: at most budget bytes per second are hinted or read,
+# at most max_table_bytes of any one table, and only for one table at a time. Moving to another
+# tile drops the rest of the current one, tables warmed a moment ago aren't warmed again, and
+# nothing is prefetched while a table is being played.
+
+DEFAULT_BUDGET_MB_PER_SECOND = 64
+DEFAULT_MAX_TABLE_BYTES = 512 * 1024 * 1024
+# How long the focus has to stay on a tile before its table is warmed, so sweeping the mouse
+# across the grid doesn't warm every table it passes
+DEFAULT_DWELL_SECONDS = 0.3
+# Hinted or read at a time; also how often a change of focus is noticed
+PREFETCH_CHUNK_SIZE = 8 * 1024 * 1024
+# Read size where there is no posix_fadvise
+READ_BUFFER_SIZE = 1024 * 1024
+# Tables warmed this recently are assumed to be in the page cache still
+RECENT_SECONDS = 300
+RECENT_FILES = 64
+
+
+class IoBudget:
+    """
+    Token bucket of bytes: refills at bytes_per_second and holds at most one second's worth, so a
+    table the size of the budget starts warming at once and bigger ones are paced.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self.available = float(bytes_per_second)
+        self._refilled_at = time.monotonic()
+
+    def take(self, count, cancelled):
+        """
+        Waits until count bytes are available and takes them.
+
+        :param cancelled: threading.Event; the wait stops early when it is set.
+        :return: False if cancelled was set before the bytes were available.
+        """
+        while True:
+            now = time.monotonic()
+            self.available = min(float(self.bytes_per_second),
+                                 self.available + (now - self._refilled_at) * self.bytes_per_second)
+            self._refilled_at = now
+            # a chunk bigger than the whole bucket goes once the bucket is full
+            needed = min(count, self.bytes_per_second)
+            if self.available >= needed:
+                self.available -= count
+                return True
+            if cancelled.wait((needed - self.available) / self.bytes_per_second):
+                return False
+
+
+def warm_file(file_path, budget, cancelled, max_bytes=DEFAULT_MAX_TABLE_BYTES):
+    """
+    Gets the OS reading the start of file_path into the page cache, within budget.
+
+    :param cancelled: threading.Event that stops the warming part way through.
+    :return: Number of bytes hinted or read.
+    """
+    warmed = 0
+    with open(file_path, mode='rb', buffering=0) as file:
+        fd = file.fileno()
+        end = min(os.fstat(fd).st_size, max_bytes)
+        buffer = None
+        while warmed < end:
+            length = min(PREFETCH_CHUNK_SIZE, end - warmed)
+            if not budget.take(length, cancelled):
+                break
+            if hasattr(os, 'posix_fadvise'):
+                # returns once the reads are queued, the kernel does them in the background
+                os.posix_fadvise(fd, warmed, length, os.POSIX_FADV_WILLNEED)
+            else:
+                if buffer is None:
+                    buffer = memoryview(bytearray(READ_BUFFER_SIZE))
+                remaining = length
+                while remaining > 0:
+                    read = file.readinto(buffer[:min(READ_BUFFER_SIZE, remaining)])
+                    if not read:
+                        return warmed + length - remaining
+                    remaining -= read
+            warmed += length
+    return warmed
+
+
+class TablePrefetcher:
+    """
+    Warms the focused table's files from a background thread. focus() and pause() are called from
+    the GUI thread and never block.
+    """
+
+    def __init__(self, table_root, budget_bytes_per_second=DEFAULT_BUDGET_MB_PER_SECOND * 1024 * 1024,
+                 max_table_bytes=DEFAULT_MAX_TABLE_BYTES, dwell_seconds=DEFAULT_DWELL_SECONDS):
+        self.table_root = os.path.expanduser(table_root)
+        self.budget = IoBudget(budget_bytes_per_second)
+        self.max_table_bytes = max_table_bytes
+        self.dwell_seconds = dwell_seconds
+        self._lock = threading.Lock()
+        # set whenever the focus changes, which also cancels the table being warmed
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._target = None
+        self._paused = False
+        # (path, size, mtime_ns) -> when it was warmed, oldest first
+        self._recent = OrderedDict()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='table-prefetch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._changed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def focus(self, vpx_file_name):
+        """
+        :param vpx_file_name: The focused table, relative to the tables folder, or None for no table.
+        """
+        with self._lock:
+            if vpx_file_name == self._target:
+                return
+            self._target = vpx_file_name
+        self._changed.set()
+
+    def pause(self, paused):
+        """
+        While paused nothing is warmed, e.g. while VPX is reading the table it was launched with.
+        """
+        with self._lock:
+            self._paused = paused
+        self._changed.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._changed.wait()
+            # let the focus settle before spending any I/O on it
+            while self._changed.is_set() and not self._stop.is_set():
+                self._changed.clear()
+                self._stop.wait(self.dwell_seconds)
+            if self._stop.is_set():
+                break
+            with self._lock:
+                vpx_file_name = None if self._paused else self._target
+            if vpx_file_name is not None:
+                self._warm_table(vpx_file_name)
+
+    def _warm_table(self, vpx_file_name):
+        began = time.perf_counter()
+        # the table first, it is what VPX waits for
+        names = [vpx_file_name] + sidecars_for(self.table_root, vpx_file_name)
+        warmed = 0
+        for name in names:
+            if self._changed.is_set():
+                break
+            file_path = os.path.join(self.table_root, name)
+            try:
+                stat_result = os.stat(file_path)
+                key = (file_path, stat_result.st_size, stat_result.st_mtime_ns)
+                if time.monotonic() - self._recent.get(key, float('-inf')) < RECENT_SECONDS:
+                    continue
+                warmed += warm_file(file_path, self.budget, self._changed, self.max_table_bytes)
+            except OSError as e:
+                # a table that was removed or can't be read simply isn't prefetched
+                print(f"Could not prefetch {name}: {e}")
+                continue
+            if not self._changed.is_set():
+                self._recent[key] = time.monotonic()
+                self._recent.move_to_end(key)
+                while len(self._recent) > RECENT_FILES:
+                    self._recent.popitem(last=False)
+        if warmed:
+            perf.record('launcher.prefetch', time.perf_counter() - began, table=vpx_file_name,
+                        mb=round(warmed / (1024 * 1024), 1))
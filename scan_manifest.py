@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+
+MANIFEST_FILE_NAME = 'scan_manifest.json'
+
+
+def manifest_path_for(csv_path):
+    """
+    The scan manifest lives next to ffiend.csv.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), MANIFEST_FILE_NAME)
+
+
+class ScanManifest:
+    """
+    Remembers the size, mtime and last parsed metadata of every scanned table, keyed by vpx_file_name,
+    so a rescan only has to run vpxtool on tables that are new or have changed on disk.
+    """
+
+    VERSION = 1
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """
+        Reads the manifest from disk. A missing or unreadable manifest just means every table is rescanned.
+        """
+        self.entries = {}
+        try:
+            with open(self.manifest_path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == self.VERSION:
+                self.entries = data.get('tables', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable scan manifest {self.manifest_path}: {e}")
+        self.dirty = False
+        return self
+
+    def is_unchanged(self, vpx_file_name, stat_result):
+        """
+        :param vpx_file_name: Table file name as stored in ffiend.csv.
+        :param stat_result: os.stat() result for the table file.
+        :return: True if the table was scanned before and its size and mtime still match.
+        """
+        entry = self.entries.get(vpx_file_name)
+        return (entry is not None
+                and entry['size'] == stat_result.st_size
+                and entry['mtime_ns'] == stat_result.st_mtime_ns)
+
+    def get(self, vpx_file_name):
+        return self.entries.get(vpx_file_name)
+
+    def record(self, vpx_file_name, stat_result, table_info, wheel_image):
+        self.entries[vpx_file_name] = {
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'table_info': table_info,
+            'wheel_image': wheel_image,
+        }
+        self.dirty = True
+
+    def remove(self, vpx_file_name):
+        if self.entries.pop(vpx_file_name, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        """
+        Writes the manifest through a temp file and rename, like LibraryStore.flush().
+        """
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.manifest_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.scan_manifest-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as file:
+                json.dump({'version': self.VERSION, 'tables': self.entries}, file)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.dirty = False
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import time
+
+QUARANTINE_FILE_NAME = 'scan_quarantine.json'
+# Scans in a row a table has to fail in before later scans skip it
+DEFAULT_QUARANTINE_AFTER = 2
+
+
+def quarantine_path_for(csv_path):
+    """
+    The quarantine list lives next to ffiend.csv, like the scan manifest.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), QUARANTINE_FILE_NAME)
+
+
+class ScanQuarantine:
+    """
+    Tables that failed or timed out in several scans in a row, keyed by vpx_file_name. Scans skip a
+    quarantined table until its size or mtime changes, so one broken file doesn't cost a timeout on
+    every rescan. A table that scans fine again is taken off the list.
+    """
+
+    VERSION = 1
+
+    def __init__(self, quarantine_path, quarantine_after=DEFAULT_QUARANTINE_AFTER):
+        self.quarantine_path = quarantine_path
+        self.quarantine_after = max(1, quarantine_after)
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        """
+        Reads the list from disk. A missing or unreadable list just means nothing is skipped.
+        """
+        self.entries = {}
+        try:
+            with open(self.quarantine_path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == self.VERSION:
+                self.entries = data.get('tables', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable scan quarantine {self.quarantine_path}: {e}")
+        self.dirty = False
+        return self
+
+    def _same_file(self, entry, stat_result):
+        return entry['size'] == stat_result.st_size and entry['mtime_ns'] == stat_result.st_mtime_ns
+
+    def is_quarantined(self, vpx_file_name, stat_result):
+        """
+        :return: True if the table failed often enough to be skipped and hasn't changed since.
+        """
+        entry = self.entries.get(vpx_file_name)
+        return (entry is not None
+                and entry['failures'] >= self.quarantine_after
+                and self._same_file(entry, stat_result))
+
+    def record_failure(self, vpx_file_name, stat_result, reason):
+        """
+        Counts a scan in which every attempt at the table failed.
+
+        :param reason: 'failed' or 'timeout'.
+        :return: True if this failure put the table in quarantine.
+        """
+        entry = self.entries.get(vpx_file_name)
+        # a changed file starts counting again
+        failures = entry['failures'] if entry is not None and self._same_file(entry, stat_result) else 0
+        self.entries[vpx_file_name] = {
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'failures': failures + 1,
+            'reason': reason,
+            'failed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        self.dirty = True
+        return failures + 1 == self.quarantine_after
+
+    def remove(self, vpx_file_name):
+        if self.entries.pop(vpx_file_name, None) is not None:
+            self.dirty = True
+
+    def save(self):
+        """
+        Writes the list through a temp file and rename, like ScanManifest.save().
+        """
+        if not self.dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.quarantine_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.scan_quarantine-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as file:
+                json.dump({'version': self.VERSION, 'tables': self.entries}, file, indent=1)
+            os.replace(tmp_path, self.quarantine_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.dirty = False
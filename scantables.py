@@ -1,9 +1,27 @@
 import argparse
-import csv
+import copy
 import json
 import subprocess
 import os
-from fuzzywuzzy import process
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+import perf
+from enrichment import PupLookup
+from duplicates import DUPLICATES_FILE, find_duplicates, report_duplicates
+from library import open_library
+from metadata_cache import DEFAULT_MAX_BYTES, MetadataCache, metadata_cache_path_for
+from perf import span
+from scan_manifest import ScanManifest, manifest_path_for
+from scan_quarantine import DEFAULT_QUARANTINE_AFTER, ScanQuarantine, quarantine_path_for
+from table_discovery import discover_tables
+from thumbnail_atlas import ThumbnailAtlas, update_atlas
+from thumbnails import DEFAULT_CACHE_DIR, ensure_thumbnail, thumbnails_available
+from vpxreader import VpxReadError, read_vpx_metadata
+from wheel_index import WheelIndex
 import re
 from os import path
 import re
@@ -23,6 +41,38 @@ import re
 # Test command:
 # python scantables.py "~/Documents/VPXTables" "~/vpxpinball/wheelimg" "~/Documents/VPXTables/vpxtool" "foo" "Space\ Invaders\ \(Bally\ 1980\)\ v4.vpx"
 
+# Per-table progress messages are only printed with --verbose; errors are always printed
+VERBOSE = False
+
+# How long reading one table may take, in seconds, whether it is read in-process or by vpxtool
+DEFAULT_TABLE_TIMEOUT = 30.0
+# Further attempts at a table that failed or timed out, the first after DEFAULT_RETRY_BACKOFF
+# seconds and each one after that twice as long. A table the native reader can't parse isn't
+# tried again, the same bytes fail the same way.
+DEFAULT_RETRIES = 1
+DEFAULT_RETRY_BACKOFF = 1.0
+# Slowest tables listed after a scan
+SLOWEST_TABLES_SHOWN = 5
+
+# How scanning one table went.
+# result: (table_info, wheel_image), or None if every attempt failed.
+# seconds: time spent on the table, retries and backoff included.
+# attempts: how many times it was tried.
+# error: None, 'failed' or 'timeout' for the last attempt.
+TableOutcome = namedtuple('TableOutcome', ['result', 'seconds', 'attempts', 'error'])
+
+
+class TableTimeout(Exception):
+    """
+    Reading a table took longer than the per-table timeout. vpxtool is killed; a native read that
+    is stuck is left to finish on its own thread.
+    """
+
+
+def log(message):
+    if VERBOSE:
+        print(message)
+
 
 def parse_filename(vpx_file):
     """
@@ -55,28 +105,21 @@ def parse_filename(vpx_file):
 
 
 def find_closest_match(vpx_file, png_files):
+    """
+    Finds the wheel image that best matches the table name in vpx_file.
+
+    :param vpx_file: VPX table file name.
+    :param png_files: Either a list of wheel image paths or a WheelIndex. Scans that match more than
+                      one table should build a WheelIndex once and pass that in.
+    :return: Path of the closest matching wheel image, or None.
+    """
     vpx_year, vpx_name, _ = parse_filename(vpx_file)
     if vpx_year is None or vpx_name is None:  # Ensure vpx_name is also checked
         print(f"Year or name not found for {vpx_file}, skipping...")
         return None
 
-    best_match_score = 0
-    best_match_file = None
-    for png_file in png_files:
-        if not png_file:  # Skip empty strings
-            continue
-        # Assuming png_file is the full path, extract just the file name
-        png_name = os.path.basename(png_file).split('.')[0]  # Ensure it's treated as a string
-
-        if not png_name:  # Additional check
-            continue
-
-        score = process.extractOne(vpx_name, [png_name])[1]  # Ensure inputs are strings
-        if score > best_match_score:
-            best_match_score = score
-            best_match_file = png_file
-
-    return best_match_file
+    wheel_index = png_files if isinstance(png_files, WheelIndex) else WheelIndex(png_files)
+    return wheel_index.match_name(vpx_name)
 
 
 def parse_arguments():
@@ -86,44 +129,117 @@ def parse_arguments():
     parser.add_argument('vpxtool_app', help='Path to vpxtool application')
     parser.add_argument('vpx_command', help='Path to VPinballX_GL application')
     parser.add_argument('vpx_table', nargs='?', default=None, help='Specific VPX table file (optional)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of tables to scan in parallel (default: number of cores)')
+    parser.add_argument('--checkpoint', type=int, default=50,
+                        help='Write ffiend.csv after this many scanned tables, 0 to write only at the end (default: 50)')
+    parser.add_argument('--reader', choices=['auto', 'native', 'vpxtool'], default='auto',
+                        help='How to read table metadata: native reads the .vpx file directly, vpxtool runs '
+                             'vpxtool info, auto tries native first and falls back to vpxtool (default: auto)')
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv',
+                        help='Where the library is kept: ffiend.csv or the SQLite database ffiend.db (default: csv)')
+    parser.add_argument('--puplookup', default='puplookup.csv',
+                        help='puplookup.csv used to fill in VPS-ID, theme, type and authors (default: puplookup.csv)')
+    parser.add_argument('--thumbnail-cache', default=DEFAULT_CACHE_DIR,
+                        help='Folder for pre-scaled wheel thumbnails used by the launcher (default: thumbnails)')
+    parser.add_argument('--no-thumbnails', action='store_true',
+                        help="Don't render wheel thumbnails while scanning; the launcher renders them on first view")
+    parser.add_argument('--compact-atlas', action='store_true',
+                        help='Rewrite the thumbnail atlas without replaced and unused wheel images, even if '
+                             'there are only a few')
+    parser.add_argument('--full', action='store_true',
+                        help='Rescan every table, even ones the scan manifest says are unchanged')
+    parser.add_argument('--no-metadata-cache', action='store_true',
+                        help="Don't look up renamed or moved tables in the metadata cache; read every table")
+    parser.add_argument('--metadata-cache-mb', type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024),
+                        help=f'Size limit of the metadata cache in MB (default: {DEFAULT_MAX_BYTES // (1024 * 1024)})')
+    parser.add_argument('--full-hash', action='store_true',
+                        help='Fingerprint tables for the metadata cache by hashing the whole file instead of '
+                             'its first and last block')
+    parser.add_argument('--find-duplicates', action='store_true',
+                        help=f'After scanning, look for identical copies of tables and list them in {DUPLICATES_FILE}')
+    parser.add_argument('--table-timeout', type=float, default=DEFAULT_TABLE_TIMEOUT,
+                        help=f'Seconds reading a table may take before it is given up on, 0 for no limit '
+                             f'(default: {DEFAULT_TABLE_TIMEOUT:g})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'Further attempts at a table that failed or timed out (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--retry-backoff', type=float, default=DEFAULT_RETRY_BACKOFF,
+                        help=f'Seconds before the first retry, doubling for each one after it '
+                             f'(default: {DEFAULT_RETRY_BACKOFF:g})')
+    parser.add_argument('--quarantine-after', type=int, default=DEFAULT_QUARANTINE_AFTER,
+                        help=f'Skip a table in later scans once it has failed in this many scans in a row, '
+                             f'until the file changes (default: {DEFAULT_QUARANTINE_AFTER})')
+    parser.add_argument('--retry-quarantined', action='store_true',
+                        help='Try the tables in scan_quarantine.json again')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Print progress for every table instead of every 100 tables')
+    perf.add_arguments(parser)
     return parser.parse_args()
 
-def run_vpxtool_info(vpxtool_app, vpx_table_path, vpx_table):
+def run_vpxtool_info(vpxtool_app, vpx_table_path, vpx_table, timeout=None):
     """
     Executes the vpxtool command to get information about a specific VPX table.
 
     :param vpxtool_app: Path to the vpxtool application.
     :param vpx_table: Path to the VPX table file.
+    :param timeout: Seconds vpxtool gets before it is killed, or None to wait for it however long it takes.
     :return: The output from the vpxtool command as a string.
+    :raises TableTimeout: If vpxtool ran out of time.
     """
     # Prepare the command to be executed. It's important to use the full path to both the vpxtool application
     # and the VPX table file to avoid any path resolution issues.
-    # strip out any single quotes in vpx_table
-    vpx_table = vpx_table.replace("'", "")
-
-    # spaces and parentheses in the file name need to be escaped
-    vpx_table = vpx_table.replace(" ", "\ ")
-    vpx_table = vpx_table.replace("(", "\(")
-    vpx_table = vpx_table.replace(")", "\)")
-    # if the vpx_table has multiple . in it, 
-
+    # The command is passed as a list without a shell, so spaces, parentheses and quotes in the
+    # file name need no escaping. ~ is expanded here since there's no shell to do it.
     #the command should look like ../vpxtool info vpx_table_path/vpx_table
-    command = f"{vpxtool_app} info {path.join(vpx_table_path, vpx_table)}"
+    command = [path.expanduser(vpxtool_app), 'info', path.expanduser(path.join(vpx_table_path, vpx_table))]
     
     try:
         # Execute the command. The subprocess.run function is used here with the arguments:
         # - command: the command and its arguments as a list.
         # - capture_output: set to True to capture the command's standard output and standard error.
         # - text: set to True to get the output as a string instead of bytes.
-        result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
+        # - timeout: kill vpxtool if it hangs on a broken table, so one file can't stall the scan.
+        result = subprocess.run(command, capture_output=True, text=True, check=True, timeout=timeout or None)
         
         # If the command was successful, its output is contained in result.stdout
         return result.stdout
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         # If the command execution failed, an exception is raised.
         # Here, we're catching it to handle errors gracefully.
         print(f"Error executing vpxtool: {e}")
         return None
+    except subprocess.TimeoutExpired:
+        print(f"vpxtool took longer than {timeout:g} s on {vpx_table}, stopped it.")
+        raise TableTimeout(vpx_table)
+
+
+def read_vpx_metadata_within(vpx_file_path, timeout=None):
+    """
+    Runs read_vpx_metadata on a thread of its own and waits at most timeout seconds for it. A
+    thread can't be stopped, so a read that runs out of time carries on in the background, but the
+    scan worker that asked for it moves on to the next table.
+
+    :param timeout: Seconds the read gets, or None to wait for it however long it takes.
+    :return: Dictionary returned by vpxreader.read_vpx_metadata.
+    :raises VpxReadError: If the file can't be read as a .vpx file.
+    :raises TableTimeout: If the read ran out of time.
+    """
+    if not timeout:
+        return read_vpx_metadata(vpx_file_path)
+    future = Future()
+
+    def read():
+        try:
+            future.set_result(read_vpx_metadata(vpx_file_path))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=read, name='vpx-read', daemon=True).start()
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        print(f"Reading {vpx_file_path} took longer than {timeout:g} s, gave up on it.")
+        raise TableTimeout(vpx_file_path)
 
 
 def parse_vpxtool_output(output, args):
@@ -162,258 +278,485 @@ def parse_vpxtool_output(output, args):
 
     return table_info
 
-def read_ffiend(csv_path):
-    
-    # Reads the ffiend.csv file and returns its contents as a list of dictionaries.
-    # :param csv_path: Path to the ffiend.csv file.
-    # :return: A list of dictionaries, each representing a row in the ffiend.csv file.
-    
-    try:
-        with open(csv_path, mode='r', encoding='utf-8') as csvfile:
-            # Use DictReader to read the CSV file into a list of dictionaries.
-            # Each dictionary corresponds to a row in the CSV, with keys being the column headers.
-            reader = csv.DictReader(csvfile)
-            # Convert the reader object to a list to return all rows at once
-            rows = list(reader)
-            # Generate a unique ID by finding the max ID in existing_data and adding 1
-            if rows:  # Check if existing_data is not empty
-                max_id = max(int(row['id']) for row in rows)
-                next_id = max_id + 1
-            else:
-                next_id = 1  # Starting ID if existing_data is empty
-            return rows, next_id
-    except FileNotFoundError:
-        print(f"File not found: {csv_path}")
-        return []
-    except Exception as e:
-        print(f"Error reading {csv_path}: {e}")
-        return []
-
-
-def update_ffiend(csv_path, table_info, wheelimage_file_path, wheel_image):
-    # print that update_ffiend is starting
-    print(f"update_ffiend starting")
-    existing_data, next_id = read_ffiend(csv_path)
-    table_found = False
-    # check for a matching wheel image file in the wheel_image
-    # use the table_info['path'] with the .vpx extension removed as the base name
-    # look in the wheel_image for a file with the same base name and a png, gif, webp or jpg extension
-    # if a matching file is found, set table_info['image_file'] to the matching file name
-    # if no matching file is found, set table_info['image_file'] to an empty string
-    # use the os.path.splitext function to split the file name into the base name and the extension
-    # img_file should be the path to the wheel_image directory/filename.png
-    img_file = wheel_image
-    # unless img_file is empty, remove the leading path from the file name
-    if img_file:
-        img_file = img_file.split('/')[-1]
-    for row in existing_data:
-        if row['vpx_file_name'] == table_info['path']:
-            # print original row to the console
-            print(f"update_ffiend original row: {row}")
-            # Update existing row
-            row['image_file'] = img_file
-            row['display_name'] = f"{table_info['tablename']}"
-            row['show_in_arcade'] = '1'
-            # only update row['favorite'] if it is not equal to 1. Update it to 0 if it is not equal to 1
-            row['favorite'] = row['favorite'] if row['favorite'] == '1' else '0'
-            row['notes'] = table_info.get('releasedate', '')  # Default to empty string if not found
-            row['year'] = table_info.get('year', '')
-            row['manufacturer'] = table_info.get('manufacturer', '')
-            table_found = True
-            # print the row to the console
-            print(f"update_ffiend row: {row}")
-            break  # Stop searching once the table is found and updated
-    
-    if not table_found:
-        # Append new row
-        new_row = {
-            'id': str(next_id),
-            'vpx_file_name': table_info['path'],
-            'VPS-ID': '',
-            'image_file': '',
-            # if table_info['tablename'] is not set, use the table_info['path'] instead
-            'display_name': table_info['tablename'] if table_info['tablename'] else table_info['path'],
-            'show_in_arcade': '1',
-            'favorite': '',
-            'notes': table_info.get('releasedate', ''),
-            'year': table_info.get('year', ''),
-            'manufacturer': table_info.get('manufacturer', '')
-        }
-        existing_data.append(new_row)
-
-    # Write updates or new entry to CSV, outside the loop
-    with open(csv_path, mode='w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['id', 'vpx_file_name', 'VPS-ID', 'image_file', 'display_name', 'show_in_arcade', 'favorite', 'notes', 'year', 'manufacturer']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(existing_data)
-
-
-def scan_table(args):
+def table_info_from_metadata(metadata, args):
     """
-    Scans a single VPX table and updates or adds its information in ffiend.csv.
+    Builds the same table_info dictionary parse_vpxtool_output does, from what vpxreader read out of
+    the .vpx file. Fields the table doesn't set get "[not set]", which is what vpxtool prints for them.
 
+    :param metadata: Dictionary returned by vpxreader.read_vpx_metadata.
     :param args: Command line arguments passed to the script.
     """
-    # Extract the relevant arguments
-    vpxtool_app = args.vpxtool_app
-    vpx_table_path = args.vpx_table_path
-    vpx_table = args.vpx_table
-    csv_path = 'ffiend.csv'  # Adjust the path to your ffiend.csv file as needed
-    wheelimage_file_path = args.wheelimage_file_path
+    def text(value):
+        value = value.strip() if value else ''
+        return value if value else '[not set]'
+
+    return {
+        'vpxversion': str(metadata['vpxversion']),
+        'tablename': text(metadata['tablename']),
+        'tableversion': text(metadata['tableversion']),
+        'releasedate': text(metadata['releasedate']),
+        'table_rules': None,
+        'path': args.vpx_table if args.vpx_table else None,
+        'tablerules': text(metadata['tablerules']),
+    }
+
+
+def read_table_info(args):
+    """
+    Reads the metadata of args.vpx_table with the backend picked by args.reader.
 
+    The whole read, the native reader and the vpxtool fallback together, gets args.table_timeout seconds.
 
-    # Step 1: Run vpxtool to get information about the table
-    vpxtool_output = run_vpxtool_info(vpxtool_app, vpx_table_path, vpx_table)
+    :param args: Command line arguments passed to the script, with args.vpx_table set to the table to read.
+    :return: table_info dictionary, or None if vpxtool could not read the table.
+    :raises VpxReadError: With --reader native, if the file can't be read as a .vpx file.
+    :raises TableTimeout: If reading the table ran out of time.
+    """
+    vpx_table = args.vpx_table
+    reader = getattr(args, 'reader', 'auto')
+    timeout = getattr(args, 'table_timeout', DEFAULT_TABLE_TIMEOUT) or None
+    deadline = time.monotonic() + timeout if timeout else None
+
+    if reader in ('auto', 'native'):
+        vpx_file_path = os.path.expanduser(path.join(args.vpx_table_path, vpx_table))
+        try:
+            with span('scan.read_vpx', table=vpx_table):
+                metadata = read_vpx_metadata_within(vpx_file_path, timeout)
+            with span('scan.parse'):
+                return table_info_from_metadata(metadata, args)
+        except VpxReadError as e:
+            if reader == 'native':
+                print(f"Failed to read information for table {vpx_table}: {e}")
+                raise
+            print(f"{e}, falling back to vpxtool")
+
+    # vpxtool gets whatever is left of the table's time
+    remaining = None if deadline is None else deadline - time.monotonic()
+    if remaining is not None and remaining <= 0:
+        print(f"No time left to run vpxtool on {vpx_table}.")
+        raise TableTimeout(vpx_table)
+    with span('scan.vpxtool', table=vpx_table):
+        vpxtool_output = run_vpxtool_info(args.vpxtool_app, args.vpx_table_path, vpx_table, remaining)
     if vpxtool_output is None:
         print(f"Failed to get information for table {vpx_table} using vpxtool.")
-        return
+        return None
+    with span('scan.parse'):
+        return parse_vpxtool_output(vpxtool_output, args)
+
+
+def open_metadata_cache(args, csv_path):
+    """
+    :return: The loaded MetadataCache next to csv_path, or None with --no-metadata-cache.
+    """
+    if getattr(args, 'no_metadata_cache', False):
+        return None
+    max_bytes = int(getattr(args, 'metadata_cache_mb', DEFAULT_MAX_BYTES / (1024 * 1024)) * 1024 * 1024)
+    return MetadataCache(metadata_cache_path_for(csv_path), max_bytes,
+                         full_hash=getattr(args, 'full_hash', False)).load()
+
 
-    # Step 2: Parse the output from vpxtool
-    table_info = parse_vpxtool_output(vpxtool_output, args)
+def cached_table_info(args, metadata_cache):
+    """
+    Reads args.vpx_table's metadata, from metadata_cache if a table with the same contents was read
+    before, otherwise with read_table_info().
+
+    The cache is only looked in when args.metadata_lookup is set, which the scans do for tables the
+    scan manifest doesn't know: ones that may have been renamed or moved. A table that changed in
+    place, or any table with --full, is read again and its cache entry replaced, because the quick
+    fingerprint doesn't see an edit that keeps the size and leaves the first and last block alone.
+
+    :return: table_info dictionary, or None if the table could not be read.
+    """
+    if metadata_cache is None:
+        return read_table_info(args)
+    vpx_table = args.vpx_table
+    try:
+        with span('scan.fingerprint', table=vpx_table):
+            key = metadata_cache.fingerprint(os.path.expanduser(path.join(args.vpx_table_path, vpx_table)))
+    except OSError as e:
+        print(f"Could not fingerprint {vpx_table}: {e}")
+        return read_table_info(args)
+    if key is None:
+        return read_table_info(args)
+    table_info = metadata_cache.get(key) if getattr(args, 'metadata_lookup', False) else None
+    if table_info is not None:
+        log(f"Metadata for {vpx_table} found in the metadata cache.")
+        table_info['path'] = vpx_table
+        return table_info
+    table_info = read_table_info(args)
+    if table_info:
+        metadata_cache.put(key, table_info)
+    return table_info
+
+
+def collect_table_info(args, wheel_index=None, pup_lookup=None, metadata_cache=None):
+    """
+    Gathers everything needed to update ffiend.csv for a single VPX table without touching ffiend.csv.
+    This is the part of a scan that is safe to run in parallel.
+
+    :param args: Command line arguments passed to the script, with args.vpx_table set to the table to scan.
+    :param wheel_index: WheelIndex shared by every table in the scan. Built from
+                        args.wheelimage_file_path if not given.
+    :param pup_lookup: PupLookup shared by every table in the scan. Loaded from args.puplookup if not given.
+    :param metadata_cache: MetadataCache to look the table up in before reading it, or None to always read it.
+    :return: A (table_info, wheel_image) tuple, or None if the table could not be read.
+    """
+    # Extract the relevant arguments
+    vpx_table = args.vpx_table
+    wheelimage_file_path = args.wheelimage_file_path
+
+    # Step 1 and 2: Read the table's metadata, from the .vpx file itself or through vpxtool,
+    # unless a table with the same contents was read before under another name
+    table_info = cached_table_info(args, metadata_cache)
     if not table_info:
         print(f"Failed to parse information for table {vpx_table}.")
-        return
+        return None
 
-    # Assuming that 'vpx_table' argument corresponds to the 'vpx_file_name' in ffiend.csv
-    # Adjust the table_info dictionary keys as necessary
-    table_info['vpx_table'] = args.vpx_table  # Add the 'vpx_table' key to table_info for update_ffiend
-    wheelimage_file_path = args.wheelimage_file_path
+    # the table's script, ini and backglass, as found next to it by the folder walk
+    table_info['sidecars'] = list(getattr(args, 'sidecars', None) or [])
+
+    # tables in subfolders are named by their path; the name, wheel and puplookup entry go by the file name
+    table_file_name = path.basename(vpx_table)
 
     # call parse_filename to get the year, name, and manufacturer from the vpx_table
-    year, name, manufacturer = parse_filename(vpx_table)
+    with span('scan.parse'):
+        year, name, manufacturer = parse_filename(table_file_name)
     
     # add the year, name, and manufacturer to the table_info dictionary
     table_info['year'] = year
     table_info['name'] = name
     table_info['manufacturer'] = manufacturer
 
-    # get a list of wheel image files from the wheel_image
-    # and store the list in the variable png_files
-    png_files = subprocess.run(f"ls -1 {wheelimage_file_path}/*.png", capture_output=True, text=True, check=True, shell=True)
-    
-    # strip the leading path from each file name - /foo/bar/image.png becomes image.png
-    png_files = png_files.stdout.split('\n')
-    
-    # find the closest match from the png_files
-    wheel_image = find_closest_match(vpx_table, png_files)
+    # fill in VPS-ID, theme, type and authors from puplookup.csv
+    if pup_lookup is None:
+        pup_lookup = PupLookup.load(getattr(args, 'puplookup', 'puplookup.csv'))
+    with span('scan.enrich'):
+        pup_lookup.enrich(table_info, table_file_name)
+
+    # list the wheel images once, unless the caller already did it for the whole scan
+    if wheel_index is None:
+        wheel_index = WheelIndex.from_directory(wheelimage_file_path)
+
+    # find the closest match from the wheel images
+    with span('scan.wheel_match', table=vpx_table):
+        wheel_image = find_closest_match(table_file_name, wheel_index)
     # print the closest match to the console
-    print(f"Closest matching wheel for {table_info['vpx_table']} is: {wheel_image}")
+    log(f"Closest matching wheel for {vpx_table} is: {wheel_image}")
 
-    # Step 3: Update ffiend.csv with the obtained table information
-    # Evaluate return from update_ffiend and error check to see if the update was successful
-    # print the arguments to the console before calling update_ffiend
-    print(f"csv_path: {csv_path}")
-    print(f"table_info: {table_info}")
-    print(f"wheelimage_file_path: {wheelimage_file_path}")
-    print(f"wheel_image: {wheel_image}")
-    print(f"about to call update_ffiend")
-    update_ffiend(csv_path, table_info, wheelimage_file_path, wheel_image)
+    # render the launcher's thumbnail now, so the arcade doesn't have to decode the full-size image
+    if wheel_image and not getattr(args, 'no_thumbnails', True):
+        with span('scan.thumbnail'):
+            ensure_thumbnail(wheel_image, getattr(args, 'thumbnail_cache', DEFAULT_CACHE_DIR))
 
+    return table_info, wheel_image
 
-    
+
+def collect_with_retries(args, **collect_kwargs):
+    """
+    Runs collect_table_info for args.vpx_table, trying again with backoff when it fails or times out.
+    A table the native reader can't parse is not tried again.
+
+    :param collect_kwargs: Passed on to collect_table_info.
+    :return: A TableOutcome.
+    """
+    retries = max(0, getattr(args, 'retries', DEFAULT_RETRIES))
+    backoff = getattr(args, 'retry_backoff', DEFAULT_RETRY_BACKOFF)
+    began = time.perf_counter()
+    result = None
+    error = None
+    attempts = 0
+    while attempts <= retries:
+        if attempts:
+            time.sleep(backoff * 2 ** (attempts - 1))
+            log(f"Trying {args.vpx_table} again ({error}).")
+        attempts += 1
+        try:
+            result = collect_table_info(args, **collect_kwargs)
+        except TableTimeout:
+            result, error = None, 'timeout'
+        except VpxReadError:
+            # the same file fails the same way every time
+            result, error = None, 'failed'
+            break
+        else:
+            error = None if result is not None else 'failed'
+        if result is not None:
+            break
+    seconds = time.perf_counter() - began
+    perf.record('scan.table', seconds, table=args.vpx_table, attempts=attempts, error=error)
+    return TableOutcome(result, seconds, attempts, error)
+
+
+def print_latency_report(durations):
+    """
+    Prints the p50, p95 and maximum time per table and the slowest tables.
+
+    :param durations: List of (seconds, vpx_file_name) tuples, one per scanned table.
+    """
+    if not durations:
+        return
+    seconds = sorted(duration for duration, _ in durations)
+    print(f"Time per table: p50 {perf.percentile(seconds, 50) * 1000:.0f} ms, "
+          f"p95 {perf.percentile(seconds, 95) * 1000:.0f} ms, max {seconds[-1] * 1000:.0f} ms")
+    if len(durations) > SLOWEST_TABLES_SHOWN:
+        print("Slowest tables:")
+        for duration, vpx_table in sorted(durations, reverse=True)[:SLOWEST_TABLES_SHOWN]:
+            print(f"  {duration * 1000:>8.0f} ms  {vpx_table}")
+
+
+def update_thumbnail_atlas(args, image_files, keep=None, workers=1):
+    """
+    Packs the thumbnails of the given wheel images into the thumbnail atlas the arcade paints from,
+    then compacts the atlas if replaced or unused images take up more of it than the live ones.
+
+    :param image_files: image_file values from the library.
+    :param keep: image_files the library still uses, or None to keep every tile.
+    """
+    if getattr(args, 'no_thumbnails', True):
+        return
+    atlas = ThumbnailAtlas(getattr(args, 'thumbnail_cache', DEFAULT_CACHE_DIR)).load()
+    wheel_folder = path.expanduser(args.wheelimage_file_path)
+    wheel_images = [path.join(wheel_folder, image_file) for image_file in sorted(image_files)]
+    try:
+        with span('scan.atlas'):
+            added = update_atlas(atlas, wheel_images, workers)
+            if getattr(args, 'compact_atlas', False):
+                dropped = atlas.compact(keep)
+            else:
+                dropped = atlas.compact_if_needed(keep)
+    except OSError as e:
+        print(f"Could not update the thumbnail atlas: {e}")
+        return
+    finally:
+        atlas.close()
+    if added or dropped:
+        print(f"Thumbnail atlas: {added} wheel images added, {dropped} old tiles dropped, {len(atlas)} in total.")
 
 
+def scan_table(args):
+    """
+    Scans a single VPX table and updates or adds its information in the library.
 
-    print(f"Successfully updated information for table {vpx_table} in ffiend.csv.")
+    :param args: Command line arguments passed to the script.
+    """
+    vpx_table = args.vpx_table
+    csv_path = 'ffiend.csv'  # Adjust the path to your ffiend.csv file as needed
+    wheelimage_file_path = args.wheelimage_file_path
+
+    metadata_cache = open_metadata_cache(args, csv_path)
+    outcome = collect_with_retries(args, metadata_cache=metadata_cache)
+    if metadata_cache is not None:
+        metadata_cache.save()
+    if outcome.result is None:
+        print(f"Could not scan {vpx_table} ({outcome.error}) after {outcome.attempts} attempts.")
+        return
+    table_info, wheel_image = outcome.result
+
+    # Step 3: Update the library with the obtained table information
+    # print the arguments to the console before updating the library
+    log(f"csv_path: {csv_path}")
+    log(f"table_info: {table_info}")
+    log(f"wheelimage_file_path: {wheelimage_file_path}")
+    log(f"wheel_image: {wheel_image}")
+    with span('scan.write'):
+        store = open_library(getattr(args, 'backend', 'csv'), csv_path)
+        try:
+            row = store.apply_scan_result(table_info, wheel_image)
+            store.flush()
+        finally:
+            store.close()
+    log(f"updated row: {row}")
+    if row['image_file']:
+        update_thumbnail_atlas(args, [row['image_file']])
+
+    # keep the scan manifest in step so the next incremental rescan skips this table
+    manifest = ScanManifest(manifest_path_for(csv_path)).load()
+    try:
+        manifest.record(vpx_table, os.stat(path.join(args.vpx_table_path, vpx_table)), table_info, wheel_image)
+        manifest.save()
+        # it scans fine now, so full scans shouldn't skip it any more
+        quarantine = ScanQuarantine(quarantine_path_for(csv_path)).load()
+        quarantine.remove(vpx_table)
+        quarantine.save()
+    except OSError as e:
+        print(f"Could not update scan manifest for {vpx_table}: {e}")
+
+    print(f"Successfully updated information for table {vpx_table} in the library.")
 
 
 def scan_all_tables(args):
-    # original code
     """
     Scans all VPX tables in the specified directory and updates or adds their information in ffiend.csv.
 
+    Tables whose size and mtime match the scan manifest are skipped unless args.full is set, tables
+    that disappeared since the last scan are hidden from the arcade, and only new or modified tables
+    are run through vpxtool.
+
+    The vpxtool calls and wheel matching for up to args.workers tables run in parallel. Results are
+    applied to the library from this thread only, in the order the folder walk found them, so the
+    output is the same as a serial scan. Tables in subfolders are found too; their vpx_file_name is
+    the path relative to args.vpx_table_path. With the csv backend, ffiend.csv is written every
+    args.checkpoint tables and once at the end; with the sqlite backend every table is its own
+    transaction.
+
+    Reading a table is given up on after args.table_timeout seconds and a failed table is tried args.retries
+    more times. Tables that fail in args.quarantine_after scans in a row are put in
+    scan_quarantine.json and skipped until their file changes, unless args.retry_quarantined is set.
+
     :param args: Command line arguments passed to the script.
     """
-    """
-    # Extract the relevant arguments from args and store in vpxtool_app, vpx_table_path, and csv_path
-    vpxtool_app = args.vpxtool_app
     vpx_table_path = args.vpx_table_path
     csv_path = 'ffiend.csv'  # Adjust the path to your ffiend.csv file as needed
-
-    # Make a list of all tables in vpx_table_path (these are files that end in a .vpx extension)
-    # and store the list in the variable vpx_tables
-    # use the subprocess.run function to execute the command
-    # the command should look like ls vpx_table_path/*.vpx
-    vpx_tables = subprocess.run(f"ls -1 {vpx_table_path}/*.vpx", capture_output=True, text=True, check=True, shell=True)
-
-    # Split the output from the command into a list of table names
-    # the list of table names is stored in vpx_tables
-    vpx_tables = vpx_tables.stdout.split('\n')
-
-    # strip out the path from each table name
-    # use a list comprehension to remove the path from each table name
-    vpx_tables = [path.split('/')[-1] for path in vpx_tables]
-
-    # print the total number of vpx_tables to the console
-    print(f"Total number of tables: {len(vpx_tables)}")
-
-    # Iterate through each table in the list and call scan_table for each table
-    # use a for loop to iterate through each table in the list
-    for vpx_table in vpx_tables:
-        # call scan_table for each table
-        # the call will need to pass modified args and include each table in the list
-        # create my_args as a copy of args and substitute vpx_table for my_args.vpx_table
-        # before calling scan_table
-        my_args = args
-        my_args.vpx_table = vpx_table
-        scan_table(my_args)
-        # print the table name to the console: "Scanning table: {vpx_table}"
-        print(f"Scanning table: {vpx_table}")
-        # print a count of the number of tables scanned so far to the console:
-        # "Scanned {count} tables so far."
-        count = len(vpx_tables)
-        print(f"Scanned {count} tables so far.")
-        count -= 1
+    workers = max(1, getattr(args, 'workers', None) or 1)
+    with span('scan.library_load'):
+        store = open_library(getattr(args, 'backend', 'csv'), csv_path, checkpoint_every=getattr(args, 'checkpoint', 0))
+        manifest = ScanManifest(manifest_path_for(csv_path)).load()
+        quarantine = ScanQuarantine(quarantine_path_for(csv_path),
+                                    getattr(args, 'quarantine_after', DEFAULT_QUARANTINE_AFTER)).load()
+    # the manifest is only saved after ffiend.csv, so it never claims a table is up to date
+    # when the library write it depends on didn't happen
+    store.flush_listeners.append(manifest.save)
+
+    # list and normalize the wheel images once for the whole scan
+    with span('scan.wheel_index'):
+        wheel_index = WheelIndex.from_directory(args.wheelimage_file_path)
+    print(f"Found {len(wheel_index)} wheel images.")
+    # and index puplookup.csv once too
+    with span('scan.puplookup_load'):
+        pup_lookup = PupLookup.load(getattr(args, 'puplookup', 'puplookup.csv'))
+    print(f"Loaded {pup_lookup.row_count} puplookup.csv entries.")
+    # renamed and moved tables are looked up by their contents before being read again
+    metadata_cache = open_metadata_cache(args, csv_path)
+    print(f"Scanning with {workers} workers.")
+
+    # Tables found on disk by vpx_file_name, and the ones that need reading, in the order they were found
+    found_tables = {}
+    to_scan = []
+    unchanged = 0
+    quarantined = 0
+
+    def tables_to_scan():
         """
-    # refactored code will call scan_table for each table in the list
-    # Extract the relevant arguments from args and store in vpxtool_app, vpx_table_path, and csv_path
-    # vpxtool_app = args.vpxtool_app
-    vpx_table_path = args.vpx_table_path
-    # csv_path = 'ffiend.csv'  # Adjust the path to your ffiend.csv file as needed
-
-    # Make a list of all tables in vpx_table_path (these are files that end in a .vpx extension)
-    # and store the list in the variable vpx_tables
-    # use the subprocess.run function to execute the command
-    # the command should look like ls vpx_table_path/*.vpx
-    vpx_tables = subprocess.run(f"ls -1 {vpx_table_path}/*.vpx", capture_output=True, text=True, check=True, shell=True)
-
-    # Split the output from the command into a list of table names
-    # the list of table names is stored in vpx_tables
-    vpx_tables = vpx_tables.stdout.split('\n')
-    
-    # strip out the path from each table name
-    # use a list comprehension to remove the path from each table name
-    vpx_tables = [path.split('/')[-1] for path in vpx_tables]
-    count = len(vpx_tables)
-    # print the total number of vpx_tables to the console
-    print(f"Total number of tables: {len(vpx_tables)}")
-
-    # Iterate through each table in the list and call scan_table for each table
-    # use a for loop to iterate through each table in the list
-    for vpx_table in vpx_tables:
-        # call scan_table for each table
-        # the call will need to pass modified args and include each table in the list
-        # create my_args as a copy of args and substitute vpx_table for my_args.vpx_table
-        # before calling scan_table
-        my_args = args
-        my_args.vpx_table = vpx_table
-        scan_table(my_args)
-        # print the table name to the console: "Scanning table: {vpx_table}"
-        print(f"Scanning table: {vpx_table}")
-        # print a count of the number of tables scanned so far to the console:
-        # "Scanned {count} tables so far."
-        print(f"There are {count} more tables to go.")
-        count -= 1
+        Walks vpx_table_path and yields args for every new or modified table as soon as it's found,
+        so the workers start reading tables while the rest of the folder is still being walked.
+        """
+        nonlocal unchanged, quarantined
+        for table in discover_tables(vpx_table_path):
+            vpx_table = table.vpx_file_name
+            found_tables[vpx_table] = table
+            if not getattr(args, 'full', False) and manifest.is_unchanged(vpx_table, table.stat_result):
+                if store.get(vpx_table) is None:
+                    # ffiend.csv lost the row, but the manifest still has the parsed metadata
+                    entry = manifest.get(vpx_table)
+                    store.apply_scan_result(entry['table_info'], entry['wheel_image'])
+                unchanged += 1
+                continue
+            if not getattr(args, 'retry_quarantined', False) and quarantine.is_quarantined(vpx_table, table.stat_result):
+                quarantined += 1
+                continue
+            to_scan.append((vpx_table, table.stat_result))
+            # Each worker gets its own copy of args so they don't overwrite each other's vpx_table
+            my_args = copy.copy(args)
+            my_args.vpx_table = vpx_table
+            my_args.sidecars = table.sidecars
+            # only a table the manifest has never seen can be one that was renamed or moved
+            my_args.metadata_lookup = not getattr(args, 'full', False) and manifest.get(vpx_table) is None
+            yield my_args
+
+    # executor.map hands back results in submission order, so ffiend.csv ids are assigned
+    # in the same order a serial scan would assign them
+    # with --profile, each worker thread gets its own profiler
+    # a table that hangs the reader or vpxtool costs at most its timeout and retries, not the whole scan
+    collect = perf.profile_worker(partial(collect_with_retries, wheel_index=wheel_index, pup_lookup=pup_lookup,
+                                          metadata_cache=metadata_cache))
+    # (seconds, vpx_file_name) per scanned table, for the latency report
+    durations = []
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # map submits every table before returning, which is when the walk is done;
+            # the first tables are already being read by then
+            with span('scan.discover'):
+                results = executor.map(collect, tables_to_scan())
+            print(f"Total number of tables: {len(found_tables)}")
+
+            # Tables the manifest knows about that are no longer on disk
+            deleted_tables = set(manifest.entries) - found_tables.keys()
+            for vpx_table in sorted(deleted_tables):
+                if store.flag_missing(vpx_table):
+                    print(f"Table no longer found, hiding from arcade: {vpx_table}")
+                manifest.remove(vpx_table)
+                quarantine.remove(vpx_table)
+
+            count = len(to_scan)
+            print(f"{unchanged} tables unchanged, {len(deleted_tables)} removed, {quarantined} quarantined, "
+                  f"{count} to scan.")
+            total = count
+            for (vpx_table, stat_result), outcome in zip(to_scan, results):
+                log(f"Scanning table: {vpx_table}")
+                durations.append((outcome.seconds, vpx_table))
+                if outcome.result is not None:
+                    table_info, wheel_image = outcome.result
+                    # record before applying so a checkpoint flush saves this table's manifest entry too
+                    with span('scan.write'):
+                        manifest.record(vpx_table, stat_result, table_info, wheel_image)
+                        store.apply_scan_result(table_info, wheel_image)
+                    quarantine.remove(vpx_table)
+                else:
+                    failed.append(vpx_table)
+                    if quarantine.record_failure(vpx_table, stat_result, outcome.error):
+                        print(f"{vpx_table} failed ({outcome.error}) in {quarantine.quarantine_after} scans in a row, "
+                              f"later scans will skip it until it changes.")
+                log(f"There are {count} more tables to go.")
+                count -= 1
+                if not VERBOSE and (total - count) % 100 == 0:
+                    print(f"Scanned {total - count} of {total} tables.")
+            # wheel images of every table in the library, for the thumbnail atlas
+            image_files = {row['image_file'] for row in store.rows if row['image_file']}
+    finally:
+        # write whatever was scanned, even if the scan was interrupted
+        with span('scan.write'):
+            store.flush()
+            # covers the case where only deletions changed the manifest and nothing needed writing
+            manifest.save()
+            if metadata_cache is not None:
+                metadata_cache.save()
+            quarantine.save()
+        store.close()
+        if metadata_cache is not None and metadata_cache.hits:
+            print(f"{metadata_cache.hits} renamed or moved tables found in the metadata cache.")
+        print_latency_report(durations)
+        if failed:
+            print(f"{len(failed)} tables could not be scanned: {', '.join(failed)}")
+
+    # tiles for new and replaced wheel images; the ones no table uses any more go at the next compaction
+    update_thumbnail_atlas(args, image_files, keep=image_files, workers=workers)
+
+    # only tables that share their size with another one are read, so this is quick on most folders
+    if getattr(args, 'find_duplicates', False):
+        with span('scan.duplicates'):
+            duplicate_sets = find_duplicates(((table.vpx_file_name, table.path, table.stat_result.st_size)
+                                              for table in found_tables.values()), workers)
+        report_duplicates(duplicate_sets, path.join(path.dirname(path.abspath(csv_path)), DUPLICATES_FILE))
 
 
 def main():
+    global VERBOSE
     args = parse_arguments()
-    if args.vpx_table:
-        scan_table(args)
-        # this returns 
-    else:
-        scan_all_tables(args)
+    VERBOSE = args.verbose
+    profiler = perf.start(args)
+    if not args.no_thumbnails and not thumbnails_available():
+        print("PySide6 not found, skipping wheel thumbnails. The launcher will render them on first view.")
+        args.no_thumbnails = True
+    try:
+        with span('scan.total'):
+            if args.vpx_table:
+                scan_table(args)
+                # this returns
+            else:
+                scan_all_tables(args)
+    finally:
+        perf.finish(args, profiler)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,144 @@
+import re
+import unicodedata
+from pathlib import Path
+
+# #######################################
+# Search-as-you-type over the library.
+#
+# Each table's display name, manufacturer, year and theme are folded into one lowercase search
+# text, and every three-character run in it goes into a trigram index. A query is split into
+# words and every word has to appear somewhere in a table's text. Words of three or more
+# characters look up their trigrams and only check the few tables that have all of them. Shorter
+# words scan the search texts directly, which is still quick because `in` on a short string runs
+# in C.
+#
+# Typing usually adds to the end of the previous query, which can only shrink the results, so
+# those keystrokes just re-check the previous results instead of starting over.
+
+# Library columns that are searched
+SEARCH_FIELDS = ['display_name', 'manufacturer', 'year', 'theme']
+
+
+def fold(text):
+    """
+    Lowercases text and strips accents and punctuation, so "Mötley Crüe" is found by "motley crue".
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii').lower()
+    return re.sub(r'[^a-z0-9]+', ' ', text).strip()
+
+
+def search_text(row, fields=SEARCH_FIELDS):
+    """
+    :return: The folded text a library row is searched by.
+    """
+    values = []
+    for field in fields:
+        value = row.get(field)
+        if field == 'display_name' and (not value or value == "[not set]"):
+            # the arcade shows the file name for tables without a name, so search that too
+            value = Path(row.get('vpx_file_name', '')).stem
+        values.append(fold(value))
+    return ' '.join(value for value in values if value)
+
+
+def trigrams(text):
+    # runs of three characters within words; queries never contain spaces
+    return {text[i:i + 3] for i in range(len(text) - 2) if ' ' not in text[i:i + 3]}
+
+
+class SearchIndex:
+    """
+    Trigram index over library rows keyed by vpx_file_name. Build it once with build() and keep it
+    in step with edits through update() and remove().
+    """
+
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = fields
+        # search text by vpx_file_name
+        self.texts = {}
+        # trigram -> set of vpx_file_names whose text contains it
+        self.postings = {}
+        # the last query and its results, used to narrow the next query as the user types
+        self._last_query = None
+        self._last_keys = None
+
+    def __len__(self):
+        return len(self.texts)
+
+    def build(self, rows):
+        self.texts = {}
+        self.postings = {}
+        for row in rows:
+            self.update(row)
+        return self
+
+    def update(self, row):
+        """
+        Adds a row, or re-indexes it if its searched fields changed.
+        """
+        key = row['vpx_file_name']
+        text = search_text(row, self.fields)
+        old_text = self.texts.get(key)
+        if old_text == text:
+            return
+        if old_text is not None:
+            self.remove(key)
+        self.texts[key] = text
+        for trigram in trigrams(text):
+            self.postings.setdefault(trigram, set()).add(key)
+        self._last_query = None
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for trigram in trigrams(text):
+            keys = self.postings.get(trigram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[trigram]
+        self._last_query = None
+
+    def search(self, query):
+        """
+        :param query: What the user typed. Every word must appear in a matching table's name,
+                      manufacturer, year or theme.
+        :return: Set of matching vpx_file_names, or None when the query is empty and everything matches.
+        """
+        words = fold(query).split()
+        if not words:
+            return None
+        folded_query = ' '.join(words)
+
+        if self._last_query is not None and folded_query.startswith(self._last_query):
+            # the query only got longer: every match is among the previous results
+            candidates = self._last_keys
+        else:
+            candidates = self._candidates(words)
+        # check one word at a time, each pass only looks at what the previous one kept
+        texts = self.texts
+        for word in words:
+            candidates = [key for key in candidates if word in texts[key]]
+        keys = set(candidates)
+
+        self._last_query = folded_query
+        self._last_keys = keys
+        return keys
+
+    def _candidates(self, words):
+        # tables that have every trigram of every long word, or all tables if every word is short
+        candidates = None
+        for word in words:
+            if len(word) < 3:
+                continue
+            for trigram in trigrams(word):
+                keys = self.postings.get(trigram)
+                if not keys:
+                    return set()
+                candidates = set(keys) if candidates is None else candidates & keys
+                if not candidates:
+                    return candidates
+        return self.texts.keys() if candidates is None else candidates
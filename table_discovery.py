@@ -0,0 +1,98 @@
+import os
+from collections import namedtuple
+
+# #######################################
+# Finding tables under the VPXTables folder.
+#
+# discover_tables() walks the folder and its subfolders with os.scandir and yields each table as
+# soon as its folder has been read, so the scanner can start on the first tables while the rest
+# of the tree is still being walked. Both layouts are found: every table loose in VPXTables, and
+# one subfolder per table with its script, ini and backglass next to it.
+
+# Files that belong to a table when they sit next to it with the same name
+SIDECAR_EXTENSIONS = ('.vbs', '.ini', '.directb2s')
+
+# A table found on disk.
+# vpx_file_name: path relative to the tables folder with / separators, e.g. "Tables/Foo (Bally 1980).vpx".
+#                Tables directly in the folder are just the file name, as ffiend.csv has always had them.
+# path: full path to the .vpx file.
+# stat_result: os.stat() of the .vpx file.
+# sidecars: relative paths of the table's .vbs, .ini and .directb2s files, if any.
+DiscoveredTable = namedtuple('DiscoveredTable', ['vpx_file_name', 'path', 'stat_result', 'sidecars'])
+
+
+def _skipped(name):
+    # hidden folders (.Trash, .git) and macOS resource forks (._Foo.vpx) aren't tables
+    return name.startswith('.')
+
+
+def discover_tables(root):
+    """
+    Yields a DiscoveredTable for every .vpx file under root, folder by folder in name order.
+    Symlinked folders are not followed, so a link loop can't make the walk go on forever.
+    Subfolders that can't be read are reported and skipped. If root itself can't be read the
+    OSError is raised, so a missing tables folder isn't mistaken for every table being deleted.
+
+    :param root: The VPXTables folder. ~ is expanded.
+    """
+    root = os.path.expanduser(root)
+    # relative folder paths still to read, depth first so a table's folder is finished before the next
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        tables = []
+        sidecars = {}
+        subdirs = []
+        try:
+            with os.scandir(os.path.join(root, relative_dir)) as entries:
+                for entry in entries:
+                    if _skipped(entry.name):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    stem, extension = os.path.splitext(entry.name)
+                    extension = extension.lower()
+                    if extension == '.vpx':
+                        tables.append(entry)
+                    elif extension in SIDECAR_EXTENSIONS:
+                        sidecars.setdefault(stem.lower(), []).append(entry.name)
+        except OSError as e:
+            if not relative_dir:
+                raise
+            print(f"Could not read folder {os.path.join(root, relative_dir)}: {e}")
+            continue
+
+        prefix = relative_dir + '/' if relative_dir else ''
+        for entry in sorted(tables, key=lambda entry: entry.name):
+            try:
+                stat_result = entry.stat()
+            except OSError as e:
+                print(f"Could not read {entry.path}: {e}")
+                continue
+            stem = os.path.splitext(entry.name)[0].lower()
+            yield DiscoveredTable(prefix + entry.name, entry.path, stat_result,
+                                  [prefix + name for name in sorted(sidecars.get(stem, []))])
+
+        # popped from the end, so push in reverse to walk subfolders in name order
+        for name in sorted(subdirs, reverse=True):
+            pending.append(prefix + name)
+
+
+def sidecars_for(root, vpx_file_name):
+    """
+    :param root: The VPXTables folder.
+    :param vpx_file_name: Table path relative to root, as discover_tables() names it.
+    :return: Relative paths of the table's .vbs, .ini and .directb2s files, like DiscoveredTable.sidecars.
+    """
+    relative_dir, file_name = vpx_file_name.rpartition('/')[::2]
+    stem = os.path.splitext(file_name)[0].lower()
+    prefix = relative_dir + '/' if relative_dir else ''
+    try:
+        with os.scandir(os.path.join(os.path.expanduser(root), relative_dir)) as entries:
+            names = [entry.name for entry in entries
+                     if os.path.splitext(entry.name)[1].lower() in SIDECAR_EXTENSIONS
+                     and os.path.splitext(entry.name)[0].lower() == stem]
+    except OSError:
+        return []
+    return [prefix + name for name in sorted(names)]
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# the tests import the Flipper Fiend modules from the folder above this one, like the benchmarks do
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+# no display needed to build the view
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtWidgets = pytest.importorskip('PySide6.QtWidgets')
+from PySide6.QtCore import QPersistentModelIndex  # noqa: E402
+
+from arcade_view import ArcadeGridView, GameListModel  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_grid_builds_on_an_empty_library(app):
+    # setModel() calls currentChanged(), which needs the view's state to be set up already
+    view = ArcadeGridView(GameListModel([]), {})
+    assert view.model().rowCount() == 0
+    assert not view.hovered_index.isValid()
+    view.deleteLater()
+
+
+def test_hovered_tile_goes_invalid_on_model_reset(app):
+    model = GameListModel([{'vpx_file_name': 'a.vpx'}, {'vpx_file_name': 'b.vpx'}])
+    view = ArcadeGridView(model, {})
+    focused = []
+    view.tableFocused.connect(focused.append)
+    view.hovered_index = QPersistentModelIndex(model.index(1))
+    view.updateFocusedTable()
+    assert focused == [{'vpx_file_name': 'b.vpx'}]
+
+    model.beginResetModel()
+    model.games_data = []
+    model.endResetModel()
+    assert not view.hovered_index.isValid()
+    view.deleteLater()
@@ -0,0 +1,31 @@
+from library import merge_scan_result
+
+
+def table_info(path, tablename):
+    return {'path': path, 'tablename': tablename, 'releasedate': '2021', 'year': 2021, 'manufacturer': 'Stern'}
+
+
+def test_new_row_keeps_the_matched_wheel_image():
+    row = merge_scan_result(None, table_info('Deadpool (Stern 2018).vpx', 'Deadpool'),
+                            '/wheels/Deadpool (Stern 2018).png', 7)
+    assert row['id'] == '7'
+    assert row['vpx_file_name'] == 'Deadpool (Stern 2018).vpx'
+    # only the file name is stored, as for an updated row
+    assert row['image_file'] == 'Deadpool (Stern 2018).png'
+    assert row['year'] == '2021'
+
+
+def test_new_row_without_a_wheel_image():
+    row = merge_scan_result(None, table_info('Unknown.vpx', ''), None, 1)
+    assert row['image_file'] == ''
+    assert row['display_name'] == 'Unknown.vpx'
+
+
+def test_updated_row_takes_the_new_wheel_image():
+    row = merge_scan_result(None, table_info('Deadpool (Stern 2018).vpx', 'Deadpool'), None, 1)
+    row['favorite'] = '1'
+    updated = merge_scan_result(row, table_info('Deadpool (Stern 2018).vpx', 'Deadpool'),
+                                '/wheels/Deadpool.png', 2)
+    assert updated['image_file'] == 'Deadpool.png'
+    assert updated['favorite'] == '1'
+    assert updated['id'] == row['id']
@@ -0,0 +1,361 @@
+import json
+import mmap
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from thumbnails import DEFAULT_CACHE_DIR, THUMBNAIL_SIZE, ensure_thumbnail
+
+# #######################################
+# Every wheel thumbnail in one memory-mapped file of pre-decoded pixels.
+#
+# Even with the thumbnail cache, filling the arcade grid means opening and decoding a PNG for every
+# tile. The atlas keeps the thumbnails as raw RGBA tiles (QImage.Format_RGBA8888_Premultiplied,
+# THUMBNAIL_SIZE x THUMBNAIL_SIZE, 4 bytes per pixel) one after another in a single data file, with
+# an index of where each tile starts, keyed by the library's image_file. The arcade maps the data
+# file once and turns a tile into a pixmap straight from the mapped bytes: no file is opened and
+# nothing is decoded while painting. The pages come from the OS page cache, so they are shared with
+# the scanner and cost the arcade no memory of its own.
+#
+# scantables.py and the library watcher append tiles for new and replaced wheel images. A replaced
+# image leaves its old tile behind as dead space; compact() copies the live tiles to a new data
+# file once there is more dead space than live tiles. Tiles are about 160 KB each, so the atlas for
+# a 2,000 table library is around 300 MB on disk.
+#
+# The index is written after the tiles it points to, through a temp file and rename. A compacted
+# atlas gets a new data file name, so an arcade still mapping the old file keeps reading valid
+# tiles until it picks up the new index.
+
+ATLAS_INDEX_NAME = 'atlas.json'
+ATLAS_FORMAT = 'RGBA8888_Premultiplied'
+# Dead tiles to put up with before compact_if_needed() rewrites the data file
+MIN_DEAD_TILES = 16
+
+
+def atlas_index_path(cache_dir=DEFAULT_CACHE_DIR):
+    """
+    The atlas lives in the thumbnail cache folder, next to the thumbnails it is built from.
+    """
+    return os.path.join(cache_dir, ATLAS_INDEX_NAME)
+
+
+def _source_path(wheel_image):
+    return os.path.abspath(os.path.expanduser(str(wheel_image)))
+
+
+class ThumbnailAtlas:
+    """
+    Index and data file of the thumbnail atlas. The scanner adds tiles with append() and save();
+    the arcade reads them with tile(), after open() has mapped the data file. Writers and readers
+    each use their own ThumbnailAtlas.
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, tile_size=THUMBNAIL_SIZE):
+        self.cache_dir = cache_dir
+        self.index_path = atlas_index_path(cache_dir)
+        self.tile_size = tile_size
+        self.tile_bytes = tile_size * tile_size * 4
+        # image_file -> [offset, source path, source size, source mtime_ns]
+        self.entries = {}
+        # bumped by compact(), which writes a new data file
+        self.generation = 1
+        self.dirty = False
+        self._index_signature = None
+        self._data_file = None
+        self._map = None
+        # set by open(): this is a reader that keeps the data file mapped
+        self._reading = False
+
+    @property
+    def data_path(self):
+        return os.path.join(self.cache_dir, f'atlas-{self.generation}.rgba')
+
+    def load(self):
+        """
+        Reads the index. A missing or unreadable index, or one for another tile size, is an empty atlas.
+        """
+        self.entries = {}
+        self.generation = 1
+        try:
+            self._index_signature = self._signature()
+            with open(self.index_path, mode='r', encoding='utf-8') as file:
+                data = json.load(file)
+            if (data.get('version') == self.VERSION and data.get('tile_size') == self.tile_size
+                    and data.get('format') == ATLAS_FORMAT):
+                self.generation = data['generation']
+                self.entries = data['tiles']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, AttributeError) as e:
+            print(f"Ignoring unreadable thumbnail atlas {self.index_path}: {e}")
+        self.dirty = False
+        return self
+
+    def _signature(self):
+        try:
+            stat_result = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat_result.st_size, stat_result.st_mtime_ns
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_current(self, image_file, wheel_image, stat_result):
+        """
+        :return: True if the atlas holds a tile for image_file rendered from this version of wheel_image.
+        """
+        entry = self.entries.get(image_file)
+        return (entry is not None and entry[1] == _source_path(wheel_image)
+                and entry[2] == stat_result.st_size and entry[3] == stat_result.st_mtime_ns)
+
+    # Writing
+
+    def append(self, image_file, wheel_image, stat_result, pixels):
+        """
+        Adds a tile at the end of the data file. A tile image_file already had becomes dead space.
+
+        :param pixels: tile_bytes bytes of RGBA8888_Premultiplied pixels.
+        """
+        if len(pixels) != self.tile_bytes:
+            raise ValueError(f"Tile for {image_file} is {len(pixels)} bytes, expected {self.tile_bytes}")
+        if self._data_file is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._data_file = open(self.data_path, mode='ab')
+        # the end of the file rather than a count of our own tiles, in case another scan appended too
+        offset = self._data_file.seek(0, os.SEEK_END)
+        self._data_file.write(pixels)
+        self.entries[image_file] = [offset, _source_path(wheel_image), stat_result.st_size, stat_result.st_mtime_ns]
+        self.dirty = True
+
+    def save(self):
+        """
+        Writes the index through a temp file and rename, once the tiles it points to are in the data file.
+        """
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+        if not self.dirty:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.atlas-', suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, mode='w', encoding='utf-8') as file:
+                json.dump({'version': self.VERSION, 'tile_size': self.tile_size, 'format': ATLAS_FORMAT,
+                           'generation': self.generation, 'tiles': self.entries}, file)
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.dirty = False
+        self._index_signature = self._signature()
+
+    def dead_tiles(self):
+        """
+        :return: Number of tiles in the data file that no entry points to any more.
+        """
+        try:
+            data_size = os.path.getsize(self.data_path)
+        except OSError:
+            return 0
+        return max(0, data_size // self.tile_bytes - len(self.entries))
+
+    def compact(self, keep=None):
+        """
+        Copies the live tiles to a new data file and points the index at it.
+
+        :param keep: Set of image_files to keep, e.g. the ones the library still uses. None keeps them all.
+        :return: Number of tiles dropped.
+        """
+        self.save()
+        old_path = self.data_path
+        live = sorted((entry[0], image_file) for image_file, entry in self.entries.items()
+                      if keep is None or image_file in keep)
+        dropped = self.dead_tiles() + len(self.entries) - len(live)
+        self.generation += 1
+        entries = {}
+        if not os.path.exists(old_path):
+            # nothing to copy the tiles from, so the entries point nowhere
+            live = []
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.atlas-', suffix='.tmp', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, mode='wb') as target:
+                source = open(old_path, mode='rb') if live else None
+                for offset, image_file in live:
+                    source.seek(offset)
+                    pixels = source.read(self.tile_bytes)
+                    if len(pixels) != self.tile_bytes:
+                        # cut short by an interrupted append
+                        continue
+                    entries[image_file] = [target.tell()] + self.entries[image_file][1:]
+                    target.write(pixels)
+                if source is not None:
+                    source.close()
+            os.replace(tmp_path, self.data_path)
+        except BaseException:
+            self.generation -= 1
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.entries = entries
+        self.dirty = True
+        self.save()
+        # an arcade may still have the old file mapped; where that stops it being deleted, the next
+        # compact() tries again
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('atlas-') and name.endswith('.rgba') and name != os.path.basename(self.data_path):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+        return dropped
+
+    def compact_if_needed(self, keep=None):
+        """
+        Compacts once the dead tiles outnumber the live ones, or when keep leaves tiles unused.
+
+        :return: Number of tiles dropped.
+        """
+        unused = 0 if keep is None else sum(1 for image_file in self.entries if image_file not in keep)
+        dead = self.dead_tiles() + unused
+        if dead < MIN_DEAD_TILES or dead < len(self.entries) - unused:
+            return 0
+        return self.compact(keep)
+
+    # Reading
+
+    def open(self):
+        """
+        Loads the index and maps the data file read-only.
+        """
+        self.load()
+        self._reading = True
+        self._remap()
+        return self
+
+    def _remap(self):
+        self._close_map()
+        try:
+            with open(self.data_path, mode='rb') as file:
+                if os.fstat(file.fileno()).st_size > 0:
+                    # the mapping stays valid after the file is closed
+                    self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Could not map the thumbnail atlas {self.data_path}: {e}")
+
+    def refresh(self):
+        """
+        Picks up tiles another scanner added, or a compaction it did, since the index was loaded.
+        Costs one stat() when nothing changed.
+
+        :return: True if the index changed.
+        """
+        if self._signature() == self._index_signature or self.dirty:
+            return False
+        self.load()
+        if self._reading:
+            self._remap()
+        return True
+
+    def tile(self, image_file, wheel_image=None):
+        """
+        :param wheel_image: Full path of the wheel image the tile should be of. A tile rendered from
+                            an image of the same name in another folder is not returned.
+        :return: The tile's pixels as bytes, or None if the atlas doesn't have it.
+        """
+        entry = self.entries.get(image_file)
+        if entry is None or (wheel_image is not None and entry[1] != _source_path(wheel_image)):
+            return None
+        offset = entry[0]
+        if self._map is None or offset + self.tile_bytes > len(self._map):
+            # appended after the file was mapped
+            self._remap()
+            if self._map is None or offset + self.tile_bytes > len(self._map):
+                return None
+        return self._map[offset:offset + self.tile_bytes]
+
+    def will_need(self, image_file, wheel_image=None):
+        """
+        Asks the OS to page in image_file's tile ahead of it being painted, without reading it here.
+
+        :return: True if the atlas has the tile.
+        """
+        entry = self.entries.get(image_file)
+        if entry is None or (wheel_image is not None and entry[1] != _source_path(wheel_image)):
+            return False
+        offset = entry[0]
+        if self._map is None or offset + self.tile_bytes > len(self._map):
+            return self.tile(image_file, wheel_image) is not None
+        if hasattr(self._map, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+            # madvise wants the start of a page
+            start = offset - offset % mmap.PAGESIZE
+            self._map.madvise(mmap.MADV_WILLNEED, start, offset + self.tile_bytes - start)
+        return True
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self):
+        self._close_map()
+        if self._data_file is not None:
+            self._data_file.close()
+            self._data_file = None
+
+
+def render_tile(wheel_image, cache_dir=DEFAULT_CACHE_DIR, size=THUMBNAIL_SIZE):
+    """
+    Decodes the cached thumbnail for wheel_image, rendering it first if needed, into tile pixels.
+    Needs PySide6; safe to call from worker threads.
+
+    :return: bytes of RGBA8888_Premultiplied pixels, or None if the image can't be read.
+    """
+    from PySide6.QtGui import QImage
+
+    cached_path = ensure_thumbnail(wheel_image, cache_dir, size)
+    if cached_path is None:
+        return None
+    image = QImage(cached_path)
+    if image.isNull() or image.width() != size or image.height() != size:
+        return None
+    image = image.convertToFormat(QImage.Format_RGBA8888_Premultiplied)
+    return bytes(image.constBits())[:size * size * 4]
+
+
+def update_atlas(atlas, wheel_images, workers=1):
+    """
+    Appends tiles for every wheel image the atlas doesn't have yet or has an older version of,
+    and saves the index.
+
+    :param wheel_images: Paths of wheel images; the file name is the image_file the tile is kept under.
+    :param workers: Number of thumbnails decoded at a time.
+    :return: Number of tiles added.
+    """
+    # a scantables.py run may have added tiles or compacted the atlas since it was loaded
+    atlas.refresh()
+    to_render = []
+    for wheel_image in wheel_images:
+        try:
+            stat_result = os.stat(os.path.expanduser(str(wheel_image)))
+        except OSError:
+            continue
+        image_file = os.path.basename(str(wheel_image))
+        if not atlas.is_current(image_file, wheel_image, stat_result):
+            to_render.append((image_file, wheel_image, stat_result))
+
+    added = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        rendered = executor.map(lambda item: render_tile(item[1], atlas.cache_dir, atlas.tile_size), to_render)
+        # appended from this thread only, so the data file is written in one place
+        for (image_file, wheel_image, stat_result), pixels in zip(to_render, rendered):
+            if pixels is not None:
+                atlas.append(image_file, wheel_image, stat_result, pixels)
+                added += 1
+    atlas.save()
+    return added
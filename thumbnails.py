@@ -0,0 +1,80 @@
+import hashlib
+import importlib.util
+import os
+import tempfile
+
+# #######################################
+# On-disk cache of wheel images pre-scaled to tile size.
+#
+# Wheel images are often 1024px or larger, and decoding them is most of the launcher's startup
+# time. The cache holds a THUMBNAIL_SIZE x THUMBNAIL_SIZE PNG per wheel image, named after a hash
+# of the source path, its size and mtime and the thumbnail size. Replacing a wheel image changes
+# its mtime, so a stale thumbnail is never used.
+#
+# Thumbnails are written by scantables.py while scanning and by the arcade view the first time
+# a tile is shown without one.
+
+THUMBNAIL_SIZE = 200
+DEFAULT_CACHE_DIR = 'thumbnails'
+
+
+def thumbnails_available():
+    """
+    Rendering thumbnails needs PySide6. The scanner checks this once and skips thumbnails without it.
+    """
+    return importlib.util.find_spec('PySide6') is not None
+
+
+def thumbnail_path(source_path, cache_dir=DEFAULT_CACHE_DIR, size=THUMBNAIL_SIZE):
+    """
+    :param source_path: Path to the full-size wheel image.
+    :return: Where the thumbnail for source_path belongs in cache_dir, or None if source_path doesn't exist.
+    """
+    source_path = os.path.abspath(os.path.expanduser(str(source_path)))
+    try:
+        stat_result = os.stat(source_path)
+    except OSError:
+        return None
+    key = f"{source_path}|{stat_result.st_size}|{stat_result.st_mtime_ns}|{size}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.png')
+
+
+def ensure_thumbnail(source_path, cache_dir=DEFAULT_CACHE_DIR, size=THUMBNAIL_SIZE):
+    """
+    Returns the cached thumbnail for source_path, rendering it first if needed.
+
+    QImage is used rather than QPixmap so this works from scanner worker threads and without a
+    running QApplication.
+
+    :return: Path to the thumbnail, or None if source_path is missing or can't be decoded.
+    """
+    cached_path = thumbnail_path(source_path, cache_dir, size)
+    if cached_path is None:
+        return None
+    if os.path.exists(cached_path):
+        return cached_path
+
+    from PySide6.QtCore import Qt
+    from PySide6.QtGui import QImage
+
+    image = QImage(os.path.expanduser(str(source_path)))
+    if image.isNull():
+        return None
+    # same stretch-to-square the arcade tiles have always used, but smoothed since it only happens once
+    image = image.scaled(size, size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temp file and rename, so a half-written thumbnail is never picked up
+    fd, tmp_path = tempfile.mkstemp(prefix='.thumb-', suffix='.png', dir=cache_dir)
+    os.close(fd)
+    try:
+        if not image.save(tmp_path, 'PNG'):
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, cached_path)
+    except OSError as e:
+        print(f"Could not write thumbnail for {source_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return cached_path
@@ -0,0 +1,224 @@
+import mmap
+import struct
+
+# #######################################
+# Reads table metadata straight out of a .vpx file, without running vpxtool.
+#
+# A .vpx file is an OLE compound document (the same container format old .doc files use).
+# The bits we care about live in these streams:
+#   GameStg/Version         4 byte little endian VPX version, e.g. 1080
+#   TableInfo/TableName     UTF-16LE strings, no length prefix or terminator
+#   TableInfo/TableVersion
+#   TableInfo/ReleaseDate
+#   TableInfo/TableRules
+#
+# Only the sectors holding those streams are touched, so reading a 500 MB table costs a few
+# small reads from a memory map rather than a process launch.
+
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+MAXREGSECT = 0xFFFFFFFA
+NOSTREAM = 0xFFFFFFFF
+
+STORAGE = 1
+STREAM = 2
+ROOT = 5
+
+TABLE_INFO_STREAMS = {
+    'tablename': 'TableName',
+    'tableversion': 'TableVersion',
+    'releasedate': 'ReleaseDate',
+    'tablerules': 'TableRules',
+}
+
+
+class VpxReadError(Exception):
+    """
+    Raised when a file isn't a compound document we can read. Callers fall back to vpxtool.
+    """
+
+
+class CompoundFile:
+    """
+    Minimal read-only reader for OLE compound documents. Supports what .vpx files use: 512 or 4096
+    byte sectors, extra DIFAT sectors for large files, and the mini stream for small streams.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            self._file.close()
+            raise VpxReadError(f"{file_path} is empty")
+        try:
+            self._read_header()
+            self._read_directory()
+        except (struct.error, IndexError) as e:
+            self.close()
+            raise VpxReadError(f"{file_path} is truncated or corrupt: {e}")
+        except VpxReadError:
+            self.close()
+            raise
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _read_header(self):
+        mm = self._mm
+        if mm[:8] != CFB_SIGNATURE:
+            raise VpxReadError(f"{self.file_path} is not a compound document")
+        sector_shift, mini_sector_shift = struct.unpack_from('<HH', mm, 0x1E)
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_sector_shift
+        (num_fat_sectors, self.first_dir_sector, _, self.mini_stream_cutoff,
+         self.first_mini_fat_sector, _, first_difat_sector, num_difat_sectors) = struct.unpack_from('<8I', mm, 0x2C)
+
+        # the first 109 FAT sector numbers are in the header, the rest in a chain of DIFAT sectors
+        fat_sectors = list(struct.unpack_from('<109I', mm, 0x4C))
+        per_sector = self.sector_size // 4
+        sector = first_difat_sector
+        for _ in range(num_difat_sectors):
+            if sector > MAXREGSECT:
+                break
+            entries = struct.unpack_from(f'<{per_sector}I', mm, self._offset(sector))
+            fat_sectors.extend(entries[:-1])
+            sector = entries[-1]
+        self.fat_sectors = [s for s in fat_sectors[:num_fat_sectors] if s <= MAXREGSECT]
+
+    def _offset(self, sector):
+        # sector 0 starts right after the header, which takes up one sector
+        return (sector + 1) * self.sector_size
+
+    def _next_sector(self, sector):
+        # Look up a single FAT entry instead of loading the whole FAT, which is megabytes on big tables
+        per_sector = self.sector_size // 4
+        fat_sector = self.fat_sectors[sector // per_sector]
+        return struct.unpack_from('<I', self._mm, self._offset(fat_sector) + (sector % per_sector) * 4)[0]
+
+    def _chain(self, start):
+        sectors = []
+        sector = start
+        limit = len(self._mm) // self.sector_size + 1
+        while sector <= MAXREGSECT:
+            sectors.append(sector)
+            if len(sectors) > limit:
+                raise VpxReadError(f"{self.file_path} has a looping sector chain")
+            sector = self._next_sector(sector)
+        return sectors
+
+    def _read_chain(self, start, size=None):
+        size_per = self.sector_size
+        data = b''.join(self._mm[self._offset(s):self._offset(s) + size_per] for s in self._chain(start))
+        return data if size is None else data[:size]
+
+    def _read_directory(self):
+        data = self._read_chain(self.first_dir_sector)
+        self.entries = []
+        for offset in range(0, len(data) - 127, 128):
+            name_length, object_type = struct.unpack_from('<HB', data, offset + 0x40)
+            name = data[offset:offset + max(0, name_length - 2)].decode('utf-16-le', errors='replace')
+            left, right, child = struct.unpack_from('<3I', data, offset + 0x44)
+            start, size = struct.unpack_from('<IQ', data, offset + 0x74)
+            if self.sector_size == 512:
+                # version 3 files only use the low 32 bits of the size
+                size &= 0xFFFFFFFF
+            self.entries.append((name, object_type, left, right, child, start, size))
+        if not self.entries or self.entries[0][1] != ROOT:
+            raise VpxReadError(f"{self.file_path} has no root directory entry")
+
+        # Walk the red-black trees of siblings to build full paths like 'TableInfo/TableName'
+        self.paths = {}
+        stack = [(self.entries[0][4], '')]
+        seen = set()
+        while stack:
+            entry_id, prefix = stack.pop()
+            if entry_id == NOSTREAM or entry_id >= len(self.entries) or entry_id in seen:
+                continue
+            seen.add(entry_id)
+            name, object_type, left, right, child, _, _ = self.entries[entry_id]
+            full_name = prefix + name
+            # compound document names are case insensitive
+            self.paths[full_name.lower()] = entry_id
+            stack.append((left, prefix))
+            stack.append((right, prefix))
+            if object_type == STORAGE:
+                stack.append((child, full_name + '/'))
+
+        self._mini_stream = None
+        self._mini_fat_sectors = None
+
+    def _mini_stream_data(self):
+        if self._mini_stream is None:
+            root = self.entries[0]
+            self._mini_stream = self._read_chain(root[5], root[6]) if root[5] <= MAXREGSECT else b''
+        return self._mini_stream
+
+    def _next_mini_sector(self, sector):
+        per_sector = self.sector_size // 4
+        if self._mini_fat_sectors is None:
+            self._mini_fat_sectors = self._chain(self.first_mini_fat_sector)
+        fat_sector = self._mini_fat_sectors[sector // per_sector]
+        return struct.unpack_from('<I', self._mm, self._offset(fat_sector) + (sector % per_sector) * 4)[0]
+
+    def read_stream(self, stream_path):
+        """
+        :param stream_path: Path of the stream, e.g. 'TableInfo/TableName'.
+        :return: The stream contents as bytes, or None if the stream doesn't exist.
+        """
+        entry_id = self.paths.get(stream_path.lower())
+        if entry_id is None:
+            return None
+        _, object_type, _, _, _, start, size = self.entries[entry_id]
+        if object_type != STREAM:
+            return None
+        if size == 0:
+            return b''
+        if size >= self.mini_stream_cutoff:
+            return self._read_chain(start, size)
+
+        # small streams are stored in 64 byte pieces inside the root entry's mini stream
+        mini_stream = self._mini_stream_data()
+        chunks = []
+        sector = start
+        remaining = size
+        while sector <= MAXREGSECT and remaining > 0:
+            offset = sector * self.mini_sector_size
+            chunks.append(mini_stream[offset:offset + self.mini_sector_size])
+            remaining -= self.mini_sector_size
+            sector = self._next_mini_sector(sector)
+        return b''.join(chunks)[:size]
+
+
+def read_vpx_metadata(vpx_file_path):
+    """
+    Reads the VPX version and table info strings from a .vpx file.
+
+    :param vpx_file_path: Full path to the .vpx file.
+    :return: Dictionary with vpxversion (int or None) and tablename, tableversion, releasedate,
+             tablerules (str or None when the table doesn't set them).
+    :raises VpxReadError: If the file can't be read as a .vpx file.
+    """
+    try:
+        with CompoundFile(vpx_file_path) as cfb:
+            metadata = {}
+            version = cfb.read_stream('GameStg/Version')
+            if version is None or len(version) < 4:
+                raise VpxReadError(f"{vpx_file_path} has no GameStg/Version stream")
+            metadata['vpxversion'] = struct.unpack('<i', version[:4])[0]
+            for key, stream_name in TABLE_INFO_STREAMS.items():
+                value = cfb.read_stream(f'TableInfo/{stream_name}')
+                metadata[key] = value.decode('utf-16-le', errors='replace').rstrip('\x00') if value else None
+            return metadata
+    except OSError as e:
+        raise VpxReadError(f"Could not open {vpx_file_path}: {e}")
+    except (struct.error, IndexError) as e:
+        raise VpxReadError(f"{vpx_file_path} is truncated or corrupt: {e}")
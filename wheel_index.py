@@ -0,0 +1,91 @@
+import os
+import threading
+from fuzzywuzzy import fuzz, process, utils
+
+
+class WheelIndex:
+    """
+    Wheel images for one scan, listed and normalized once.
+
+    Matching a table name first tries the exact wheel name and then the normalized name
+    (lowercase, punctuation folded to spaces, which is what fuzzywuzzy compares anyway). Only when
+    neither hits does it fall back to a single fuzzywuzzy extractOne over every normalized name,
+    instead of one extractOne call per wheel image. Results are memoized per table name.
+    """
+
+    def __init__(self, png_files):
+        """
+        :param png_files: Paths to wheel images. Empty entries are ignored.
+        """
+        # wheel name exactly as it appears in the file name -> first file with that name
+        self.files_by_name = {}
+        # normalized wheel name -> first file with that normalized name
+        self.files_by_key = {}
+        for png_file in png_files:
+            if not png_file:  # Skip empty strings
+                continue
+            # use just the file name, up to the first dot, like find_closest_match always has
+            png_name = os.path.basename(png_file).split('.')[0]
+            if not png_name:
+                continue
+            self.files_by_name.setdefault(png_name, png_file)
+            key = utils.full_process(png_name)
+            if key:
+                self.files_by_key.setdefault(key, png_file)
+        self.keys = list(self.files_by_key)
+        self._matches = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_directory(cls, wheelimage_file_path):
+        """
+        Builds an index of the .png wheel images in wheelimage_file_path with a single directory listing.
+        """
+        try:
+            with os.scandir(os.path.expanduser(wheelimage_file_path)) as entries:
+                png_files = sorted(os.path.join(wheelimage_file_path, entry.name) for entry in entries
+                                   if entry.name.lower().endswith('.png') and entry.is_file())
+        except OSError as e:
+            print(f"Could not list wheel images in {wheelimage_file_path}: {e}")
+            png_files = []
+        return cls(png_files)
+
+    def __len__(self):
+        return len(self.files_by_name)
+
+    def exact_match(self, vpx_name):
+        """
+        :return: The wheel image named like the table, exactly or once case and punctuation are
+                 folded away, or None. Never falls back to fuzzy matching.
+        """
+        # fast path 1: a wheel named exactly like the table
+        png_file = self.files_by_name.get(vpx_name)
+        if png_file is not None:
+            return png_file
+        # fast path 2: same name once case and punctuation are folded away
+        return self.files_by_key.get(utils.full_process(vpx_name))
+
+    def match_name(self, vpx_name):
+        """
+        :param vpx_name: Table name as extracted by scantables.parse_filename.
+        :return: Path of the best matching wheel image, or None if there are no usable wheel images.
+        """
+        png_file = self.exact_match(vpx_name)
+        if png_file is not None:
+            return png_file
+        key = utils.full_process(vpx_name)
+
+        with self._lock:
+            if key in self._matches:
+                return self._matches[key]
+
+        png_file = None
+        if key and self.keys:
+            # the keys are already normalized, so skip fuzzywuzzy's per-choice preprocessing
+            best = process.extractOne(key, self.keys, processor=None, scorer=fuzz.WRatio)
+            if best is not None and best[1] > 0:
+                png_file = self.files_by_key[best[0]]
+
+        with self._lock:
+            self._matches[key] = png_file
+        return png_file